@@ -0,0 +1,443 @@
+#!/usr/bin/python
+
+"""
+bench.py: Timings for the hot spots of the dom.py engine.
+
+usage: python bench.py [-g GAMES] [--only NAME ...] [--json FILE]
+                       [--compare FILE [--tolerance PERCENT]] [--deque]
+
+Five kinds of benchmark:
+
+games.LAYOUT    Bot against bot games per second on every layout in
+                layouts.txt, played one after another in this process
+                (no worker pool), so it measures the engine rather than
+                the machine's core count.
+
+micro           Microseconds per call of Deck.deal, Deck.shuffle,
+                Deck.getCoin, Deck.contains, Player.drawCards,
+                Game.clone and a CardSupply setup.
+
+mcts.playouts   Playouts per second of the MCTS bot's search.
+
+vector.games    Games per second of vectorsim.py, big money against
+                smithy big money on the beginners layout (only with
+                numpy).
+
+env.steps       Steps per second of env.py's environment, and of its
+                vectorized variant (env.vector.steps) over 1024 games,
+                with the agent making random legal choices (only with
+                numpy).
+
+Every run prints a table.  --json writes the results as well, with the
+commit and Python they were measured on, and --compare reads such a
+file back and shows how each benchmark has moved since.  A benchmark
+more than --tolerance percent worse counts as a regression, and bench.py
+exits with status 1 if there are any, so it can sit in a script that
+guards every commit.
+
+--deque shows the old list based deck against the deque in dom.Deck.
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+
+import dom
+import env
+import mcts
+import simulate
+import vectorsim
+
+
+# number of times each benchmark is repeated, the best run is reported
+REPEAT = 5
+
+# the bots that play the games benchmarks, greedy plays every kind of
+# kingdom card it can afford, so every layout gets a real workout
+GAME_STRATEGIES = ["greedy", "bmu-smithy"]
+
+# and the vector engine, which only plays money bots
+VECTOR_STRATEGIES = ["bigmoney", "bmu-smithy"]
+
+# a regression is a benchmark this many percent worse than before
+TOLERANCE = 20.0
+
+
+class ListDeck:
+    # The deck as it used to be, a list with the top card at index 0.
+    # Kept here only to show what the deque in dom.Deck buys us.
+    def __init__( self ):
+        self.cards = []
+
+    def add( self, card ):
+        self.cards.append( card )
+
+    def deal( self ):
+        return self.cards.pop( 0 )
+
+    def push( self, card ):
+        self.cards.insert( 0, card )
+
+
+class Result:
+    # One benchmark's measurement.  higherIsBetter says which way is an
+    # improvement.
+    def __init__( self, name, value, unit, higherIsBetter = False ):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.higherIsBetter = higherIsBetter
+
+    def toJson( self ):
+
+        return {"value": self.value,
+                "unit": self.unit,
+                "higher is better": self.higherIsBetter}
+
+    # percent this result is better (positive) or worse (negative)
+    # than oldValue
+    def change( self, oldValue ):
+        if not oldValue:
+            return 0.0
+
+        change = 100.0 * ( self.value - oldValue ) / oldValue
+        if not self.higherIsBetter:
+            change = -change
+
+        return change
+
+
+# best time per call of func() in microseconds
+def bestTime( func, number ):
+    times = timeit.repeat( func, repeat = REPEAT, number = number )
+
+    return min( times ) * 1e6 / number
+
+
+# Deal every card off the top of a deck of size cards and push them all
+# back on again, the pattern Player.drawCards, the library and the spy
+# hammer on.
+def dealAndPush( deckClass, size ):
+    deck = deckClass()
+    card = dom.CardFactory().create( "copper" )
+    for i in range( size ):
+        deck.add( card )
+
+    def cycle():
+        cards = [ deck.deal() for i in xrange( size ) ]
+        for card in cards:
+            deck.push( card )
+
+    return cycle
+
+
+def deckBenchmarks():
+    print "deal + push every card, microseconds per card"
+    print "%8s %10s %10s" % ("cards", "list", "Deck")
+
+    for size in [ 10, 60, 250, 1000, 5000 ]:
+        number = max( 1, 20000 / size )
+        listTime = bestTime( dealAndPush( ListDeck, size ), number )
+        deckTime = bestTime( dealAndPush( dom.Deck, size ), number )
+        print "%8d %10.3f %10.3f" % (size, listTime / size, deckTime / size)
+
+
+# A mid game deck: the starting cards plus a few buys
+def midGameDeck( cardFactory ):
+    deck = dom.Deck()
+    for (cardName, n) in [ ("copper", 7), ("estate", 3), ("silver", 4),
+                           ("gold", 2), ("smithy", 1), ("village", 2),
+                           ("province", 1) ]:
+        for i in range( n ):
+            deck.add( cardFactory.create( cardName ))
+
+    return deck
+
+
+# a started two player game on the beginners layout, nobody listening
+def newGame( cardFactory ):
+    ( layoutNames, deckLayouts ) = dom.loadLayouts()
+    players = [ dom.Player( "1" ), dom.Player( "2" ) ]
+    game = dom.Game( players, deckLayouts["b"], cardFactory, 1 )
+    game.start()
+
+    return game
+
+
+def microBenchmarks():
+    cardFactory = dom.CardFactory()
+    results = []
+
+    def add( name, func, number ):
+        results.append( Result( name, bestTime( func, number ), "us/call" ))
+
+    # one card off the top and back again
+    deck = midGameDeck( cardFactory )
+    def deal():
+        deck.push( deck.deal() )
+    add( "deck.deal", deal, 100000 )
+
+    rng = random.Random( 1 )
+    add( "deck.shuffle", lambda: deck.shuffle( rng ), 10000 )
+    add( "deck.getCoin", deck.getCoin, 200000 )
+
+    gold = cardFactory.create( "gold" )
+    moat = cardFactory.create( "moat" )
+    add( "deck.contains", lambda: deck.contains( gold ), 200000 )
+    add( "deck.contains.missing", lambda: deck.contains( moat ), 200000 )
+
+    # a hand of 5, reshuffling the discards whenever the deck runs out
+    game = newGame( cardFactory )
+    player = game.players[0]
+    def drawCards():
+        player.drawCards( game, 5 )
+        player.discard.extend( player.hand )
+        player.hand = dom.Deck()
+    add( "player.drawCards", drawCards, 20000 )
+
+    # copies of a game a few turns in, exact and as player 1 sees it
+    game = newGame( cardFactory )
+    for i in range( 10 ):
+        game.playTurn()
+    add( "game.clone", game.clone, 2000 )
+    add( "game.clone.resample",
+         lambda: game.clone( game.players[0], rng ), 2000 )
+
+    ( layoutNames, deckLayouts ) = dom.loadLayouts()
+    def setup():
+        supply = dom.CardSupply( 2, cardFactory )
+        supply.setKingdomCards( deckLayouts["b"] )
+    add( "supply.setup", setup, 2000 )
+
+    return results
+
+
+def gameBenchmarks( numGames ):
+    ( layoutNames, deckLayouts ) = dom.loadLayouts()
+    results = []
+
+    for layout in sorted( deckLayouts ):
+        if deckLayouts[layout] is None:
+            continue
+
+        best = 0.0
+        for i in range( REPEAT ):
+            start = time.time()
+            simulate.run( GAME_STRATEGIES, deckLayouts[layout], numGames,
+                          1, workers = 1 )
+            best = max( best, numGames / max( time.time() - start, 1e-9 ))
+
+        results.append( Result( "games.%s" % layout, best, "games/s",
+                                higherIsBetter = True ))
+
+    return results
+
+
+# Playouts per second of the MCTS bot's search, choosing a buy for
+# player 1 a few turns into a game of big money bots.
+def mctsBenchmark( numPlayouts ):
+    cardFactory = dom.CardFactory()
+    game = newGame( cardFactory )
+    for player in game.players:
+        player.decisions = mcts.rolloutPolicy( 1 )
+    for i in range( 6 ):
+        game.playTurn()
+
+    player = game.players[ game.currentPlayer ]
+    game.startTurn( player )
+    options = [ None ] + list( game.supply.affordable( 8 ))
+
+    best = 0.0
+    for i in range( REPEAT ):
+        start = time.time()
+        mcts.search( game, game.currentPlayer, [], options, numPlayouts, i )
+        best = max( best, numPlayouts / max( time.time() - start, 1e-9 ))
+
+    return [ Result( "mcts.playouts", best, "playouts/s",
+                     higherIsBetter = True ) ]
+
+
+# games per second of the vector engine, with ten times the games of
+# the games benchmarks since it plays them in batches
+def vectorBenchmark( numGames ):
+    ( layoutNames, deckLayouts ) = dom.loadLayouts()
+    numGames *= 10
+
+    best = 0.0
+    for i in range( REPEAT ):
+        start = time.time()
+        simulate.run( VECTOR_STRATEGIES, deckLayouts["b"], numGames, 1,
+                      engine = "vector" )
+        best = max( best, numGames / max( time.time() - start, 1e-9 ))
+
+    return [ Result( "vector.games", best, "games/s",
+                     higherIsBetter = True ) ]
+
+
+# Steps per second of the environments on the beginners layout, the
+# agent making random legal choices against big money
+def envBenchmark( numGames ):
+    ( layoutNames, deckLayouts ) = dom.loadLayouts()
+    rng = random.Random( 1 )
+
+    best = 0.0
+    for i in range( REPEAT ):
+        environment = env.Env( deckLayouts["b"], ["bmu"], 1 )
+        numSteps = 0
+        start = time.time()
+        for game in range( max( 1, numGames / 10 )):
+            environment.reset()
+            done = False
+            while not done:
+                legal = environment.legalMask().nonzero()[0]
+                done = environment.step( rng.choice( legal ))[2]
+                numSteps += 1
+        best = max( best, numSteps / max( time.time() - start, 1e-9 ))
+    results = [ Result( "env.steps", best, "steps/s",
+                        higherIsBetter = True ) ]
+
+    best = 0.0
+    for i in range( REPEAT ):
+        environment = env.VectorEnv( deckLayouts["b"], "bmu", 1024, 1 )
+        environment.reset()
+        keyRng = env.numpy.random.RandomState( 1 )
+        start = time.time()
+        for step in range( numGames ):
+            # a random legal action in each game
+            mask = environment.legalMask()
+            keys = keyRng.random_sample( mask.shape ) * mask
+            environment.step( keys.argmax( 1 ))
+        best = max( best, 1024 * numGames / max( time.time() - start, 1e-9 ))
+    results.append( Result( "env.vector.steps", best, "steps/s",
+                            higherIsBetter = True ))
+
+    return results
+
+
+# the commit being measured, or None outside a git checkout
+def gitCommit():
+    try:
+        commit = subprocess.check_output( [ "git", "rev-parse", "HEAD" ],
+                                          stderr = open( os.devnull, "w" ))
+    except ( OSError, subprocess.CalledProcessError ):
+        return None
+
+    return commit.strip()
+
+
+def writeReport( fileName, results ):
+    report = {"commit": gitCommit(),
+              "python": platform.python_version(),
+              "machine": platform.platform(),
+              "time": time.strftime( "%Y-%m-%d %H:%M:%S" ),
+              "repeat": REPEAT,
+              "results": {}}
+    for result in results:
+        report["results"][result.name] = result.toJson()
+
+    with open( fileName, "w" ) as f:
+        json.dump( report, f, indent = 1, sort_keys = True )
+        f.write( "\n" )
+
+
+# Print results against those in the report in fileName, returns the
+# names of the benchmarks that got more than tolerance percent worse.
+def compare( results, fileName, tolerance ):
+    with open( fileName, "r" ) as f:
+        report = json.load( f )
+
+    print "\nagainst %s (commit %s)" % (fileName,
+                                        ( report.get( "commit" ) or
+                                          "unknown" )[:10])
+    print "%-24s %12s %12s %8s" % ("benchmark", "before", "now", "change")
+
+    regressions = []
+    for result in results:
+        old = report["results"].get( result.name )
+        if old is None:
+            print "%-24s %12s %12.3f %8s" % (result.name, "-",
+                                              result.value, "new")
+            continue
+
+        change = result.change( old["value"] )
+        flag = ""
+        if change < -tolerance:
+            flag = "  <-- slower"
+            regressions.append( result.name )
+
+        print "%-24s %12.3f %12.3f %+7.1f%%%s" % \
+              (result.name, old["value"], result.value, change, flag)
+
+    return regressions
+
+
+def main( argv ):
+    parser = argparse.ArgumentParser(
+        prog = "bench.py",
+        description = "Time the dom.py engine." )
+    parser.add_argument( "-g", "--games", type = int, default = 100,
+                         help = "games per layout and run (default: 100)" )
+    parser.add_argument( "--only", nargs = "+", metavar = "NAME",
+                         help = "only run benchmarks whose names start " \
+                         "with one of these (e.g. games deck.shuffle)" )
+    parser.add_argument( "--json", metavar = "FILE",
+                         help = "write the results to FILE" )
+    parser.add_argument( "--compare", metavar = "FILE",
+                         help = "compare with results written by --json" )
+    parser.add_argument( "--tolerance", type = float, default = TOLERANCE,
+                         metavar = "PERCENT",
+                         help = "how much worse counts as a regression " \
+                         "(default: %(default)g%%)" )
+    parser.add_argument( "--deque", action = "store_true",
+                         help = "compare list and deque decks and stop" )
+    args = parser.parse_args( argv )
+
+    if args.deque:
+        deckBenchmarks()
+        return
+
+    # is benchmark name, or any benchmark in the group of that name,
+    # one of the ones asked for?
+    def wanted( name ):
+        if not args.only:
+            return True
+        for prefix in args.only:
+            if name.startswith( prefix ) or prefix.startswith( name ):
+                return True
+        return False
+
+    results = []
+    if (wanted( "deck" ) or wanted( "player" ) or wanted( "game." ) or
+        wanted( "supply" )):
+        results.extend( microBenchmarks() )
+    if wanted( "games" ):
+        results.extend( gameBenchmarks( args.games ))
+    if wanted( "mcts" ):
+        results.extend( mctsBenchmark( 2 * args.games ))
+    if wanted( "vector" ) and vectorsim.available():
+        results.extend( vectorBenchmark( args.games ))
+    if wanted( "env" ) and env.available():
+        results.extend( envBenchmark( args.games ))
+    results = [ result for result in results if wanted( result.name ) ]
+
+    print "%-24s %12s %s" % ("benchmark", "result", "")
+    for result in results:
+        print "%-24s %12.3f %s" % (result.name, result.value, result.unit)
+
+    if args.json:
+        writeReport( args.json, results )
+
+    if args.compare:
+        if compare( results, args.compare, args.tolerance ):
+            raise SystemExit( 1 )
+
+
+if __name__ == "__main__":
+    main( sys.argv[1:] )
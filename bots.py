@@ -0,0 +1,476 @@
+#!/usr/bin/python
+
+"""
+bots.py: Computer players for dom.py.
+
+A bot is a dom.Decisions subclass, the engine asks it for every choice
+a human would otherwise make at the terminal.  Bot fills in every one of
+those choices with something sensible (discard junk to the militia, trash
+curses and estates, keep actions for the library only with actions left,
+...), so a strategy only overrides what it plays and what it buys.
+
+Bots are looked up by name with create(), which is how the simulation
+runner and the command line refer to them.  register() adds a new one.
+
+The Big Money family, and any bot in a strategies file, are PriorityBots:
+an ordered list of buy rules, the first rule that applies picks the
+card.  A rule is a card name with optional conditions:
+
+    province if money > 15
+    duchy if provinces <= 4
+    smithy if count < 2 and cards >= 16
+    silver
+
+A condition compares one of these with a number:
+
+    count      copies of the card the player already owns
+    cards      cards the player owns
+    money      coin in all the treasure the player owns
+    provinces  provinces left in the supply
+    coin       coin to spend right now
+    turn       turns the player has had
+    oddsN      percent chance of N or more coin in the next hand
+               (odds5, odds8, ...), worked out exactly by odds.py
+    collision  percent chance of two terminal actions in the next hand
+
+so "smithy if count < 2 and collision < 20" stops buying smithies once
+they'd be drawn together too often.
+
+A card is only ever bought if it's affordable and its pile isn't empty.
+The strategies file (STRATEGIES_FILE) has a few lines per bot:
+
+    name: description
+    buy: rule, rule, ...
+    play: card, card, ...
+
+"play" lists the action cards to play, in order of preference; without
+it the bot plays what it draws, actions that give back actions first.
+
+Bots are asked for decisions many thousands of times a second in a
+simulation, so they work from what the game already keeps count of
+(Deck counts and coin totals, the supply piles) and never build lists
+of candidate cards to choose from.
+
+Bots that want to make random choices use their own self.rng, never
+the game's, so that replaying a game without its bots stays in step.
+
+"""
+
+import operator
+import os
+import random
+
+import dom
+
+
+STRATEGIES_FILE = os.path.join( os.path.dirname( os.path.abspath( __file__ )),
+                                "strategies.txt" )
+
+# actions played first when a bot has no "play" list, they give back
+# the action they use
+NON_TERMINALS = ["village", "festival", "market", "laboratory", "cellar",
+                 "spy", "throne room"]
+
+OPERATORS = {"<": operator.lt,
+             "<=": operator.le,
+             ">": operator.gt,
+             ">=": operator.ge,
+             "==": operator.eq,
+             "!=": operator.ne}
+
+VARIABLES = ["count", "cards", "money", "provinces", "coin", "turn",
+             "collision"]
+
+
+class StrategyError( Exception ):
+    pass
+
+
+# Junk first: curses, then pure victory cards, then copper, then
+# anything else, cheapest first.
+def junkRank( card ):
+    if card.vp < 0:
+        return 0
+    if card.vp and not card.value and not card.action:
+        return 1
+    if card.name == "copper":
+        return 2
+
+    return 3 + card.cost
+
+
+class Bot( dom.Decisions ):
+    # Plays nothing and buys nothing, but answers every other choice
+    # reasonably.
+
+    # what the mine turns each treasure into
+    ore = {"copper": "silver", "silver": "gold"}
+
+    def __init__( self, seed = None ):
+        self.rng = random.Random( seed )
+
+    # a card to gain for free is chosen as if it was being bought
+    def chooseGain( self, game, player, maxCost ):
+
+        return self.chooseBuy( game, player, maxCost )
+
+    def chooseDiscard( self, game, player, attackerName ):
+        worst = None
+        for card in player.hand:
+            if worst is None or junkRank( card ) < junkRank( worst ):
+                worst = card
+
+        return worst
+
+    def chooseCellarDiscard( self, game, player ):
+        for card in player.hand:
+            if junkRank( card ) < 2:
+                return card
+
+        return None
+
+    def chooseTrash( self, game, player, source ):
+        shortcut = game.supply.shortcut
+
+        if source == "mine":
+            for cardName in ["silver", "copper"]:
+                card = shortcut[cardName]
+                if (player.hand.contains( card ) and
+                    not game.supply.decks[self.ore[cardName]].empty()):
+                    return card
+            return None
+
+        if source == "remodel":
+            # gold into a province when the end is near
+            gold = shortcut["gold"]
+            if (player.hand.contains( gold ) and
+                len( game.supply.decks["province"] ) <= 4):
+                return gold
+
+        for cardName in ["curse", "estate"]:
+            card = shortcut.get( cardName )
+            if player.hand.contains( card ):
+                return card
+
+        # only trash copper down to a deck that can still buy a gold
+        if source == "chapel" and player.getMoney() > 6:
+            copper = shortcut["copper"]
+            if player.hand.contains( copper ):
+                return copper
+
+        return None
+
+    def chooseDiscardDeck( self, game, player ):
+
+        return True
+
+    # keep your own good cards on top, take the good ones off everyone
+    # else's
+    def chooseSpyDiscard( self, game, player, victim, card ):
+        if victim is player:
+            return junkRank( card ) < 3
+
+        return junkRank( card ) >= 3
+
+    # an action drawn with no actions left to play it is a dead card
+    def chooseLibraryKeep( self, game, player, card ):
+
+        return player.numActions > 0
+
+
+class Rule:
+    # Buy cardName if every condition holds, conditions are ( variable,
+    # compare, number ).
+    def __init__( self, cardName, conditions ):
+        self.cardName = cardName
+        self.conditions = conditions
+
+    def applies( self, game, player, card, coin ):
+        for (variable, compare, number) in self.conditions:
+            if variable == "count":
+                value = player.count( card )
+            elif variable == "provinces":
+                value = len( game.supply.decks["province"] )
+            elif variable == "money":
+                value = player.getMoney()
+            elif variable == "cards":
+                value = player.numCards()
+            elif variable == "coin":
+                value = coin
+            elif variable == "turn":
+                value = player.numHands
+            elif variable == "collision":
+                value = 100 * nextHand( player ).collision
+            else:
+                value = 100 * nextHand( player ).atLeast(
+                    int( variable[len( "odds" ):] ))
+
+            if not compare( value, number ):
+                return False
+
+        return True
+
+
+# is variable an oddsN one
+def isOdds( variable ):
+
+    return variable.startswith( "odds" ) and variable[len( "odds" ):].isdigit()
+
+
+# the odds of player's next hand, see odds.py, which needs this module
+# loaded first
+def nextHand( player ):
+    import odds
+
+    return odds.nextHand( player )
+
+
+# "smithy if count < 2 and cards >= 16" -> Rule
+def parseRule( text ):
+    words = text.split( " if " )
+    cardName = words[0].strip()
+    if len( words ) > 2 or cardName not in dom.CARD_NAMES:
+        raise StrategyError( "bad buy rule: %s" % text.strip() )
+
+    conditions = []
+    if len( words ) == 2:
+        for condition in words[1].split( " and " ):
+            try:
+                ( variable, op, number ) = condition.split()
+                number = int( number )
+            except ValueError:
+                raise StrategyError( "bad condition: %s" % condition.strip() )
+
+            if (not ( variable in VARIABLES or isOdds( variable )) or
+                op not in OPERATORS):
+                raise StrategyError( "bad condition: %s" % condition.strip() )
+
+            conditions.append( ( variable, OPERATORS[op], number ))
+
+    return Rule( cardName, conditions )
+
+
+# "province, gold, silver" -> [ Rule, Rule, Rule ]
+def parseRules( text ):
+
+    return [ parseRule( rule ) for rule in text.split( "," ) if rule.strip() ]
+
+
+class PriorityBot( Bot ):
+    # Buys the card of the first buy rule that applies, plays the first
+    # card in playOrder it has in hand.  Subclasses set buyRules and
+    # playOrder, or they are passed in for bots from a strategies file.
+    buyRules = []
+
+    # None means play any action, non-terminals first
+    playOrder = None
+
+    def __init__( self, seed = None, buyRules = None, playOrder = None ):
+        Bot.__init__( self, seed )
+        if buyRules is not None:
+            self.buyRules = buyRules
+        if playOrder is not None:
+            self.playOrder = playOrder
+
+    def chooseAction( self, game, player ):
+        canceled = game.turn.canceled
+
+        if self.playOrder is not None:
+            for cardName in self.playOrder:
+                card = game.supply.shortcut.get( cardName )
+                if (card is not None and cardName not in canceled and
+                    player.hand.contains( card )):
+                    return card
+            return None
+
+        playable = None
+        for card in player.hand:
+            if not card.action or card.name in canceled:
+                continue
+
+            if card.name in NON_TERMINALS:
+                return card
+
+            playable = card
+
+        return playable
+
+    def chooseBuy( self, game, player, coin ):
+        supply = game.supply
+
+        for rule in self.buyRules:
+            card = supply.shortcut.get( rule.cardName )
+            if (card is None or card.cost > coin or
+                supply.decks[rule.cardName].empty()):
+                continue
+
+            if rule.applies( game, player, card, coin ):
+                return card
+
+        return None
+
+
+class BigMoney( PriorityBot ):
+    # Never plays an action card.  Buys a province with 8 coins, a gold
+    # with 6 or 7 and a silver with 3 to 5.
+    buyRules = parseRules( "province, gold, silver" )
+    playOrder = []
+
+
+class BigMoneyUltimate( PriorityBot ):
+    # Big Money that waits for a gold or two before buying provinces
+    # and greens as the provinces run low.
+    buyRules = parseRules( "province if money > 18, "
+                           "duchy if provinces <= 4, "
+                           "estate if provinces <= 2, "
+                           "gold, "
+                           "duchy if provinces <= 6, "
+                           "silver" )
+    playOrder = []
+
+
+class SmithyBigMoney( PriorityBot ):
+    # Big Money Ultimate with a smithy, a second one once the deck has
+    # grown enough to draw them apart.
+    drawCard = "smithy"
+
+    def __init__( self, seed = None ):
+        PriorityBot.__init__(
+            self, seed,
+            parseRules( "province if money > 15, "
+                        "duchy if provinces <= 4, "
+                        "estate if provinces <= 2, "
+                        "gold, "
+                        "duchy if provinces <= 5, "
+                        "%s if count < 1, "
+                        "%s if count < 2 and cards >= 16, "
+                        "silver" % (self.drawCard, self.drawCard) ),
+            [ self.drawCard ] )
+
+
+class CouncilRoomBigMoney( SmithyBigMoney ):
+    drawCard = "council room"
+
+
+class Greedy( PriorityBot ):
+    # Plays whatever actions it draws, non-terminal ones first, and
+    # always buys the most expensive card it can afford.  Not much of
+    # a strategy, but it exercises every kingdom card in a layout.
+    def chooseBuy( self, game, player, coin ):
+        supply = game.supply
+
+        # the dearest cost there's anything to buy at, curses aside
+        for i in xrange( len( supply.costs ) - 1, -1, -1 ):
+            cost = supply.costs[i]
+            if cost > coin:
+                continue
+
+            best = None
+            for card in supply.cardsCosting( cost ):
+                if card.name == "curse":
+                    continue
+                if best is None or self.rng.random() < 0.5:
+                    best = card
+
+            if best is not None:
+                return best
+
+        return None
+
+
+# The search bots live in mcts.py, which needs this module loaded first.
+def createMCTS( seed = None ):
+    import mcts
+
+    return mcts.MCTSBot( seed )
+
+
+# searching with every core, or just the one inside simulate.py's
+# workers
+def createParallelMCTS( seed = None ):
+    import mcts
+
+    return mcts.MCTSBot( seed, workers = None )
+
+
+STRATEGIES = {"bigmoney": BigMoney,
+              "bmu": BigMoneyUltimate,
+              "bmu-smithy": SmithyBigMoney,
+              "bmu-councilroom": CouncilRoomBigMoney,
+              "greedy": Greedy,
+              "mcts": createMCTS,
+              "mcts-parallel": createParallelMCTS}
+
+# descriptions of the bots loaded from strategies files
+DESCRIPTIONS = {}
+
+
+# make a new strategy available to create(), factory( seed ) returns
+# the bot
+def register( name, factory, description = "" ):
+    STRATEGIES[name] = factory
+    DESCRIPTIONS[name] = description
+
+
+def create( name, seed = None ):
+
+    return STRATEGIES[name]( seed )
+
+
+def makeFactory( buyRules, playOrder ):
+    def factory( seed = None ):
+
+        return PriorityBot( seed, buyRules, playOrder )
+
+    return factory
+
+
+# Register every bot in a strategies file, returns their names.  Raises
+# StrategyError if the file can't be understood.
+def loadStrategies( fileName = STRATEGIES_FILE ):
+    # [ ( name, {"description": ..., "buy": ..., "play": ...} ) ]
+    strategies = []
+
+    with open( fileName, "r" ) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith( "#" ):
+                continue
+
+            if ":" not in line:
+                raise StrategyError( "%s: can't read line: %s" % \
+                                     (fileName, line) )
+
+            ( key, value ) = line.split( ":", 1 )
+            ( key, value ) = ( key.strip(), value.strip() )
+
+            if key not in ["buy", "play"]:
+                strategies.append( ( key, {"description": value} ))
+            elif strategies:
+                strategies[-1][1][key] = value
+            else:
+                raise StrategyError( "%s: %s before any bot name" % \
+                                     (fileName, key) )
+
+    for (name, settings) in strategies:
+        if "buy" not in settings:
+            raise StrategyError( "%s has no buy rules" % name )
+
+        playOrder = None
+        if "play" in settings:
+            playOrder = [ cardName.strip() for cardName in
+                          settings["play"].split( "," ) if cardName.strip() ]
+            for cardName in playOrder:
+                if cardName not in dom.CARD_NAMES:
+                    raise StrategyError( "%s plays unknown card %s" % \
+                                         (name, cardName) )
+
+        register( name, makeFactory( parseRules( settings["buy"] ),
+                                     playOrder ),
+                  settings["description"] )
+
+    return [ name for (name, settings) in strategies ]
+
+
+if os.path.exists( STRATEGIES_FILE ):
+    loadStrategies()
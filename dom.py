@@ -130,11 +130,16 @@ what all of the various action cards do.  Enjoy!
 # feature request
 # create debug mode
 
-# feature request
-# game log files
-
 
+import argparse
+import hashlib
+import operator
 import random
+import sys
+import types
+
+from collections import deque
+from itertools import repeat
 
 try:
     import colorama
@@ -144,6 +149,50 @@ except ImportError:
     colorama = None
 
 
+# Every card there is.  A card's id, given it by the CardFactory, is
+# its index here, so decks count cards by a small integer rather than
+# by name.
+CARD_NAMES = ["adventurer", "bureaucrat", "cellar", "chancellor", "chapel",
+              "copper", "council room", "curse", "duchy", "estate", "feast",
+              "festival", "gardens", "gold", "laboratory", "library",
+              "market", "militia", "mine", "moat", "moneylender",
+              "province", "remodel", "silver", "smithy", "spy", "thief",
+              "throne room", "village", "witch", "woodcutter", "workshop"]
+
+CARD_IDS = dict( zip( CARD_NAMES, range( len( CARD_NAMES ))))
+
+GARDENS = CARD_IDS["gardens"]
+
+# A set of cards can be a bitmask too, bit id for the card of that id.
+# That's how Game.legalMask lists the answers to a decision, with two
+# more bits for the answers that aren't cards.
+PASS = len( CARD_NAMES )   # None, or no to a yes or no question
+YES = PASS + 1             # yes
+BITS = [ 1 << i for i in range( YES + 1 ) ]
+
+# the decisions that are yes or no questions
+QUESTIONS = ["chooseDiscardDeck", "chooseLibraryKeep", "chooseSpyDiscard",
+             "chooseThiefGain"]
+
+
+# the bits set in mask, lowest first
+def maskIds( mask ):
+    ids = []
+    while mask:
+        bit = mask & -mask
+        ids.append( bit.bit_length() - 1 )
+        mask ^= bit
+
+    return ids
+
+
+# A shallow copy of an old style class instance.  Does what copy.copy
+# does for them, several times quicker, which matters to clone().
+def shallowCopy( instance ):
+
+    return types.InstanceType( instance.__class__, instance.__dict__.copy() )
+
+
 class Error( Exception ):
     pass
 
@@ -156,49 +205,80 @@ class IllegalAction( Error ):
     pass
 
 
-class Deck:
+class Deck( object ):
+    # An ordered pile of cards, the top of the deck is the left hand
+    # end.  Cards are kept in a deque so dealing from and pushing onto
+    # the top and adding to the bottom all take constant time however
+    # big the deck gets.
+    #
+    # The deck also keeps a count of each card, a list indexed by card
+    # id, and a running coin total, updated as cards come and go, so
+    # getCoin, contains and count never have to look through the cards.
+    # Dealing and pushing are what the game does most, so they do the
+    # bookkeeping themselves rather than calling out for it.
+    __slots__ = ("__cards", "__numShuffles", "__counts", "__coin")
+
     def __init__( self ):
-        self.__cards = []
-        self.__currentCard = 0 # used for iterator only
+        self.__cards = deque()
         self.__numShuffles = 0
+        self.__counts = [ 0 ] * len( CARD_NAMES )
+        self.__coin = 0
 
-    def add( self, card ):        
+    def add( self, card ):
         if card is None:
             print "WARN: adding None card to Deck()"
         self.__cards.append( card )
+        self.__counts[card.id] += 1
+        self.__coin += card.value
 
     def deal( self ):
-        if len( self.__cards ) == 0:
+        try:
+            card = self.__cards.popleft()
+        except IndexError:
             raise ValueError
 
-        return self.__cards.pop(0)
+        self.__counts[card.id] -= 1
+        self.__coin -= card.value
+
+        return card
 
     def peek( self ):
         if len( self.__cards ) == 0:
             raise ValueError
-        
+
         return self.__cards[0]
 
     def push( self, card ):
-        self.__cards.insert( 0, card )
+        self.__cards.appendleft( card )
+        self.__counts[card.id] += 1
+        self.__coin += card.value
 
     def extend( self, cards ):
-        self.__cards.extend( cards )
+        if not isinstance( cards, Deck ):
+            for card in cards:
+                self.add( card )
+            return
 
-    def shuffle( self ):
-        random.shuffle( self.__cards )
+        # another deck already has its totals worked out
+        self.__cards.extend( cards.__cards )
+        self.__counts = map( operator.add, self.__counts, cards.__counts )
+        self.__coin += cards.__coin
+
+    # rng is the game's random.Random
+    def shuffle( self, rng = random ):
+        # shuffling wants random access, which a deque doesn't do well
+        cards = list( self.__cards )
+        rng.shuffle( cards )
+        self.__cards = deque( cards )
         self.__numShuffles += 1
 
     def getNumShuffles( self ):
-        
+
         return self.__numShuffles
 
     def getCoin( self ):
-        coin = 0
-        for card in self.__cards:
-            coin += card.value
 
-        return coin
+        return self.__coin
 
     def __str__( self ):
         s = ""
@@ -214,41 +294,131 @@ class Deck:
     def empty( self ):
 
         return ( len( self.__cards ) < 1 )
-    
+
     def remove( self, card ):
         self.__cards.remove( card )
+        self.__counts[card.id] -= 1
+        self.__coin -= card.value
 
     def contains( self, card ):
-        if card:
-            for c in self.__cards:
-                if c.name == card.name:
-                    return True
 
-        return False
+        return card is not None and self.__counts[card.id] > 0
+
+    # number of copies of card in the deck
+    def count( self, card ):
+
+        return self.__counts[card.id]
+
+    # the ids of the cards in the deck as a bitmask, see BITS
+    def getMask( self ):
+        mask = 0
+        for card in self.__cards:
+            mask |= BITS[card.id]
 
+        return mask
+
+    # card name -> number of copies, for every card in the deck
+    def getCounts( self ):
+        counts = {}
+        for cardId in xrange( len( CARD_NAMES )):
+            if self.__counts[cardId]:
+                counts[CARD_NAMES[cardId]] = self.__counts[cardId]
+
+        return counts
+
+    # only the final scores want this, so it's worked out from the cards
     def getVP( self ):
         vp = 0
+        perTen = len( self.__cards ) / 10
         for card in self.__cards:
-            if card.name == "gardens":
-                vp += ( card.vp * ( self.__len__() / 10 ))
+            if card.id == GARDENS:
+                vp += card.vp * perTen
             else:
                 vp += card.vp
+
         return vp
 
+    # Don't add or remove cards while iterating over the deck
     def __iter__( self ):
-        self.__currentCard = 0
-        return self
 
-    def next( self ):
-        try:
-            card = self.__cards[ self.__currentCard ]
-        # should this except be catching a ValueError?
-        except:
-            self.__currentCard = 0
-            raise StopIteration
-        self.__currentCard += 1
+        return iter( self.__cards )
 
-        return card
+    # a copy of the deck holding the same card instances
+    def clone( self ):
+        deck = Deck.__new__( Deck )
+        deck.__cards = deque( self.__cards )
+        deck.__numShuffles = self.__numShuffles
+        deck.__counts = self.__counts[:]
+        deck.__coin = self.__coin
+
+        return deck
+
+
+class Pile( object ):
+    # A supply pile.  Every card in a pile is the same shared instance
+    # from the CardFactory, so a pile is just that card and how many
+    # copies are left: dealing and returning cards only change the
+    # count, and setting up or copying a supply allocates nothing per
+    # card.  Has the parts of the Deck interface that supply piles use.
+    __slots__ = ("card", "__count")
+
+    def __init__( self, card, count = 0 ):
+        self.card = card
+        self.__count = count
+
+    def add( self, card ):
+        if card.id != self.card.id:
+            raise ValueError( "%s added to the %s pile" % \
+                              (card.name, self.card.name) )
+        self.__count += 1
+
+    # put a card back on the pile
+    push = add
+
+    def deal( self ):
+        if not self.__count:
+            raise ValueError
+
+        self.__count -= 1
+
+        return self.card
+
+    def peek( self ):
+        if not self.__count:
+            raise ValueError
+
+        return self.card
+
+    def __str__( self ):
+
+        return "%d %s" % (self.__count, self.card)
+
+    def __len__( self ):
+
+        return self.__count
+
+    def empty( self ):
+
+        return self.__count < 1
+
+    def contains( self, card ):
+
+        return card is not None and card.id == self.card.id and \
+               self.__count > 0
+
+    def count( self, card ):
+        if card.id != self.card.id:
+            return 0
+
+        return self.__count
+
+    def __iter__( self ):
+
+        return repeat( self.card, self.__count )
+
+    def clone( self ):
+
+        return Pile( self.card, self.__count )
 
 
 class Attack:
@@ -257,10 +427,117 @@ class Attack:
         self.playerName = playerName
 
 
-class Card:
+class Event:
+    # Something that happened during a game.  kind names what happened
+    # (see Game.emit), playerName is who it happened to, or None for
+    # game-wide events, and data holds the details by keyword.  Cards
+    # are always referred to by name so events can be stored or sent
+    # anywhere.
+    def __init__( self, kind, playerName, data ):
+        self.kind = kind
+        self.playerName = playerName
+        self.data = data
+
+    def __repr__( self ):
+
+        return "Event(%s, %s, %s)" % (self.kind, self.playerName, self.data)
+
+
+class Decisions:
+    # Every choice the rules leave to a player goes through one of these
+    # methods.  The engine never prompts or prints, it just asks the
+    # player's Decisions object and carries on with the answer.  Cards
+    # passed in and returned are the shared instances found in
+    # supply.shortcut.
+    #
+    # The defaults here are passive (play nothing, buy nothing) or make
+    # the obvious choice, so a bot only has to override the decisions it
+    # cares about.  ConsoleDecisions is the human front-end.
+
+    # an action card in hand to play, or None to end the action phase
+    def chooseAction( self, game, player ):
+
+        return None
+
+    # a card to buy with coin, or None to end the buy phase
+    def chooseBuy( self, game, player, coin ):
+
+        return None
+
+    # a card costing up to maxCost to gain (workshop, feast, remodel),
+    # or None to gain nothing
+    def chooseGain( self, game, player, maxCost ):
+
+        return None
+
+    # a card from hand to discard to attacker's militia, asked once per
+    # card until the hand is down to 3 cards
+    def chooseDiscard( self, game, player, attackerName ):
+        for card in player.hand:
+            if not card.value:
+                return card
+
+        for card in player.hand:
+            return card
+
+    # a card from hand to discard to the cellar, or None to stop
+    def chooseCellarDiscard( self, game, player ):
+
+        return None
+
+    # a card from hand to trash for source (the name of the chapel,
+    # remodel or mine card asking), or None to stop.  The chapel asks
+    # up to 4 times.
+    def chooseTrash( self, game, player, source ):
+
+        return None
+
+    # chancellor: put the whole deck into the discard pile?
+    def chooseDiscardDeck( self, game, player ):
+
+        return False
+
+    # spy: discard the card revealed from the top of victim's deck?
+    # (victim may be the player themselves)
+    def chooseSpyDiscard( self, game, player, victim, card ):
+
+        return victim is not player
+
+    # thief: which of the treasures revealed by victim to trash, or
+    # None to trash nothing
+    def chooseThiefTrash( self, game, player, victim, treasures ):
+        best = None
+        for card in treasures:
+            if best is None or card.value > best.value:
+                best = card
+
+        return best
+
+    # thief: take the trashed card for yourself?
+    def chooseThiefGain( self, game, player, card ):
+
+        return card.value > 1
+
+    # library: keep the action card just drawn (rather than discard it)?
+    def chooseLibraryKeep( self, game, player, card ):
+
+        return True
+
+
+class Card( object ):
+    # Cards are flyweights: the CardFactory makes one instance of each,
+    # which every deck, pile and hand shares.  Subclasses must declare
+    # __slots__ too (even if empty) or they get an instance dict back.
+    __slots__ = ("id", "name", "displayName", "shortcut", "cost", "value",
+                 "action", "vp", "helpText")
+
+    # attack cards set this
+    attack = False
+
     def __init__( self, name, displayName, shortcut,
                   cost, value, action, vp,
                   helpText = "" ):
+        self.id = None        # set by the CardFactory
         self.name = name
         self.displayName = displayName
         self.shortcut = shortcut
@@ -274,347 +551,366 @@ class Card:
 
         return "%s" % self.displayName
 
+    # anything that isn't a card (None, say) is left to Python, which
+    # calls it different
     def __eq__( self, other ):
+        if not isinstance( other, Card ):
+            return NotImplemented
 
-        return self.name == other.name
+        return self.id == other.id
 
     def __ne__( self, other ):
+        if not isinstance( other, Card ):
+            return NotImplemented
+
+        return self.id != other.id
+
+    def __hash__( self ):
 
-        return self.name != other.name
+        return hash( self.id )
 
-    def play( self, player, players, turn, supply ):
+    # the supply index types the card belongs to, see CardSupply.TYPES
+    def types( self ):
+        types = []
+        if self.value:
+            types.append( "treasure" )
+        if self.vp > 0:
+            types.append( "victory" )
+        if self.vp < 0:
+            types.append( "curse" )
+        if self.action:
+            types.append( "action" )
+        if self.attack:
+            types.append( "attack" )
+
+        return types
+
+    def play( self, player, game ):
         pass
 
+    # Could playing the card from player's hand do anything?  False
+    # for cards whose play() is sure to be taken back.
+    def playable( self, player, game ):
+
+        return True
+
 
 class Woodcutter( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "woodcutter", "(wo)odcutter", "wo",
                        3, 0, True, 0,
                        "+1 buy. +2 spend." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s, +1 buy, +2 spend.\n" % \
-              (player.name, self.displayName)
+    def play( self, player, game ):
         player.numBuys += 1
         player.spendBonus += 2
 
 
 class Moat( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "moat", "(mo)at", "mo",
                        2, 0, True, 0,
                        "+2 cards. Defend against other player attacks." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s, +2 cards." % \
-              (player.name, self.displayName)
-        player.drawCards( 2 )
+    def play( self, player, game ):
+        player.drawCards( game, 2 )
 
 
 class Cellar( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "cellar", "(ce)llar", "ce",
                        2, 0, True, 0,
                        "+1 action. Discard any number of cards. " \
                        "+1 card per card discarded." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s, +1 action..." % \
-              (player.name, self.displayName)
-        player.numActions += 1
+    def play( self, player, game ):
         numCardsDiscarded = 0
-        
-        while True:
-            print "\nIn hand: %s" % player.hand
-            discardCard = raw_input("Card name to discard (q to quit)> ")
 
-            if discardCard == "q":
+        while True:
+            cardToRemove = player.decisions.chooseCellarDiscard( game,
+                                                                 player )
+            if not player.hand.contains( cardToRemove ):
                 break
 
-            try:
-                cardToRemove = supply.shortcut[discardCard]
-            except KeyError:
-                print "\nHuh?"
-                continue
-                
-            if player.hand.contains( cardToRemove ):
-                print "%s discards %s." % \
-                      (player.name, cardToRemove.displayName)
-                numCardsDiscarded += 1
-                player.hand.remove( cardToRemove )
-                player.discard.add( cardToRemove )
-
-        if numCardsDiscarded:
-            player.drawCards( numCardsDiscarded )
-        else:
+            numCardsDiscarded += 1
+            player.hand.remove( cardToRemove )
+            player.discard.add( cardToRemove )
+            game.emit( "discard", player, card = cardToRemove.name )
+
+        if not numCardsDiscarded:
             raise CanceledAction()
-        
+
+        player.numActions += 1
+        player.drawCards( game, numCardsDiscarded )
+
+    # there has to be something else in hand to discard
+    def playable( self, player, game ):
+
+        return len( player.hand ) > 1
+
 
 class Village( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "village", "(v)illage", "v",
                        3, 0, True, 0,
                        "+1 card.  +2 actions.")
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s, +2 actions, +1 card." % \
-              (player.name, self.displayName)
-        player.drawCards( 1 )
+    def play( self, player, game ):
+        player.drawCards( game, 1 )
         player.numActions += 2
 
-    
+
 class Workshop( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "workshop", "(w)orkshop", "w",
                        3, 0, True, 0,
                        "Gain a card costing up to 4." )
 
-    def play( self, player, players, turn, supply ):
-        print "%s plays %s." % \
-              (player.name, self.displayName)
-
+    def play( self, player, game ):
         # gain any card costing up to 4
-        if not buyCard( player.discard, player, supply, 4, True ):
+        if not game.gainCard( player, 4 ):
             raise CanceledAction()
 
+    def playable( self, player, game ):
+
+        return game.supply.affordableMask( 4 ) != 0
+
 
 class Militia( Card ):
+    __slots__ = ()
+
+    attack = True
+
     def __init__( self ):
         Card.__init__( self, "militia", "(m)ilitia", "m",
                        4, 0, True, 0,
                        "+2 spend. Each other player discards " \
                        "down to 3 cards." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s, +2 spend." % \
-              (player.name, self.displayName)
-        print "\nIn turn, each other player will discard down to 3 cards."
+    def play( self, player, game ):
         player.spendBonus += 2
-        turn.attacksInPlay.append( Attack( self.name, player.name ))
+
+        # the other players discard at the start of their own turn
+        game.turn.attacksInPlay.append( Attack( self.name, player.name ))
+        game.emit( "attack", player, card = self.name )
 
 
 class Smithy( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "smithy", "(sm)ithy", "sm",
                        4, 0, True, 0,
                        "+3 cards.")
 
-    def play( self, player, players, turn, supply ):
-        print "%s plays %s, +3 cards.\n" % \
-              (player.name, self.displayName)
-        player.drawCards( 3 )
+    def play( self, player, game ):
+        player.drawCards( game, 3 )
+
 
-        
 class Remodel( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "remodel", "(r)emodel", "r",
                        4, 0, True, 0,
                        "Trash a card in hand. Gain a card worth up " \
                        "to 2 more coins." )
 
-    def play( self, player, players, turn, supply ):
-        print "%s plays %s." % (player.name, self.displayName)
-
-        while True:
-            choice = raw_input("Select a card to trash (q to quit)> ")
+    def play( self, player, game ):
+        trashedCard = player.decisions.chooseTrash( game, player, self.name )
 
-            if choice == "q":
-                raise CanceledAction()
+        if not player.hand.contains( trashedCard ):
+            raise CanceledAction()
 
-            try:
-                trashedCard = supply.shortcut[choice]
-            except KeyError:
-                print "Huh?"
-                continue
-            
-            if player.hand.contains( trashedCard ):
-                player.hand.remove( trashedCard )
-                break
-            else:
-                print "You don't have that card in hand."
+        player.hand.remove( trashedCard )
+        game.emit( "trash", player, card = trashedCard.name )
 
         # set max value of card to gain
-        gainValue = trashedCard.cost + 2
+        game.gainCard( player, trashedCard.cost + 2 )
+
+    def playable( self, player, game ):
 
-        success = False
-        while not success:
-            success = buyCard( player.discard, player, supply,
-                               gainValue, True )
+        return len( player.hand ) > 1
 
 
 class Market( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "market", "(ma)rket", "ma",
                        5, 0, True, 0,
                        "+1 card.  +1 action.  +1 buy.  +1 spend.")
 
-    def play( self, player, players, turn, supply ):
-        print "%s plays %s, +1 card, +1 action, +1 buy, +1 spend.\n" % \
-              (player.name, self.displayName)
+    def play( self, player, game ):
         player.numActions += 1
         player.numBuys += 1
         player.spendBonus += 1
-        player.drawCards( 1 )
+        player.drawCards( game, 1 )
 
 
 class Mine( Card ):
+    __slots__ = ("ore",)
+
     def __init__( self ):
         Card.__init__( self, "mine", "(mi)ne", "mi",
                        5, 0, True, 0,
                        "Trash a copper, gain a silver in hand. OR " \
                        "Trash a silver, gain a gold in hand." )
 
-    def play( self, player, players, turn, supply ):
-        print "%s plays %s." % (player.name, self.displayName)        
+        # what each minable coin turns into
+        self.ore = {"copper": "silver", "silver": "gold"}
 
-        # dont get stuck in endless input loop if player has no valid
-        # coins to trash
-        trashList = ["copper", "silver"]
+    def play( self, player, game ):
+        supply = game.supply
 
+        # dont ask for a choice if player has no valid coins to trash
         validAction = False
-        for cardName in trashList:
+        for cardName in self.ore:
             if player.hand.contains( supply.shortcut[cardName] ):
                 validAction = True
 
         if not validAction:
-            print "You have no copper or silver in hand."
-            raise IllegalAction()
-            
-        while True:
-            cardName = raw_input("Select a card to trash (q to quit)> ")
+            raise IllegalAction( "You have no copper or silver in hand." )
 
-            if cardName is "q":
-                raise CanceledAction()
+        trashedCard = player.decisions.chooseTrash( game, player, self.name )
 
-            try:
-                trashedCard = supply.shortcut[cardName]
-            except KeyError:
-                print "Please choose either copper or silver." % cardName
-                continue
+        if trashedCard is None:
+            raise CanceledAction()
 
-            if (trashedCard.name in trashList and
-                player.hand.contains( trashedCard )):
+        if (trashedCard.name not in self.ore or
+            not player.hand.contains( trashedCard )):
+            raise IllegalAction( "The mine only operates on copper or " \
+                                 "silver in hand." )
 
-                ore = None
-                if trashedCard.name == "copper":
-                    ore = "silver"
-                if trashedCard.name == "silver":
-                    ore = "gold"
+        ore = self.ore[trashedCard.name]
+        try:
+            oreCard = supply.take( ore )
+        except ValueError:
+            raise IllegalAction( "The %s supply is empty, mining action " \
+                                 "unsuccessful." % \
+                                 supply.shortcut[ore].displayName )
 
-                oreCard = None
-                try:
-                    oreCard = supply.decks[ore].deal()
-                except ValueError:
-                    print "The %s supply is empty, mining action" \
-                          "unsuccessful." % \
-                          supply.shortcut[ore].displayName
-                    raise IllegalAction()
-                        
-                player.hand.add( oreCard )
-                player.hand.remove( trashedCard )                    
-                print "%s mined %s to %s and gains it in hand." % \
-                      (player.name,
-                       trashedCard.displayName,
-                       oreCard.displayName)
+        player.hand.remove( trashedCard )
+        game.emit( "trash", player, card = trashedCard.name )
+        player.hand.add( oreCard )
+        game.emit( "gain", player, card = oreCard.name, to = "hand" )
 
-                break
-            
-            else:
-                print "The mine only operates on copper or silver in hand."
+    # the coins in player's hand that there's still ore for, as a
+    # bitmask (see BITS)
+    def oreMask( self, player, game ):
+        mask = 0
+        for (cardName, ore) in self.ore.iteritems():
+            if (player.hand.contains( game.supply.shortcut[cardName] ) and
+                not game.supply.decks[ore].empty()):
+                mask |= BITS[CARD_IDS[cardName]]
+
+        return mask
+
+    def playable( self, player, game ):
+
+        return self.oreMask( player, game ) != 0
 
 
 class Moneylender( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "moneylender", "(mon)eylender", "mon",
                        4, 0, True, 0,
-                       "Trash a copper in hand. If you do, +3 spend.")    
-
-    def play( self, player, players, turn, supply ):
-        print "%s plays %s." % (player.name, self.displayName)                
+                       "Trash a copper in hand. If you do, +3 spend.")
 
-        copperCard = supply.shortcut["copper"]
+    def play( self, player, game ):
+        copperCard = game.supply.shortcut["copper"]
         if not player.hand.contains( copperCard ):
-            print "\nYou have no copper in hand."
-            raise IllegalAction()
+            raise IllegalAction( "You have no copper in hand." )
 
-        print "%s trashed %s." % (player.name, copperCard)
         player.hand.remove( copperCard )
+        game.emit( "trash", player, card = copperCard.name )
         player.spendBonus += 3
 
+    def playable( self, player, game ):
+
+        return player.hand.contains( game.supply.shortcut["copper"] )
+
 
 class Chancellor( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "chancellor", "(ch)ancellor", "ch",
                        3, 0, True, 0,
                        "+2 spend.  You may immediately put your " \
                        "deck into your discard pile.")
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s, +2 spend." % \
-              (player.name, self.displayName)
-
-        while True:
-            if len( player.deck ) == 1:
-                prompt = "Discard the remainder of your deck? " \
-                "(%d card remains) (y/n) >" % len( player.deck )
-            else:
-                prompt = "Discard the remainder of your deck? " \
-                "(%d cards remain) (y/n) >" % len( player.deck )
-                
-            choice = raw_input( prompt )
-            if choice in ["y", "n"]:
-                break
-
-        if choice == "y":
+    def play( self, player, game ):
+        if (not player.deck.empty() and
+            player.decisions.chooseDiscardDeck( game, player )):
+            numCards = len( player.deck )
             player.discard.extend( player.deck )
             player.deck = Deck()
-            print "%s discards deck." % player.name
-        else:
-            print "%s keeps deck in play." % player.name
+            game.emit( "discard deck", player, cards = numCards )
 
         player.spendBonus += 2
 
 
 class Festival( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "festival", "(f)estival", "f",
                        5, 0, True, 0,
                        "+2 actions.  +1 buy.  +2 spend.")
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s, +2 actions, +1 buy, +2 spend.\n" % \
-              (player.name, self.displayName)
-        player.numActions += 2      
+    def play( self, player, game ):
+        player.numActions += 2
         player.numBuys += 1
         player.spendBonus += 2
 
 
 class Laboratory( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "laboratory", "(l)aboratory", "l",
                        5, 0, True, 0,
                        "+2 cards.  +1 action.")
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s, +1 action, +2 cards." % \
-              (player.name, self.displayName)
+    def play( self, player, game ):
         player.numActions += 1
-        player.drawCards( 2 )
+        player.drawCards( game, 2 )
 
 
 class Feast( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "feast", "(fe)ast", "fe",
                        4, 0, True, 0,
                        "Trash this card. Gain a card costing up to 5 coins.")
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s.\n" % (player.name, self.displayName)
-        if not buyCard( player.discard, player, supply, 5, True ):
+    def play( self, player, game ):
+        # the feast itself is trashed during clean-up
+        if not game.gainCard( player, 5 ):
             raise CanceledAction()
 
+    def playable( self, player, game ):
+
+        return game.supply.affordableMask( 5 ) != 0
+
 
 class Adventurer( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "adventurer", "(a)dventurer", "a",
                        6, 0, True, 0,
@@ -622,42 +918,35 @@ class Adventurer( Card ):
                        "2 treasure cards. Put those treasure cards into " \
                        "your hand and discard the other revealed cards." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s" % (player.name, self.displayName)
+    def play( self, player, game ):
 
-        # to do:
-        # fix case where there are less than 2 treasure remaining
-        # in the players deck and discards. 
-        treasureCards = 0        
+        # revealed cards are set aside until we're done, otherwise a
+        # deck with less than 2 treasures would shuffle them back in
+        # forever
+        setAside = []
+        treasureCards = 0
         while treasureCards < 2:
+            newCard = player.dealCard( game )
+            if newCard is None:
+                break
 
-            try:
-                newCard = player.deck.deal()
-            except ValueError:
-
-                if player.discard.empty():
-                    print "No more cards to deal"
-                    break
-                
-                player.deck.extend( player.discard )
-                player.deck.shuffle()
-                print "====> %s shuffles %d cards." % \
-                      (player.name, len( player.deck )) 
-                player.discard = Deck()                
-                newCard = player.deck.deal()
-            
             if newCard.value:
-                print "%s draws %s and takes it in hand." % \
-                      (player.name, newCard.displayName )
                 player.hand.add( newCard )
+                game.emit( "draw", player, card = newCard.name )
                 treasureCards += 1
             else:
-                print "%s draws %s and discards it." % \
-                      (player.name, newCard.displayName )
-                player.discard.add( newCard )
+                setAside.append( newCard )
+
+        for card in setAside:
+            player.discard.add( card )
+            game.emit( "discard", player, card = card.name )
 
 
 class Bureaucrat( Card ):
+    __slots__ = ()
+
+    attack = True
+
     def __init__( self ):
         Card.__init__( self, "bureaucrat", "(b)ureaucrat", "b",
                        4, 0, True, 0,
@@ -665,80 +954,62 @@ class Bureaucrat( Card ):
                        "player reveals a victory card from their hand " \
                        "and puts it on top of their deck." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s." % \
-              (player.name, self.displayName)
-
-
+    def play( self, player, game ):
         try:
-            silver = supply.decks["silver"].deal()
+            silver = game.supply.take( "silver" )
             player.deck.push( silver )
-            print "\nA %s added on top of %s's deck.\n" % \
-                  (silver.displayName, player.name)            
+            game.emit( "gain", player, card = silver.name, to = "deck" )
         except ValueError:
-            print "\nThe %s supply is exhausted." % \
-                  supply.shortcut["silver"].displayName
+            pass
 
-        print
-        for other in players:
+        for other in game.players:
 
-            if other.name == player.name:
+            if other is player or game.isDefended( other, self ):
                 continue
 
-            if other.hand.contains( supply.shortcut.get( "moat" ) ):
-                print "%s deflects the attack with a moat." % \
-                      other.name
-            else:
-                cardToRemove = None
-                for card in other.hand:
-                    if card.vp:
-                        cardToRemove = card
-                        break
-
-                if cardToRemove:
-                    print "Moved %s's %s from hand " \
-                          "to top of deck." % \
-                          (other.name, cardToRemove.displayName )
-                    other.hand.remove( cardToRemove )
-                    other.deck.push( cardToRemove )
-                else:
-                    print "%s has no VP cards in hand." \
-                          % other.name
+            cardToRemove = None
+            for card in other.hand:
+                if card.vp:
+                    cardToRemove = card
+                    break
+
+            if cardToRemove:
+                other.hand.remove( cardToRemove )
+                other.deck.push( cardToRemove )
+                game.emit( "topdeck", other, card = cardToRemove.name )
 
 
 class Witch( Card ):
+    __slots__ = ()
+
+    attack = True
+
     def __init__( self ):
         Card.__init__( self, "witch", "(wi)tch", "wi",
                        5, 0, True, 0,
                        "+2 cards.  Each other player takes a curse card." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s." % (player.name, self.displayName)
-
-        player.drawCards( 2 )
+    def play( self, player, game ):
+        player.drawCards( game, 2 )
 
-        print
-        for other in players:
-            if other.name == player.name:
+        for other in game.players:
+            if other is player or game.isDefended( other, self ):
                 continue
 
-            if other.hand.contains( supply.shortcut.get( "moat" ) ):
-                print "%s deflects the attack with a moat.\n" % other.name
-            else:
-                newCurse = None
-                try:
-                    newCurse = supply.decks["curse"].deal()
-                except ValueError:
-                    print "%s avoids the %s--the supply is empty." % \
-                          (other.name, supply.shortcut["curse"].displayName)
+            try:
+                newCurse = game.supply.take( "curse" )
+            except ValueError:
+                continue
 
-                if newCurse:
-                    print "%s takes a %s!" % \
-                          (other.name, newCurse.displayName)
-                    other.discard.add( newCurse )
+            other.discard.add( newCurse )
+            game.emit( "gain", other, card = newCurse.name, to = "discard" )
 
 
 class Spy( Card ):
+    __slots__ = ()
+
+    attack = True
+
     def __init__( self ):
         Card.__init__( self, "spy", "(sp)y", "sp",
                        4, 0, True, 0,
@@ -746,64 +1017,35 @@ class Spy( Card ):
                        "reveals the top card from his deck and either " \
                        "discards it or puts it back, your choice." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s." % (player.name, self.displayName)
-
-        player.drawCards( 1 )
+    def play( self, player, game ):
+        player.drawCards( game, 1 )
         player.numActions += 1
 
-        print
-        for other in players:
-            
-            isPlayer = False
-            if other.name == player.name:
-                isPlayer = True
-        
-                if other.hand.contains( supply.shortcut.get( "moat" ) ):
-                    print "%s deflects the attack with a moat." % \
-                          (other.name)
-                    continue
-            
-            try:
-                topCard = other.deck.deal()
-            except ValueError:
-
-                if other.discard.empty():
-                    print "No more cards to deal"
-                    continue
-                
-                other.deck.extend( other.discard )
-                other.deck.shuffle()
-                print "====> %s shuffles %d cards." % \
-                      (other.name, len( other.deck ))                 
-                other.discard = Deck()
-                topCard = other.deck.deal()
+        for other in game.players:
 
+            if other is not player and game.isDefended( other, self ):
+                continue
 
-            if isPlayer:
-                print "%s, your next card is %s." % \
-                      (other.name, topCard.displayName)
-            else:
-                print "The top card on %s's deck is %s" % \
-                      (other.name, topCard.displayName)
+            topCard = other.dealCard( game )
+            if topCard is None:
+                continue
 
-            while True:
-                prompt = "(d)iscard it or (p)ut it back? >"
-                fate = raw_input( prompt )
-                if fate in ["d", "p"]:
-                    break
+            game.emit( "reveal", other, card = topCard.name )
 
-            if fate == "d":
-                print "Discarded %s's %s" % \
-                      (other.name, topCard.displayName)
+            if player.decisions.chooseSpyDiscard( game, player,
+                                                  other, topCard ):
                 other.discard.add( topCard )
+                game.emit( "discard", other, card = topCard.name )
             else:
-                print "%s's %s goes back." % \
-                      (other.name, topCard.displayName)
                 other.deck.push( topCard )
+                game.emit( "topdeck", other, card = topCard.name )
 
 
 class Thief( Card ):
+    __slots__ = ()
+
+    attack = True
+
     def __init__( self ):
         Card.__init__( self, "thief", "(t)hief", "t",
                        4, 0, True, 0,
@@ -813,141 +1055,26 @@ class Thief( Card ):
                        "of these trashed cards. They discard the other " \
                        "revealed cards." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s." % (player.name, self.displayName)
-
-        # this code is pretty much as it was originally written
-        # (in haste). It's fairly awful and should be refactored
-        # however there is much else to do and the code works.
+    def play( self, player, game ):
         localTrash = []
-        for other in players:
+        for other in game.players:
 
-            if other.name == player.name:
+            if other is player or game.isDefended( other, self ):
                 continue
 
-            if other.hand.contains( supply.shortcut.get( "moat" ) ):
-                print "\n%s deflects the attack with a moat." % other.name
-                continue
-
-            # to do: should just use len(reveal) and get rid of
-            # treasure variable altogether
-            treasure = 0
             reveal = []
+            treasures = []
             for i in range(2):
-                try:
-                    topCard = other.deck.deal()
-                except ValueError:
-
-                    if other.discard.empty():
-                        print "No more cards to deal"
-                        break
-                    
-                    other.deck.extend( other.discard )
-                    other.deck.shuffle()
-                    print "====> %s shuffles %d cards." % \
-                          (other.name, len( other.deck ))
-                    other.discard = Deck()
-                    topCard = other.deck.deal()
+                topCard = other.dealCard( game )
+                if topCard is None:
+                    break
 
-                if topCard.value:
-                    treasure += 1
+                game.emit( "reveal", other, card = topCard.name )
                 reveal.append( topCard )
+                if topCard.value:
+                    treasures.append( topCard )
 
-
-            # to do:
-            # remove this and handle these cases correctly
-            # this is extremely unlikely, however
-            if len(reveal) < 2:
-                print "%s has less than 2 cards left, oops" % \
-                      other.name
-                continue
-
-            print "\n%s reveals %s and %s." % \
-                  (other.name,
-                   reveal[0].displayName,
-                   reveal[1].displayName)
-
-            if treasure == 1:                
-                if reveal[0].value:
-                    treasureCard = reveal[0]
-                    otherCard = reveal[1]
-                else:
-                    treasureCard = reveal[1]
-                    otherCard = reveal[0]
-
-                # colorama crashes cygwin if color is sent to
-                # raw input.  could fix this on cygwin by using
-                # name attribute instead of display name.
-                prompt = "%s, trash the %s? (y/n)> " % \
-                         (player.name, treasureCard.displayName)
-                while True:
-                    trashIt = raw_input( prompt )
-                    if trashIt in ["y", "n"]:
-                        break
-                    
-                if trashIt == "y":
-                    print "The %s is trashed." % treasureCard.displayName
-                    localTrash.append( treasureCard )
-                else:
-                    print "The %s is discarded" % treasureCard.displayName
-                    other.discard.add( treasureCard )
-                print "The %s gets discarded." % otherCard.displayName
-                other.discard.add( otherCard )
-                    
-            elif treasure == 2:
-                while True:
-                    prompt = "%s, choose one to trash " \
-                             "(q trashes nothing)> " % player.name
-                    whichOne = raw_input( prompt )
-
-                    if whichOne == "q":
-                        break
-
-                    # trash nothing, discard both
-                    if whichOne == "":
-                        for card in reveal:
-                            print "%s discarded." % \
-                                  card.displayName
-                            other.discard.add( card )
-                        break
-
-                    # else, argh, get the shortcut
-                    try:
-                        theCard = supply.shortcut[whichOne]
-                    except KeyError:
-                        print "Huh?"
-                        continue
-
-                    # did we find the card they mean?
-                    foundIt = False
-                    for card in reveal:
-                        if card == theCard:
-                            foundIt = True
-                    
-                    if not foundIt:
-                        print "That's not one of the choices."
-                        continue
-
-                    # we know there are 2 cards in reveal list, right?
-                    # now resolve the choice
-                    # this code is dumb
-                    if reveal[0] == theCard:
-                        print "The %s is trashed." % \
-                              reveal[0].displayName
-                        print "The %s is discarded." % \
-                              reveal[1].displayName
-                        localTrash.append( reveal[0] )
-                        other.discard.add( reveal[1] )
-                    else:
-                        print "The %s is trashed." % \
-                              reveal[1].displayName
-                        print "The %s is discarded." % \
-                              reveal[0].displayName
-                        localTrash.append( reveal[1] )
-                        other.discard.add( reveal[0] )
-                    break
-                
-            else:
+            if not treasures:
 
                 # The reveal list ordered such that the first
                 # card is the most recently taken card from the
@@ -956,152 +1083,130 @@ class Thief( Card ):
                 # end of the reveal list and push to the front
                 # of the deck
                 while len( reveal ):
-                    other.deck.push( reveal.pop() )
+                    topCard = reveal.pop()
+                    other.deck.push( topCard )
+                    game.emit( "topdeck", other, card = topCard.name )
+                continue
 
-        
-        # now rifle through the trash you thief!
-        if len(localTrash):
-            print "\n%s, you may steal any of the trashed cards.\n" % \
-                  player.name
-            
-            for card in localTrash:
-                prompt = "(t)ake or (l)eave a %s?> " % card.displayName
-                while True:
-                    stealIt = raw_input( prompt )
-                    if stealIt in ["t", "l"]:
-                        break
-                if stealIt == "t":
-                    print "%s gains a %s!" % \
-                          (player.name, card.displayName)
-                    player.discard.add( card )
+            trashedCard = player.decisions.chooseThiefTrash( game, player,
+                                                             other,
+                                                             treasures )
+            for card in reveal:
+                if card is trashedCard:
+                    localTrash.append( card )
+                    game.emit( "trash", other, card = card.name )
+                    trashedCard = None
                 else:
-                    print "%s tosses the %s." % \
-                          (player.name, card.displayName)
-        else:
-            print "There is no treasure to steal."
+                    other.discard.add( card )
+                    game.emit( "discard", other, card = card.name )
+
+        # now rifle through the trash you thief!
+        for card in localTrash:
+            if player.decisions.chooseThiefGain( game, player, card ):
+                player.discard.add( card )
+                game.emit( "gain", player, card = card.name, to = "discard" )
 
 
 class Library( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "library", "(li)brary", "li",
                        5, 0, True, 0,
                        "Draw until you have 7 cards in hand. You may " \
                        "discard any actions cards as you draw them." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s." % (player.name, self.displayName)
-        
+    def play( self, player, game ):
         while len( player.hand ) < 7:
-            try:
-                topCard = player.deck.deal()
-            except ValueError:
-                if player.discard.empty():
-                    print "No more cards to deal"
-                    break
-                
-                player.deck.extend( player.discard )
-                player.deck.shuffle()
-                print "====> %s shuffles %d cards." % \
-                      (player.name, len( player.deck ))                 
-                player.discard = Deck()
-
-            if topCard.action:
-                print "%s draws %s" % (player.name, topCard)                
-                while True:
-                    keepIt = raw_input( "(d)iscard or (k)eep?> " )
-                    if keepIt in ["d", "k"]:
-                        break
-
-                if keepIt == "d":
-                    print "%s discards the %s" % (player.name, topCard)
-                    player.discard.add( topCard )
-                else:
-                    print "%s keeps the %s" % (player.name, topCard)
-                    player.hand.add( topCard )
+            topCard = player.dealCard( game )
+            if topCard is None:
+                break
 
+            if (topCard.action and
+                not player.decisions.chooseLibraryKeep( game, player,
+                                                        topCard )):
+                player.discard.add( topCard )
+                game.emit( "discard", player, card = topCard.name )
             else:
-                print "%s draws %s and takes it in hand." % \
-                      (player.name, topCard)
                 player.hand.add( topCard )
+                game.emit( "draw", player, card = topCard.name )
 
 
 class CouncilRoom( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "council room", "(co)uncil room",
                        "co", 5, 0, True, 0,
                        "+4 cards.  +1 buy.  Each other player draws a card." )
 
-    def play( self, player, players, turn, supply ):
-        print "%s plays %s" % (player.name, self.name)
-        player.drawCards( 4 )
+    def play( self, player, game ):
+        player.drawCards( game, 4 )
         player.numBuys += 1
 
-        print "\nThe other players all draw a card."
-        for other in players:
-            if other.name == player.name:
+        for other in game.players:
+            if other is player:
                 continue
 
-            print "%s draws a card and takes it in hand." % other.name
-            other.drawCards( 1, silent = True )
-        
+            other.drawCards( game, 1, silent = True )
+
 
 class Chapel( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "chapel", "(cha)pel", "cha",
                        2, 0, True, 0,
                        "Trash up to 4 cards." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s" % (player.name, self.name)
+    def play( self, player, game ):
         cardsTrashed = 0
 
-        while True:
-            if cardsTrashed >= 4:
+        while cardsTrashed < 4:
+            trashedCard = player.decisions.chooseTrash( game, player,
+                                                        self.name )
+            if not player.hand.contains( trashedCard ):
                 break
-            
-            choice = raw_input("Select a card to trash (q to quit)> ")
-            if choice == "q":
-                break
-            
-            try:
-                trashedCard = supply.shortcut[choice]
-            except KeyError:
-                print "Huh?"
-                continue
-            
-            if player.hand.contains( trashedCard ):
-                print "Trashed %s" % trashedCard.displayName
-                cardsTrashed += 1
-                player.hand.remove( trashedCard )
-            else:
-                print "You don't have that card in hand."
+
+            cardsTrashed += 1
+            player.hand.remove( trashedCard )
+            game.emit( "trash", player, card = trashedCard.name )
 
         if not cardsTrashed:
             raise CanceledAction()
 
+    def playable( self, player, game ):
+
+        return len( player.hand ) > 1
+
 
 class ThroneRoom( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "throne room", "(th)rone room", "th",
                        4, 0, True, 0,
                        "Choose an action card in your hand.  Play it twice." )
 
-    def play( self, player, players, turn, supply ):
-        print "\n%s plays %s" % (player.name, self.displayName)
-        print "\nYou play your next action card twice."
-        turn.numThroneRooms += 1
+    def play( self, player, game ):
+        # Game.playAction plays the next action card twice
+        game.turn.numThroneRooms += 1
         player.numActions += 1
-        turn.chainingThroneRooms = True
+        game.turn.chainingThroneRooms = True
 
 
 class Curse( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "curse", "(cu)rse", "cu",
                        0, 0, False, -1,
                        "-1 victory point.")
-        
+
 
 class Estate( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "estate", "(e)state", "e",
                        2, 0, False, 1,
@@ -1109,13 +1214,17 @@ class Estate( Card ):
 
 
 class Gardens( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "gardens", "(ga)rdens", "ga",
                        4, 0, False, 1,
-                       "1 victory point per 10 cards in your deck.")    
-    
+                       "1 victory point per 10 cards in your deck.")
+
 
 class Duchy( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "duchy", "(d)uchy", "d",
                        5, 0, False, 3,
@@ -1123,6 +1232,8 @@ class Duchy( Card ):
 
 
 class Province( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "province", "(p)rovince", "p",
                        8, 0, False, 6,
@@ -1130,6 +1241,8 @@ class Province( Card ):
 
 
 class Copper( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "copper", "(c)opper", "c",
                        0, 1, False, 0,
@@ -1137,6 +1250,8 @@ class Copper( Card ):
 
 
 class Silver( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "silver", "(s)ilver", "s",
                        3, 2, False, 0,
@@ -1144,6 +1259,8 @@ class Silver( Card ):
 
 
 class Gold( Card ):
+    __slots__ = ()
+
     def __init__( self ):
         Card.__init__( self, "gold", "(g)old", "g",
                        6, 3, False, 0,
@@ -1187,6 +1304,9 @@ class CardFactory():
                         "adventurer": Adventurer() 
                         }
 
+        for (cardName, card) in self.__cards.iteritems():
+            card.id = CARD_IDS[cardName]
+
     def setColorCodes( self ):
         # reset the displayName attributes
         self.__cards["estate"].displayName = "\033[32m(e)state\033[39m"
@@ -1211,8 +1331,9 @@ class CardFactory():
         
 
 class Player:
-    def __init__( self, name ):
+    def __init__( self, name, decisions = None ):
         self.name = name
+        self.decisions = decisions or Decisions()
         self.deck = Deck()
         self.hand = Deck()
         self.inPlay = Deck()
@@ -1222,26 +1343,75 @@ class Player:
         self.numActions = 0
         self.numBuys = 0
 
-    def drawCards( self, numCards, silent = False ):
+    # Take the top card of the deck, shuffling the discards into a new
+    # deck when it runs out.  Returns None when there is nothing left.
+    def dealCard( self, game ):
+        try:
+            return self.deck.deal()
+        except ValueError:
+            pass
+
+        if self.discard.empty():
+            game.emit( "no cards", self )
+            return None
+
+        self.deck.extend( self.discard )
+        self.deck.shuffle( game.rng )
+        self.discard = Deck()
+        game.emit( "shuffle", self, cards = len( self.deck ) )
+
+        return self.deck.deal()
+
+    def drawCards( self, game, numCards, silent = False ):
 
         for i in range( numCards ):
-            try:
-                card = self.deck.deal()
-            except ValueError:
-                if self.discard.empty():
-                    print "No more cards to deal"
-                    return
-                
-                self.deck.extend( self.discard )
-                self.deck.shuffle()
-                print "====> %s shuffles %d cards." % \
-                      (self.name, len( self.deck ))
-                self.discard = Deck()
-                card = self.deck.deal()
-                
+            card = self.dealCard( game )
+            if card is None:
+                return
+
             self.hand.add( card )
-            if not silent:
-                print "%s draws %s" % (self.name, card.displayName)
+            game.emit( "draw", player = self, card = card.name,
+                       silent = silent )
+
+    def getCoin( self ):
+
+        return self.spendBonus + self.hand.getCoin()
+
+    # a copy of the player, sharing their decisions object
+    def clone( self ):
+        player = shallowCopy( self )
+        player.deck = self.deck.clone()
+        player.hand = self.hand.clone()
+        player.inPlay = self.inPlay.clone()
+        player.discard = self.discard.clone()
+
+        return player
+
+    # number of copies of card the player owns, wherever they are
+    def count( self, card ):
+
+        return ( self.deck.count( card ) + self.hand.count( card ) +
+                 self.inPlay.count( card ) + self.discard.count( card ))
+
+    # total number of cards the player owns
+    def numCards( self ):
+
+        return ( len( self.deck ) + len( self.hand ) +
+                 len( self.inPlay ) + len( self.discard ))
+
+    # total coin in all the treasure the player owns
+    def getMoney( self ):
+
+        return ( self.deck.getCoin() + self.hand.getCoin() +
+                 self.inPlay.getCoin() + self.discard.getCoin() )
+
+    # every card the player owns, wherever it is
+    def allCards( self ):
+        cards = Deck()
+        for deck in [self.deck, self.hand, self.inPlay, self.discard]:
+            cards.extend( deck )
+
+        return cards
 
 
 class TurnState():
@@ -1250,22 +1420,59 @@ class TurnState():
         self.numPlayers = numPlayers
         self.numThroneRooms = 0  # num consecutive throne rooms in play
         self.chainingThroneRooms = False
+        self.canceled = [] # names of actions canceled this turn
+
+    def clone( self ):
+        turn = shallowCopy( self )
+        turn.attacksInPlay = list( self.attacksInPlay )
+        turn.canceled = list( self.canceled )
+
+        return turn
 
 
 class CardSupply():
+    # Cards should always be taken from the supply with take(), which
+    # keeps track of the empty piles as it goes so that isGameOver()
+    # doesn't need to look at every pile.
+
+    # supply piles that don't count towards the 3 empty piles game end
+    BASIC_CARDS = ["estate", "duchy", "province",
+                   "copper", "silver", "gold", "curse"]
+
+    # what byType indexes the cards by
+    TYPES = ["treasure", "victory", "curse", "action", "attack"]
+
     def __init__( self, numPlayers, cardFactory ):
         self.__numPlayers = numPlayers
         self.__factory = cardFactory
 
-        # start with only the cards that appear in every game
-        self.decks = {"estate": Deck(),
-                      "duchy": Deck(),
-                      "province": Deck(),
-                      "copper": Deck(),
-                      "silver": Deck(),
-                      "gold": Deck()}
+        # start with only the cards that appear in every game, the
+        # piles are filled by __setup()
+        self.decks = {}
 
         self.shortcut = {}
+        self.kingdomCards = []
+
+        # names of the kingdom piles that have run out, in order
+        self.emptyPiles = []
+        self.provincesGone = False
+
+        # callables told the name of each pile as it runs out
+        self.emptyListeners = []
+
+        # The cards whose piles aren't empty, indexed by cost and by
+        # type (TYPES), and the costs that have any, in order.  Kept up
+        # to date by take(), so "what can I buy for 5 coins" doesn't
+        # mean going through every pile.  The entries are tuples that
+        # are replaced rather than changed, so clones can share them.
+        self.byCost = {}
+        self.byType = {}
+        self.costs = ()
+
+        # costMasks[c] is the cards costing up to c that can be bought
+        # as a bitmask (see BITS), every cost up to the dearest
+        self.costMasks = ()
+
         self.__setup()
 
     def __setup( self ):
@@ -1276,19 +1483,13 @@ class CardSupply():
             numVpCards = 12
 
         # set up variable number of VP cards
-        for i in range(numVpCards):
-            self.decks["estate"].add( self.__factory.create("estate") )
-            self.decks["duchy"].add( self.__factory.create("duchy") )
-            self.decks["province"].add( self.__factory.create("province") )
+        for cardName in ["estate", "duchy", "province"]:
+            self.decks[cardName] = Pile( self.__factory.create( cardName ),
+                                         numVpCards )
 
-        for i in range(60):
-            self.decks["copper"].add( self.__factory.create("copper") )
-
-        for i in range(40):
-            self.decks["silver"].add( self.__factory.create("silver") )
-
-        for i in range(30):
-            self.decks["gold"].add( self.__factory.create("gold") )
+        self.decks["copper"] = Pile( self.__factory.create( "copper" ), 60 )
+        self.decks["silver"] = Pile( self.__factory.create( "silver" ), 40 )
+        self.decks["gold"] = Pile( self.__factory.create( "gold" ), 30 )
 
 
     # if this method is not called independently at setup time
@@ -1311,17 +1512,15 @@ class CardSupply():
                       "the decks layout file."
                 raise SystemExit()
 
+            self.kingdomCards.append( cardName )
+
             # There are always 10 of each action card
-            self.decks[cardName] = Deck()
-            for i in range(10):
-                self.decks[cardName].add( card )
+            self.decks[cardName] = Pile( card, 10 )
 
         # Auto-magically add the Curse card if we require it.
         # (In the base set, only the Witch card requires Curse.)
         if "witch" in cardList:
-            self.decks["curse"] = Deck()
-            for i in range(30):
-                self.decks["curse"].add( self.__factory.create("curse") )
+            self.decks["curse"] = Pile( self.__factory.create( "curse" ), 30 )
 
         self.__setupCardShortcuts()
 
@@ -1334,6 +1533,116 @@ class CardSupply():
             self.shortcut[card.name] = card
             self.shortcut[card.shortcut] = card
 
+        self.__buildIndex()
+
+    def __buildIndex( self ):
+        self.byCost = {}
+        self.byType = {}
+        for cardType in self.TYPES:
+            self.byType[cardType] = ()
+
+        for cardName in sorted( self.decks ):
+            if self.decks[cardName].empty():
+                continue
+
+            card = self.shortcut[cardName]
+            self.byCost[card.cost] = self.byCost.get( card.cost, () ) + \
+                                     ( card, )
+            for cardType in card.types():
+                self.byType[cardType] += ( card, )
+
+        self.costs = tuple( sorted( self.byCost ))
+        self.__buildCostMasks()
+
+    def __buildCostMasks( self ):
+        masks = [ 0 ] * ( max( self.costs or ( 0, )) + 1 )
+        for (cost, cards) in self.byCost.iteritems():
+            for card in cards:
+                if card.name != "curse":
+                    masks[cost] |= BITS[card.id]
+
+        for cost in range( 1, len( masks )):
+            masks[cost] |= masks[cost - 1]
+        self.costMasks = tuple( masks )
+
+    def __unindex( self, card ):
+        cards = tuple( c for c in self.byCost[card.cost] if c is not card )
+        if cards:
+            self.byCost[card.cost] = cards
+        else:
+            del self.byCost[card.cost]
+            self.costs = tuple( sorted( self.byCost ))
+
+        for cardType in card.types():
+            self.byType[cardType] = tuple( c for c in self.byType[cardType]
+                                           if c is not card )
+
+        self.__buildCostMasks()
+
+    # the cards costing exactly cost that can still be had
+    def cardsCosting( self, cost ):
+
+        return self.byCost.get( cost, () )
+
+    # the cards of cardType (one of TYPES) that can still be had
+    def cardsOfType( self, cardType ):
+
+        return self.byType[cardType]
+
+    # every card costing up to maxCost that can still be had, cheapest
+    # first
+    def affordable( self, maxCost ):
+        for cost in self.costs:
+            if cost > maxCost:
+                break
+            for card in self.byCost[cost]:
+                yield card
+
+    # the cards costing up to maxCost that can still be bought (curses
+    # aside, see Game.checkPurchase) as a bitmask, see BITS
+    def affordableMask( self, maxCost ):
+        if maxCost < 0:
+            return 0
+
+        return self.costMasks[ min( maxCost, len( self.costMasks ) - 1 ) ]
+
+    # Deal the top card off the cardName pile.  Raises ValueError if
+    # the pile is empty, like Deck.deal().
+    def take( self, cardName ):
+        deck = self.decks[cardName]
+        card = deck.deal()
+
+        if deck.empty():
+            self.__unindex( card )
+
+            if cardName == "province":
+                self.provincesGone = True
+            elif cardName not in self.BASIC_CARDS:
+                self.emptyPiles.append( cardName )
+
+            for listener in self.emptyListeners:
+                listener( cardName )
+
+        return card
+
+    # a copy of the supply, without the empty pile listeners
+    def clone( self ):
+        supply = shallowCopy( self )
+        supply.decks = {}
+        for (cardName, deck) in self.decks.iteritems():
+            supply.decks[cardName] = deck.clone()
+        supply.emptyPiles = list( self.emptyPiles )
+        supply.emptyListeners = []
+        supply.byCost = self.byCost.copy()
+        supply.byType = self.byType.copy()
+
+        return supply
+
+    # The game ends when the provinces run out, or any 3 kingdom piles
+    def isGameOver( self ):
+
+        return self.provincesGone or len( self.emptyPiles ) >= 3
+
 
 # Useful debugging function
 def dumpDecks( player ):
@@ -1343,153 +1652,390 @@ def dumpDecks( player ):
     print "In deck: ", player.deck
     print "In discard: ", player.discard
 
-# card help looks better now, but the code is major suck
-def cardHelp( decks ):
-    print
+# the chances of the hand player will draw at the end of this turn,
+# see odds.py
+def showNextHandOdds( player ):
+    import odds
 
-    for i in range( 9 ):
-        vpCards = []
-        for deck in decks.values():
+    print "\nNext hand: %s\n" % odds.nextHand( player )
 
-            if deck.empty():
-                continue
+def cardHelp( supply ):
+    print
 
-            card = deck.peek()
+    victoryCards = sorted( supply.cardsOfType( "victory" ),
+                           key = lambda card: card.vp )
 
-            if card.vp == i and card.vp:
-                vpCards.append( card )
-                
-        # hack for gardens card
-        for card in vpCards:
-            if card.name != 'gardens':
-                print "%s (%d VP) " % (card.displayName, card.vp),
+    # hack for gardens card
+    for card in victoryCards:
+        if card.name != 'gardens':
+            print "%s (%d VP) " % (card.displayName, card.vp),
 
     print
 
-    # do all this again just to show gardens VP
-    # correctly if it's in the game, ack!
-    for deck in decks.values():
-        if deck.empty():
-            continue
-
-        card = deck.peek()
+    # gardens VP is shown on its own line, if it's in the game
+    for card in victoryCards:
         if card.name == 'gardens':
             print "%s (%d VP per 10 cards in deck)" % \
                   (card.displayName, card.vp)
         
     print
 
-    for i in range( 9 ):
+    for card in supply.affordable( 8 ):
+        if card.action:
+            print "%s: %s" % (card.displayName, card.helpText)
 
-        cardChoices = []
-        for deck in decks.values():
-            if deck.empty():
-                continue
+# max spend is the upper limit of cards to display
+# and determines which cards are available for purchase on this buy
 
-            card = deck.peek()
 
-            if card.cost == i and card.action:
-                cardChoices.append( card )
-                
-        for thisCard in cardChoices:
-            print "%s: %s" % (thisCard.displayName, thisCard.helpText)
+class Game:
+    # The rules engine.  A Game runs from setup to game over without
+    # ever reading input or printing: every choice is asked of the
+    # current player's Decisions object and everything that happens is
+    # reported as an Event to the callables in self.listeners.  The
+    # console game in main() is just one set of Decisions and listeners.
+    #
+    # Each game has its own random number generator, self.rng, and all
+    # of its shuffling (and anything else random in the rules) should
+    # use it rather than the random module.  Playing the same decisions
+    # from the same seed then gives exactly the same game.  Decisions
+    # must not draw from game.rng: a replayed game doesn't ask its
+    # bots anything, so it would fall out of step.
+
+    def __init__( self, players, cardSet, cardFactory = None, seed = None ):
+        self.players = players
+        self.cardFactory = cardFactory or CardFactory()
+        self.supply = CardSupply( len( players ), self.cardFactory )
+        self.supply.setKingdomCards( cardSet )
+        self.supply.emptyListeners.append( self.pileEmptied )
+        self.turn = TurnState( len( players ) )
+        self.listeners = []
+        self.currentPlayer = 0
+        self.numTurns = 0
+        self.started = False
+
+        if seed is None:
+            seed = newSeed()
+        self.seed = seed
+        self.rng = random.Random( seed )
+
+    # Report an event to the listeners.  The kinds of event are:
+    #   "game start"   players, kingdom, seed
+    #   "turn"         a player's turn begins
+    #   "shuffle"      cards shuffled into a new deck
+    #   "no cards"     nothing left to draw
+    #   "draw"         card drawn into hand (silent if not shown to all)
+    #   "play"         action card played
+    #   "replay"       action card played again by a throne room
+    #   "cancel"       action card taken back, reason says why
+    #   "buy"          card bought into the discard pile
+    #   "gain"         card gained without buying, to "discard",
+    #                  "hand" or "deck"
+    #   "discard"      card discarded
+    #   "discard deck" whole deck put into the discard pile
+    #   "trash"        card trashed
+    #   "topdeck"      card put on top of the deck
+    #   "reveal"       card revealed from the top of the deck
+    #   "attack"       attack card played against the other players
+    #   "moat"         attack card deflected with a moat
+    #   "pile empty"   the last card was taken from a supply pile
+    #   "game over"    scores
+    #   "decision"     a player's choice, when they are being recorded
+    #                  (see replay.py)
+    def emit( self, kind, player = None, **data ):
+        if not self.listeners:
+            return
 
-# max spend is the upper limit of cards to display
-# and determines which cards are available for purchase on this buy
-# return whether or not someone bought a card
-def buyCard( destinationDeck, player, supply, maxSpend, freeCard = False ):
-    print "\nLet's go shopping!\n"
+        if player is not None:
+            player = player.name
 
-    if not freeCard:
-        if ( player.spendBonus + player.hand.getCoin() ) == 1:
-            if player.numBuys == 1:
-                print "You have %d coin and %d buy remaining.\n" % \
-                      (player.spendBonus + player.hand.getCoin(),
-                       player.numBuys )
-            else:
-                print "You have %d coin and %d buys remaining.\n" % \
-                      (player.spendBonus + player.hand.getCoin(),
-                       player.numBuys )
-        else:
-            if player.numBuys == 1:
-                print "You have %d coins and %d buy remaining.\n" % \
-                      (player.spendBonus + player.hand.getCoin(),
-                       player.numBuys)
-            else:
-                print "You have %d coins and %d buys remaining.\n" % \
-                      (player.spendBonus + player.hand.getCoin(),
-                       player.numBuys)
-    else:
-        print "Choose any card shown below."
-        
-    for i in range( maxSpend + 1 ):
+        event = Event( kind, player, data )
+        for listener in self.listeners:
+            listener( event )
 
-        cardChoices = []
-        for deck in supply.decks.values():
-            if deck.empty():
-                continue
+    # deal everyone their starting deck and first hand
+    def start( self ):
+        self.started = True
+        self.emit( "game start",
+                   players = [ player.name for player in self.players ],
+                   kingdom = self.supply.kingdomCards,
+                   seed = self.seed )
 
-            card = deck.peek()
+        for player in self.players:
 
-            if card.cost == i:
-                cardChoices.append( card.displayName )
-                
-        if len( cardChoices ) > 0:
-            if i == 1:
-                print " %d coin : " % i,
-            else:
-                print " %d coins: " % i,
-            for thisCard in cardChoices:
-                print "%s " % thisCard,
-            print
+            # there's no great reason for doing it this way
+            # starting copper is taken from the supply
+            # coin card counts, at least, represent the actual
+            # number of cards in the basic set
+            for j in range(7):
+                try:
+                    player.deck.add( self.supply.take( "copper" ) )
+                except ValueError:
+                    print "Copper supply is empty during setup."
+                    raise SystemExit()
 
-    while True:
-        cardName = raw_input("\nName of card to buy (q to quit)> ")
+            # just make a copy of an estate from the starting
+            # supply and copy the copy.  This keeps the estate
+            # card counts correct for the start of the game
+            estate = self.supply.shortcut["estate"]
+            for j in range(3):
+                player.deck.add( estate )
 
-        if cardName == "q":
-            break
-        try:
-            card = supply.shortcut[cardName]
-            break
-        except KeyError:
-            print "\nThat card name is not valid."
+            player.deck.shuffle( self.rng )
+            self.emit( "shuffle", player, cards = len( player.deck ) )
 
-    if cardName == "q":
-        return False
+            # deal me a new one partna
+            player.drawCards( self, 5, silent = True )
+
+    # play until the game is over, returns each player's VP
+    def play( self ):
+        if not self.started:
+            self.start()
+
+        while not self.isOver():
+            self.playTurn()
+
+        return self.finish()
+
+    def playTurn( self ):
+        player = self.players[ self.currentPlayer ]
+
+        self.startTurn( player )
+        self.finishTurn( player )
+
+    def startTurn( self, player ):
+        player.numHands += 1
+        player.numBuys = 1
+        player.numActions = 0
+        player.spendBonus = 0
+
+        if self.hasAction( player ):
+            player.numActions = 1
+
+        self.emit( "turn", player, hand = player.numHands )
+
+    # The rest of the turn after startTurn().  Everything done between
+    # startTurn() and the player's first decision of the turn can
+    # safely be done twice, so a copy of the game taken at that
+    # decision can play the turn again from here (see mcts.py).
+    def finishTurn( self, player ):
+        self.resolveDelayedAttacks( player )
+        self.actionPhase( player )
+        self.buyPhase( player )
+        self.cleanup( player )
+
+        self.numTurns += 1
+        self.currentPlayer = ( self.currentPlayer + 1 ) % len( self.players )
+
+    def actionPhase( self, player ):
+        while (player.numActions > 0 and self.hasAction( player ) and
+               not self.isOver()):
+
+            card = player.decisions.chooseAction( self, player )
+
+            # asking for a card that has already been taken back this
+            # turn would just fail again
+            if card is None or card.name in self.turn.canceled:
+                break
+
+            self.playAction( player, card )
+
+    def buyPhase( self, player ):
+        while (player.numBuys > 0 and player.getCoin() > 0 and
+               not self.isOver()):
+
+            card = player.decisions.chooseBuy( self, player,
+                                               player.getCoin() )
+            if card is None or not self.buyCard( player, card ):
+                break
+
+    def cleanup( self, player ):
+        # Feast card is a special case--
+        # it gets trashed after it is used
+        feast = self.supply.shortcut.get( "feast" )
+        while player.inPlay.contains( feast ):
+            player.inPlay.remove( feast )
+            self.emit( "trash", player, card = feast.name )
+
+        player.discard.extend( player.inPlay )
+        player.inPlay = Deck()
+        self.turn.numThroneRooms = 0
+        self.turn.chainingThroneRooms = False
+        self.turn.canceled = []
+
+        player.discard.extend( player.hand )
+        player.hand = Deck()
+
+        # deal me another
+        player.drawCards( self, 5, silent = True )
+
+    def hasAction( self, player ):
+        for card in player.hand:
+            if card.action:
+                return True
 
-    # prevent players from buying curses
-    if card.name == "curse":
-        print "\nYou don't really want a %s" % card.displayName
         return False
 
-    try:
-        if supply.decks[card.name].empty():
-            print "That deck is empty."
+    # Play an action card from player's hand.  Returns False if the
+    # card couldn't be played, in which case it goes back in the hand.
+    def playAction( self, player, card ):
+        if not card.action or not player.hand.contains( card ):
             return False
-    except KeyError:
-        print "That card is not available in this game."
-        return False
 
-    # get the card
-    card = supply.decks[card.name].deal()
+        # toggle off the throne room chain
+        if card.name != "throne room":
+            self.turn.chainingThroneRooms = False
 
-    # any maxSpend restriction for this "buy"
-    if card.cost > maxSpend:
-        print "That card is not available for this transaction."
-        return False
+        # take the card from the hand so it can't be used
+        # again during this turn
+        player.hand.remove( card )
+        player.inPlay.add( card )
+        self.emit( "play", player, card = card.name )
 
-    # enough coin or free card?
-    if (( player.spendBonus + player.hand.getCoin() ) >= card.cost or
-        freeCard ):
-            
-        destinationDeck.add( card )
-        print "\n%s bought a %s.\n" % (player.name, card.displayName)
-
-        # if they get this "buy" due to another card (ie. remodel)
-        # then it doesn't cost them one of their buys or end
-        # their actions this turn
-        if freeCard:
-            return True
+        # resolve the card
+        try:
+            card.play( player, self )
+            player.numActions -= 1
+        except Error as e:
+            player.inPlay.remove( card )
+            player.hand.add( card )
+            self.turn.canceled.append( card.name )
+            self.emit( "cancel", player, card = card.name, reason = str( e ) )
+
+            return False
+
+        # resolve double play for Throne Room
+        # we toggle the bool off when the chain of
+        # throne rooms is finished being played
+        if (not self.turn.chainingThroneRooms and
+            self.turn.numThroneRooms > 0):
+            self.turn.numThroneRooms -= 1
+
+            # do it again
+            # second play shouldn't decrement numActions
+            self.emit( "replay", player, card = card.name )
+            try:
+                card.play( player, self )
+            except Error:
+                pass
+
+        return True
+
+    # None if card can be bought or gained for maxCost, otherwise the
+    # reason why not
+    def checkPurchase( self, card, maxCost ):
+
+        # prevent players from buying curses
+        if card.name == "curse":
+            return "You don't really want a %s" % card.displayName
+
+        if card.name not in self.supply.decks:
+            return "That card is not available in this game."
+
+        if self.supply.decks[card.name].empty():
+            return "That deck is empty."
+
+        if card.cost > maxCost:
+            return "You don't have enough for that."
+
+        return None
+
+    # The legal answers when player is asked method (a Decisions
+    # method name) with args, as a bitmask (see BITS): the actions in
+    # hand worth playing, the cards within reach with a pile left to
+    # buy or gain, the cards in hand to discard or trash (only copper
+    # and silver with ore left for a mine), the treasures a thief
+    # turned up, PASS where None will do and PASS and YES for the
+    # questions.  Quicker than trying cards one at a time.
+    def legalMask( self, player, method, args ):
+        if method in QUESTIONS:
+            return BITS[PASS] | BITS[YES]
+
+        if method == "chooseAction":
+            mask = BITS[PASS]
+            for card in player.hand:
+                if (card.action and card.name not in self.turn.canceled and
+                    card.playable( player, self )):
+                    mask |= BITS[card.id]
+            return mask
+
+        if method in ["chooseBuy", "chooseGain"]:
+            return self.supply.affordableMask( args[0] ) | BITS[PASS]
+
+        if method == "chooseDiscard":
+            # there's no saying no to a militia
+            return player.hand.getMask()
+
+        if method == "chooseTrash" and args[0] == "mine":
+            return ( self.supply.shortcut["mine"].oreMask( player, self ) |
+                     BITS[PASS] )
+
+        if method in ["chooseCellarDiscard", "chooseTrash"]:
+            return player.hand.getMask() | BITS[PASS]
+
+        if method == "chooseThiefTrash":
+            mask = BITS[PASS]
+            for card in args[1]:
+                mask |= BITS[card.id]
+            return mask
+
+        raise ValueError( "no such decision: %s" % method )
+
+    # legalMask() as a list of card ids, PASS and YES, lowest first
+    def legalChoices( self, player, method, args ):
+
+        return maskIds( self.legalMask( player, method, args ))
+
+    # the answer to method that choiceId (from legalMask) stands for
+    def decodeChoice( self, method, choiceId ):
+        if method in QUESTIONS:
+            return choiceId == YES
+        if choiceId == PASS:
+            return None
+
+        return self.supply.shortcut[ CARD_NAMES[choiceId] ]
+
+    # Every way player could play a chapel: the cards trashed as a
+    # sorted tuple of up to 4 card ids from their hand, the empty
+    # tuple (which takes the chapel back) first.
+    def chapelTrashes( self, player ):
+        counts = [ ( cardId, min( player.hand.count(
+                        self.supply.shortcut[ CARD_NAMES[cardId] ] ), 4 ))
+                   for cardId in maskIds( player.hand.getMask() ) ]
+
+        trashes = [ () ]
+        for (cardId, n) in counts:
+            trashes = [ trash + ( cardId, ) * k for trash in trashes
+                        for k in range( min( n, 4 - len( trash )) + 1 ) ]
+
+        return sorted( trashes, key = lambda trash: ( len( trash ), trash ))
+
+    # Every ( trashed, gained ) pair of card ids player could make with
+    # source, "remodel" or "mine", from their hand.  A remodel may gain
+    # nothing, gained PASS.
+    def upgrades( self, player, source ):
+        if source == "mine":
+            ore = self.supply.shortcut["mine"].ore
+            return [ ( cardId, CARD_IDS[ ore[ CARD_NAMES[cardId] ]] )
+                     for cardId in maskIds( self.supply.shortcut["mine"].
+                                            oreMask( player, self )) ]
+
+        pairs = []
+        for cardId in maskIds( player.hand.getMask() ):
+            cost = self.supply.shortcut[ CARD_NAMES[cardId] ].cost
+            pairs.extend( ( cardId, gained ) for gained in maskIds(
+                self.supply.affordableMask( cost + 2 ) | BITS[PASS] ))
+
+        return pairs
+
+    # buy card with the coin in player's hand, returns whether they did
+    def buyCard( self, player, card ):
+        if self.checkPurchase( card, player.getCoin() ):
+            return False
+
+        card = self.supply.take( card.name )
+        player.discard.add( card )
+        self.emit( "buy", player, card = card.name )
 
         player.numBuys -= 1
         player.numActions = 0
@@ -1506,7 +2052,7 @@ def buyCard( destinationDeck, player, supply, maxSpend, freeCard = False ):
             totalToDeduct = 0
 
         # try to spend gold, then silver, then copper
-        cardsToRemove = [] # coin to remove from hand        
+        cardsToRemove = [] # coin to remove from hand
 
         for moneyCard in player.hand:
             if (moneyCard.name in ["gold", "silver", "copper"] and
@@ -1521,66 +2067,549 @@ def buyCard( destinationDeck, player, supply, maxSpend, freeCard = False ):
 
         return True
 
-    else:
-        print "You don't have enough for that."        
-        supply.decks[card.name].add( card )
+    # Let player choose a card costing up to maxCost to gain into their
+    # discard pile.  Unlike a buy this doesn't cost them one of their
+    # buys or end their actions this turn.  Returns whether they did.
+    def gainCard( self, player, maxCost ):
+        card = player.decisions.chooseGain( self, player, maxCost )
+        if card is None or self.checkPurchase( card, maxCost ):
+            return False
+
+        card = self.supply.take( card.name )
+        player.discard.add( card )
+        self.emit( "gain", player, card = card.name, to = "discard" )
+
+        return True
+
+    # does other have a moat in hand to deflect attackCard?
+    def isDefended( self, other, attackCard ):
+        if other.hand.contains( self.supply.shortcut.get( "moat" )):
+            self.emit( "moat", other, card = attackCard.name )
+            return True
 
-    return False
+        return False
 
-def handleDelayedAttacks( turn, player, supply ):
+    def resolveDelayedAttacks( self, player ):
 
         # get rid of finished attacks
         finishedAttacks = []
-        for attack in turn.attacksInPlay:
+        for attack in self.turn.attacksInPlay:
             if attack.playerName == player.name:
                 finishedAttacks.append( attack )
 
         for attack in finishedAttacks:
-            turn.attacksInPlay.remove( attack )
+            self.turn.attacksInPlay.remove( attack )
+
+        for attack in self.turn.attacksInPlay:
+            if attack.attackName != "militia":
+                continue
+
+            if self.isDefended( player, self.cardFactory.create( "militia" )):
+                continue
+
+            while len( player.hand ) > 3:
+                discardCard = player.decisions.chooseDiscard(
+                    self, player, attack.playerName )
+
+                if not player.hand.contains( discardCard ):
+                    discardCard = player.hand.peek()
+
+                player.hand.remove( discardCard )
+                player.discard.add( discardCard )
+                self.emit( "discard", player, card = discardCard.name )
+
+    # A copy of the game as it stands, with no listeners.  The players'
+    # decisions objects are shared with this game.
+    #
+    # With an observer (one of the players) the copy is the game as
+    # that player could imagine it: everything they can't see is
+    # shuffled with rng (default: the random module) rather than
+    # copied.  Their own deck is shuffled, and every other player's
+    # hand and deck are pooled, shuffled and dealt back out in the same
+    # sizes.  Discard piles and cards in play are public.  The copy's
+    # own rng is reseeded from rng as well, since the shuffles still
+    # to come are just as unknown.  A search bot can play out many such
+    # copies to average over what it doesn't know.
+    def clone( self, observer = None, rng = None ):
+        game = shallowCopy( self )
+        game.players = [ player.clone() for player in self.players ]
+        game.supply = self.supply.clone()
+        game.supply.emptyListeners.append( game.pileEmptied )
+        game.turn = self.turn.clone()
+        game.listeners = []
+
+        if observer is None:
+            # skip Random's own (slow) seeding, setstate replaces it
+            game.rng = random.Random.__new__( random.Random )
+            game.rng.setstate( self.rng.getstate() )
+        else:
+            rng = rng or random
+            game.resample( self.players.index( observer ), rng )
+            game.rng = random.Random( rng.getrandbits( 64 ))
+
+        return game
+
+    # shuffle what the player at index observer can't see, see clone()
+    def resample( self, observer, rng ):
+        for i in range( len( self.players )):
+            player = self.players[i]
+
+            if i == observer:
+                cards = list( player.deck )
+                rng.shuffle( cards )
+                player.deck = Deck()
+                player.deck.extend( cards )
+                continue
+
+            cards = list( player.hand ) + list( player.deck )
+            rng.shuffle( cards )
+            handSize = len( player.hand )
+            player.hand = Deck()
+            player.hand.extend( cards[:handSize] )
+            player.deck = Deck()
+            player.deck.extend( cards[handSize:] )
+
+    def pileEmptied( self, cardName ):
+        self.emit( "pile empty", card = cardName )
+
+    def getEmptyPiles( self ):
+
+        return list( self.supply.emptyPiles )
+
+    def isOver( self ):
+
+        return self.supply.isGameOver()
+
+    # score the game, returns each player's VP in turn order
+    def finish( self ):
+        scores = [ player.allCards().getVP() for player in self.players ]
+        self.emit( "game over",
+                   scores = zip( [ player.name for player in self.players ],
+                                 scores ))
+
+        return scores
+
+
+
+def showSupplyCounts( supply ):
+
+    print "\n%2d %s" % \
+        (len( supply.decks["copper"] ),
+         supply.shortcut["copper"].displayName )
+
+    print "%2d %s" % \
+        (len( supply.decks["silver"] ),
+         supply.shortcut["silver"].displayName )
+
+    print "%2d %s" % \
+        (len( supply.decks["gold"] ),
+         supply.shortcut["gold"].displayName )
+
+    for( deckName, deck ) in supply.decks.items():
+        if deckName in ["copper", "silver", "gold",
+                        "estate", "duchy", "province"]:
+            continue
+        print "%2d %s" % \
+              (len( deck ),
+               supply.shortcut[deckName].displayName)
+
+    print "%2d %s" % \
+        (len( supply.decks["estate"] ),
+         supply.shortcut["estate"].displayName )
+
+    print "%2d %s" % \
+        (len( supply.decks["duchy"] ),
+         supply.shortcut["duchy"].displayName )
+
+    print "%2d %s" % \
+        (len( supply.decks["province"] ),
+         supply.shortcut["province"].displayName )
+
+
+class ConsoleView:
+    # Prints the events of a hot-seat game to the terminal.
+    def __init__( self, game ):
+        self.game = game
+
+    def __call__( self, event ):
+        handler = getattr( self, "show" + event.kind.title().replace( " ", "" ),
+                           None )
+        if handler:
+            handler( event.playerName, **event.data )
+
+    def __card( self, cardName ):
+        card = self.game.supply.shortcut.get( cardName )
+        if card is None:
+            return cardName
+
+        return card.displayName
+
+    def showGameStart( self, playerName, players, kingdom, seed ):
+        print "Game seed: %d" % seed
 
-        for attack in turn.attacksInPlay:
-            if attack.attackName == "militia":
-                print "\n%s's militia card is in play." % attack.playerName
+    def showTurn( self, playerName, hand ):
+        print "\n+++++++++++++++++++++++++++++++++++++++++++++++++++"
 
-                if player.hand.contains( supply.shortcut["moat"] ):
-                    print "You deflect the attack with the moat.\n"
+        emptyDeckNames = self.game.getEmptyPiles()
+        if emptyDeckNames:
+            print "These kingdom card decks are now empty: ", emptyDeckNames
 
-                elif len( player.hand ) <= 3:
-                    print "You have 3 or less cards in hand already."
+    def showShuffle( self, playerName, cards ):
+        print "====> %s shuffles %d cards." % (playerName, cards)
 
+    def showNoCards( self, playerName ):
+        print "No more cards to deal"
+
+    def showDraw( self, playerName, card, silent = False ):
+        if not silent:
+            print "%s draws %s" % (playerName, self.__card( card ))
+
+    def showPlay( self, playerName, card ):
+        print "\n%s plays %s." % (playerName, self.__card( card ))
+
+    def showReplay( self, playerName, card ):
+        print "\nThrone Room active, re-playing %s" % self.__card( card )
+
+    def showCancel( self, playerName, card, reason ):
+        if reason:
+            print "\n%s" % reason
+
+    def showBuy( self, playerName, card ):
+        print "\n%s bought a %s.\n" % (playerName, self.__card( card ))
+
+    def showGain( self, playerName, card, to ):
+        if to == "deck":
+            print "%s gains a %s on top of their deck." % \
+                  (playerName, self.__card( card ))
+        elif to == "hand":
+            print "%s gains a %s in hand." % \
+                  (playerName, self.__card( card ))
+        else:
+            print "%s gains a %s." % (playerName, self.__card( card ))
+
+    def showDiscard( self, playerName, card ):
+        print "%s discards %s." % (playerName, self.__card( card ))
+
+    def showDiscardDeck( self, playerName, cards ):
+        print "%s discards deck." % playerName
+
+    def showTrash( self, playerName, card ):
+        print "%s trashes %s." % (playerName, self.__card( card ))
+
+    def showTopdeck( self, playerName, card ):
+        print "%s's %s goes on top of their deck." % \
+              (playerName, self.__card( card ))
+
+    def showReveal( self, playerName, card ):
+        print "%s reveals %s." % (playerName, self.__card( card ))
+
+    def showAttack( self, playerName, card ):
+        if card == "militia":
+            print "\nIn turn, each other player will discard down to 3 cards."
+
+    def showMoat( self, playerName, card ):
+        print "%s deflects the %s with a moat." % \
+              (playerName, self.__card( card ))
+
+    def showPileEmpty( self, playerName, card ):
+        print "The %s supply is now empty." % self.__card( card )
+
+    def showGameOver( self, playerName, scores ):
+        if self.game.supply.decks["province"].empty():
+            print "The province deck is empty."
+
+        emptyDeckNames = self.game.getEmptyPiles()
+        if emptyDeckNames:
+            print "These kingdom card decks are now empty: ", emptyDeckNames
+
+        print "********** GAME OVER **********"
+        for i in range( len( scores )):
+            print "Player: %d *%s* VP: %d" % \
+                  (i + 1, scores[i][0], scores[i][1])
+        print "*******************************"
+
+
+class ConsoleDecisions( Decisions ):
+    # Decisions for a human at the terminal, one instance can serve
+    # every player in a hot-seat game.
+    def __init__( self ):
+        # menu task chosen during the action phase which carries over to
+        # the buy phase, as (player, hand number, task)
+        self.__task = None
+
+    def __status( self, game, player ):
+        print "\n%s, your turn.  (%d/%d)\n" % \
+              (player.name, player.deck.getNumShuffles(), player.numHands)
+
+        print "Hand: %s" % (player.hand)
+
+        if player.getCoin() == 1:
+            print "Actions: %d  Buys: %d  Spend: %d coin\n" % \
+                  (player.numActions,
+                   player.numBuys,
+                   player.getCoin())
+        else:
+            print "Actions: %d  Buys: %d  Spend: %d coins\n" % \
+                  (player.numActions,
+                   player.numBuys,
+                   player.getCoin())
+
+    # show the turn menu until the player picks (a)ction, (b)uy or
+    # done (x), which is returned
+    def __menu( self, game, player, canAct ):
+        while True:
+            self.__status( game, player )
+
+            # set menu options which are always available
+            taskList = ["+", "x", "h", "c", "o"]
+
+            if canAct:
+                taskList.append( "a" )
+                print "(a) action"
+
+            if player.getCoin() > 0 and player.numBuys > 0:
+                taskList.append( "b" )
+                print "(b) buy card (into discard pile)"
+
+            print "(c) count cards"
+            print "(o) odds of the next hand"
+            print "(h) card help"
+            print "(x) done with turn"
+
+            while True:
+                task = raw_input("> ")
+                if task in taskList:
+                    break
                 else:
-                    print "You must discard down to 3 cards.\n"
+                    print "Huh?"
+
+            if task == "+":
+                dumpDecks( player )
+            elif task == "h":
+                cardHelp( game.supply )
+            elif task == "c":
+                showSupplyCounts( game.supply )
+            elif task == "o":
+                showNextHandOdds( player )
+            else:
+                return task
+
+    # ask for a card by name or shortcut, None if they quit
+    def __askCard( self, game, prompt ):
+        while True:
+            cardName = raw_input( prompt )
 
-                    while True:
-                        numCardsInHand = len( player.hand )
-                        print "\nHand: %s" % player.hand
+            if cardName == "q":
+                return None
 
-                        if numCardsInHand == 3:
-                            break
+            try:
+                return game.supply.shortcut[cardName]
+            except KeyError:
+                print "Huh?"
 
-                        cardName = raw_input("Card to discard> ")
-                        
-                        try:
-                            discardCard = supply.shortcut[cardName]
-                        except KeyError:
-                            print "Huh?"
-                            continue
+    def __askCardInHand( self, game, player, prompt ):
+        while True:
+            card = self.__askCard( game, prompt )
+            if card is None or player.hand.contains( card ):
+                return card
 
-                        if player.hand.contains( discardCard ):
-                            player.hand.remove( discardCard )
-                            player.discard.add( discardCard )
-                        else:
-                            print "Try discarding something from your hand."
+            print "You don't have that card in hand."
 
-            
-def selectKingdomCards():
+    def __askChoice( self, prompt, choices ):
+        while True:
+            choice = raw_input( prompt )
+            if choice in choices:
+                return choice
+
+    # max spend is the upper limit of cards to display
+    # and determines which cards are available for purchase
+    def __shop( self, game, player, maxSpend, freeCard ):
+        print "\nLet's go shopping!\n"
+
+        if not freeCard:
+            coin = player.getCoin()
+            if coin == 1:
+                coins = "coin"
+            else:
+                coins = "coins"
+
+            if player.numBuys == 1:
+                print "You have %d %s and %d buy remaining.\n" % \
+                      (coin, coins, player.numBuys)
+            else:
+                print "You have %d %s and %d buys remaining.\n" % \
+                      (coin, coins, player.numBuys)
+        else:
+            print "Choose any card shown below."
+
+        for i in game.supply.costs:
+            if i > maxSpend:
+                break
+
+            if i == 1:
+                print " %d coin : " % i,
+            else:
+                print " %d coins: " % i,
+            for thisCard in game.supply.cardsCosting( i ):
+                print "%s " % thisCard.displayName,
+            print
+
+        return self.__askCard( game, "\nName of card to buy (q to quit)> " )
+
+    def chooseAction( self, game, player ):
+        task = self.__menu( game, player, True )
+
+        while task == "a":
+            card = self.__askCard( game, "\nCard to play (q to quit)> " )
+
+            if card is None:
+                pass
+            elif not player.hand.contains( card ):
+                print "You don't have that card in hand."
+            elif not card.action:
+                print "That is not an action card."
+            elif card.name in game.turn.canceled:
+                print "You can't play that card again this turn."
+            else:
+                return card
+
+            task = self.__menu( game, player, True )
+
+        self.__task = ( player, player.numHands, task )
+        return None
+
+    def chooseBuy( self, game, player, coin ):
+        task = None
+        if self.__task and self.__task[:2] == ( player, player.numHands ):
+            task = self.__task[2]
+        self.__task = None
+
+        if task is None:
+            task = self.__menu( game, player, False )
+
+        while task == "b":
+            card = self.__shop( game, player, coin, False )
+
+            if card is not None:
+                reason = game.checkPurchase( card, coin )
+                if not reason:
+                    return card
+                print reason
+
+            task = self.__menu( game, player, False )
+
+        return None
+
+    def chooseGain( self, game, player, maxCost ):
+        while True:
+            card = self.__shop( game, player, maxCost, True )
+            if card is None:
+                return None
+
+            reason = game.checkPurchase( card, maxCost )
+            if not reason:
+                return card
+            print reason
+
+    def chooseDiscard( self, game, player, attackerName ):
+        print "\n%s's militia card is in play." % attackerName
+        print "You must discard down to 3 cards.\n"
+        print "\nHand: %s" % player.hand
+
+        while True:
+            card = self.__askCard( game, "Card to discard> " )
+            if player.hand.contains( card ):
+                return card
+
+            print "Try discarding something from your hand."
+
+    def chooseCellarDiscard( self, game, player ):
+        print "\nIn hand: %s" % player.hand
+
+        return self.__askCardInHand( game, player,
+                                     "Card name to discard (q to quit)> " )
+
+    def chooseTrash( self, game, player, source ):
+        print "\nIn hand: %s" % player.hand
+
+        return self.__askCardInHand( game, player,
+                                     "Select a card to trash (q to quit)> " )
+
+    def chooseDiscardDeck( self, game, player ):
+        if len( player.deck ) == 1:
+            prompt = "Discard the remainder of your deck? " \
+            "(%d card remains) (y/n) >" % len( player.deck )
+        else:
+            prompt = "Discard the remainder of your deck? " \
+            "(%d cards remain) (y/n) >" % len( player.deck )
+
+        return self.__askChoice( prompt, ["y", "n"] ) == "y"
+
+    def chooseSpyDiscard( self, game, player, victim, card ):
+        if victim is player:
+            print "%s, your next card is %s." % \
+                  (player.name, card.displayName)
+        else:
+            print "The top card on %s's deck is %s" % \
+                  (victim.name, card.displayName)
+
+        prompt = "(d)iscard it or (p)ut it back? >"
+        return self.__askChoice( prompt, ["d", "p"] ) == "d"
+
+    def chooseThiefTrash( self, game, player, victim, treasures ):
+
+        # colorama crashes cygwin if color is sent to
+        # raw input.  could fix this on cygwin by using
+        # name attribute instead of display name.
+        if len( treasures ) == 1:
+            prompt = "%s, trash the %s? (y/n)> " % \
+                     (player.name, treasures[0].displayName)
+            if self.__askChoice( prompt, ["y", "n"] ) == "y":
+                return treasures[0]
+            return None
+
+        prompt = "%s, choose one to trash (q trashes nothing)> " % \
+                 player.name
+        while True:
+            card = self.__askCard( game, prompt )
+            if card is None or card in treasures:
+                break
+            print "That's not one of the choices."
+
+        if card is None:
+            return None
+
+        # hand back the revealed card itself rather than the
+        # supply's copy
+        for treasure in treasures:
+            if treasure == card:
+                return treasure
+
+        return None
+
+    def chooseThiefGain( self, game, player, card ):
+        prompt = "(t)ake or (l)eave a %s?> " % card.displayName
+
+        return self.__askChoice( prompt, ["t", "l"] ) == "t"
+
+    def chooseLibraryKeep( self, game, player, card ):
+        print "%s draws %s" % (player.name, card)
+
+        return self.__askChoice( "(d)iscard or (k)eep?> ", ["d", "k"] ) == "k"
+
+
+DECK_LAYOUTS_FILE = "layouts.txt"
+
+# Read the kingdom layouts file, returns ( layoutNames, deckLayouts )
+# where both are keyed by the layout shortcut.  The random layout "r"
+# is always included, its cards are dealt by randomKingdomCards().
+def loadLayouts( fileName = DECK_LAYOUTS_FILE ):
 
-    DECK_LAYOUTS_FILE = "layouts.txt"
     layoutNames = {}
     deckLayouts = {}
 
     try:
-        with open(DECK_LAYOUTS_FILE, "r") as f:
+        with open(fileName, "r") as f:
 
             layout = f.readline()
             cards = f.readline()
@@ -1592,7 +2621,7 @@ def selectKingdomCards():
                 cards = cards.split(",")
                 cards = [ name.strip() for name in cards ]
                 deckLayouts[shortcut] = cards
-                
+
                 layout = f.readline()
                 cards = f.readline()
 
@@ -1605,12 +2634,51 @@ def selectKingdomCards():
         # Each layout must contain 10 action cards and do not include
         # VP cards, coins, or curse cards
         print "The file containing the deck layouts (%s) " \
-              "cannot be loaded." % DECK_LAYOUTS_FILE
-        
+              "cannot be loaded." % fileName
+
     # Let's just force the random layouts for now
     # since this option cannot be configured in the decks.txt
     # file. This will clobber any set using the shortcut "r"
     layoutNames["r"] = "random cards, require moat"
+    deckLayouts["r"] = None
+
+    return ( layoutNames, deckLayouts )
+
+
+# a fresh seed for a game that wasn't given one
+def newSeed():
+
+    return random.SystemRandom().getrandbits( 32 )
+
+
+# The seed of game gameNumber of a run of games seeded with seed.  The
+# two are hashed together rather than added, so runs with nearby seeds
+# don't play most of the same games (seed 2's game 0 isn't seed 1's
+# game 1), and any game's seed can be worked out on its own, by
+# whichever worker plays it.
+def gameSeed( seed, gameNumber ):
+    digest = hashlib.sha1( "%d:%d" % (seed, gameNumber) ).hexdigest()
+
+    return int( digest[:8], 16 )
+
+
+def randomKingdomCards( rng = random ):
+    cards = ["moat"]
+    cards.extend( rng.sample(
+            ["cellar", "woodcutter", "workshop", "smithy",
+             "remodel", "market", "mine", "militia",
+             "village", "moneylender", "chancellor",
+             "thief", "witch", "festival", "laboratory",
+             "feast", "adventurer", "bureaucrat", "spy",
+             "library", "council room", "throne room",
+             "gardens", "chapel"], 9 ))
+
+    return cards
+
+
+def selectKingdomCards( rng = random ):
+
+    ( layoutNames, deckLayouts ) = loadLayouts()
 
     while True:
         print "\nChoose a deck layout to play."
@@ -1622,15 +2690,7 @@ def selectKingdomCards():
 
         # A bit of a hack, but generate a new random set
         # here each time.
-        deckLayouts["r"] = ["moat"]
-        deckLayouts["r"].extend( random.sample(
-                ["cellar", "woodcutter", "workshop", "smithy", 
-                 "remodel", "market", "mine", "militia", 
-                 "village", "moneylender", "chancellor", 
-                 "thief", "witch", "festival", "laboratory", 
-                 "feast", "adventurer", "bureaucrat", "spy", 
-                 "library", "council room", "throne room",
-                 "gardens", "chapel"], 9 ))        
+        deckLayouts["r"] = randomKingdomCards( rng )
 
         while True:
             choice = raw_input( "\nLayout> " )
@@ -1669,145 +2729,59 @@ def showTitleFromFile():
     print title
 
 
-def isGameOver( players, turn, supply ):
-
-    
-    gameOver = False
-    if supply.decks["province"].empty():
-        print "The province deck is empty."
-        gameOver = True
-
-    # look at kingdom card decks
-    numEmptyDecks = 0
-    emptyDeckNames = []
-    for (deckName, deck) in supply.decks.items():
-        if deckName in ["estate", "duchy", "province",
-                        "copper", "silver", "gold", "curse"]:
-            continue
-        
-        if deck.empty():
-                numEmptyDecks += 1
-                emptyDeckNames.append( deckName )
-
-    if numEmptyDecks:
-        print "These kingdom card decks are now empty: ", emptyDeckNames
-
-    if numEmptyDecks >= 3:
-        gameOver = True
-
-    if gameOver:
-        for i in range( turn.numPlayers ):
-            # combine all the decks
-            players[i].deck.extend( players[i].inPlay )
-            players[i].deck.extend( players[i].hand )
-            players[i].deck.extend( players[i].discard )
-            
-            # lets count all the cards in each players hand
-            counts = {}
-            for card in players[i].deck:
-                if counts.has_key( card.name ):
-                    counts[card.name] += 1
-                else:
-                    counts[card.name] = 1
-
-            # for now, stop dumping out the final
-            # decks
-            #print "Player %s" % ( players[i].name)
-            #for (cardName, count) in counts.items():
-            #    print "     %s %d" % ( cardName, count )
-                    
-        print "********** GAME OVER **********"
-        for i in range( turn.numPlayers ):            
-            print "Player: %d *%s* VP: %d" % \
-                  (i + 1, players[i].name, players[i].deck.getVP())
-        print "*******************************"
-
-    return gameOver
-
-def playActionCard( player, players, turn, supply ):
-
-    while True:
-        card = raw_input("\nCard to play (q to quit)> ")
-
-        if card == "q":
-            return
-        
-        try:
-            card = supply.shortcut[card]
-            break
-        except KeyError:
-            print "Huh?"
-            continue
-                 
-    if not player.hand.contains( card ):
-        print "You don't have that card in hand."
-    else:
-
-        # get the card from hand so it can't be used
-        # again during this turn
-        cardInPlay = card
-
-        if not cardInPlay.action:
-            print "That is not an action card."
 
-        else:
-
-            # toggle off the throne room chain
-            if cardInPlay != ThroneRoom():
-                turn.chainingThroneRooms = False
-
-            # take the card from the hand
-            player.hand.remove( cardInPlay )
-
-            # immediately put the card into the inPlay deck
-            player.inPlay.add( cardInPlay )
-
-            # resolve the card
-            try:
-                cardInPlay.play( player, players, turn, supply )
-                player.numActions -= 1
-            except Error:
-                player.inPlay.remove( cardInPlay )
-                player.hand.add( cardInPlay )
-
-                return
-
-            # resolve double play for Throne Room
-            # we toggle the bool off when the chain of
-            # throne rooms is finished being played
-            if (not turn.chainingThroneRooms and
-                turn.numThroneRooms > 0):
-                turn.numThroneRooms -= 1
-
-                # do it again
-                # second play shouldn't decrement numActions
-                print "\nThrone Room active, re-playing %s" % \
-                      cardInPlay.displayName
-
-                try:
-                    cardInPlay.play( player, players, turn, supply )
-                except Error:
-                    pass
-                                    
-def main():
+def main( argv ):
+
+    parser = argparse.ArgumentParser(
+        prog = "dom.py",
+        description = "A command-line game based on the card game " \
+        "Dominion.  Use 'dom.py simulate -h' for bot simulations, " \
+        "'dom.py tournament -h' for every bot on every layout, " \
+        "'dom.py evolve -h' to breed a bot for a layout, " \
+        "'dom.py serve -h' to host games over the network, " \
+        "'dom.py selfplay -h' to write training data from bot games and " \
+        "'dom.py replay -h' to replay logged games." )
+    parser.add_argument( "-s", "--seed", type = int, default = None,
+                         help = "seed for the shuffles and random layout" )
+    parser.add_argument( "--log", metavar = "FILE",
+                         help = "write a log of the game to FILE" )
+    parser.add_argument( "--log-format", choices = ["jsonl", "binary"],
+                         default = "jsonl",
+                         help = "log file format (default: jsonl)" )
+    parser.add_argument( "-b", "--bot", action = "append", default = [],
+                         metavar = "STRATEGY",
+                         help = "add a computer player, e.g. mcts-parallel " \
+                         "(see bots.py), can be given more than once" )
+    args = parser.parse_args( argv )
+
+    import bots
+    for botName in args.bot:
+        if botName not in bots.STRATEGIES:
+            parser.error( "unknown bot %s, choose from %s" % \
+                          (botName, ", ".join( sorted( bots.STRATEGIES ))) )
+    if len( args.bot ) > 3:
+        parser.error( "at most 3 bots can play" )
 
     if colorama:
         colorama.init()
 
     showTitleFromFile()
 
-    random.seed(None)
+    seed = args.seed
+    if seed is None:
+        seed = newSeed()
 
     # create the players
+    maxPlayers = 4 - len( args.bot )
     while True:
-        numPlayers = raw_input("\nNumber of players (1-4)> ")
+        numPlayers = raw_input("\nNumber of players (1-%d)> " % maxPlayers)
         try:
             numPlayers = int(numPlayers)
         except ValueError:
             print "\nPlease enter a valid number."
             continue
 
-        if numPlayers > 0 and numPlayers < 5:
+        if numPlayers > 0 and numPlayers <= maxPlayers:
             break
 
     # set up the game decks
@@ -1815,221 +2789,63 @@ def main():
 
     if colorama:
         cardFactory.setColorCodes()
-    
-    supply = CardSupply( numPlayers, cardFactory )
 
     # choose kingdom cards to use
-    cardSet = selectKingdomCards() 
-    
-    supply.setKingdomCards( cardSet )
+    cardSet = selectKingdomCards( random.Random( seed ))
+
+    # everyone shares the terminal
+    decisions = ConsoleDecisions()
 
     players = []
     for i in range(numPlayers):
         print "\nPlayer ", i
         name = raw_input("Enter your name> ")
-        players.append( Player( name ) )
-
-    # set up the player's deck
-    print "\n"
-    for i in range(numPlayers):
-
-        # there's no great reason for doing it this way
-        # starting copper is taken from the supply
-        # coin card counts, at least, represent the actual
-        # number of cards in the basic set
-        for j in range(7):
-            copper = None
-            try:
-                copper = supply.decks["copper"].deal()
-            except ValueError:
-                print "Copper supply is empty during setup."
-                raise SystemExit()
-            players[i].deck.add( copper )
-
-        # just make a copy of an estate from the starting
-        # supply and copy the copy.  This keeps the estate
-        # card counts correct for the start of the game
-        estate = None
-        try:
-            estate = supply.decks["estate"].peek()
-        except ValueError:
-            print "Estate supply is empty during setup."
-            raise SystemExit()
-            
-        for j in range(3):
-            players[i].deck.add( estate )
-
-        players[i].deck.shuffle()
-        print "====> %s shuffles %d cards." % \
-              (players[i].name, len(players[i].deck))
-
-        # deal me a new one partna
-        players[i].drawCards( 5, silent = True )
-
-    isNextPlayer = True
-    currentPlayerNumber = 0
-
-    # now that there are actual card instances with play() methods
-    # I need a magical container to pass in to contain all the
-    # turn state that needs to be acted upon
-    turn = TurnState( numPlayers )
-
-    while True:
-
-        if currentPlayerNumber == turn.numPlayers:
-            currentPlayerNumber = 0
-        
-        player = players[currentPlayerNumber]
-
-        if isGameOver( players, turn, supply ):
-            break
-
-        # set menu options which are always available
-        taskList = ["+", "x", "h", "c"]
-
-        if isNextPlayer:
-            print "\n+++++++++++++++++++++++++++++++++++++++++++++++++++"
-            player.numHands += 1
-            player.numBuys = 1
-            player.numActions = 0
-            player.spendBonus = 0
-
-            for card in player.hand:
-                if card.action:
-                    player.numActions += 1
-                    break
-
-        # next action same hand (or new hand)
-        # always message whose turn it is first
-        print "\n%s, your turn.  (%d/%d)\n" % \
-              (player.name, player.deck.getNumShuffles(), player.numHands)
-        
-        print "Hand: %s" % (player.hand)
-        
-        if player.spendBonus + player.hand.getCoin() == 1:
-            print "Actions: %d  Buys: %d  Spend: %d coin\n" % \
-                  (player.numActions,
-                   player.numBuys,
-                   player.spendBonus + player.hand.getCoin())
-        else:
-            print "Actions: %d  Buys: %d  Spend: %d coins\n" % \
-                  (player.numActions,
-                   player.numBuys,
-                   player.spendBonus + player.hand.getCoin())            
-
-        # deal with attack cards in play
-        if isNextPlayer:
-            isNextPlayer = False
-            handleDelayedAttacks( turn, player, supply )
-
-        # add action menu option
-        if player.numActions > 0:
-            for card in player.hand:
-                if card.action:
-                    taskList.append( "a" )
-                    break
-
-        print
-            
-        if "a" in taskList:
-            print "(a) action"
+        players.append( Player( name, decisions ) )
 
-        if ((player.hand.getCoin() + player.spendBonus) > 0  and
-            player.numBuys > 0):
-            taskList.append( "b" )
-            print "(b) buy card (into discard pile)"
+    for i in range( len( args.bot )):
+        players.append( Player( "%s (bot %d)" % (args.bot[i], i + 1),
+                                bots.create( args.bot[i], seed + i )))
 
-        print "(c) count cards"
-        print "(h) card help"
-        print "(x) done with turn"
-                
-        while True:
-            task = raw_input("> ")
-            if task in taskList:
-                break
-            else:
-                print "Huh?"
-
-        if task == "b":
-            buyCard( player.discard, player, supply, 8 )
-        
-        if task == "+":
-            dumpDecks( player )
-
-        if task == "a":
-            playActionCard( player, players, turn, supply )
-
-            # out of actions?
-            if player.numActions == 0:
-                if "a" in taskList:
-                    taskList.remove( "a" )
-            
-        if task == "x":
-            # Feast card is a special case--
-            # it gets trashed after it is used
-            try:
-                while player.inPlay.contains( supply.shortcut["feast"] ):
-                    player.inPlay.remove( supply.shortcut["feast"] )
-            except KeyError:
-                pass
-                
-            player.discard.extend( player.inPlay )
-            player.inPlay = Deck()
-            turn.numThroneRooms = 0
-            turn.chainingThroneRooms = False
-            isNextPlayer = True
-
-        if task == "h":
-            cardHelp( supply.decks )
-
-        if task == "c":
-            
-            print "\n%2d %s" % \
-                (len( supply.decks["copper"] ),
-                 supply.shortcut["copper"].displayName )
-
-            print "%2d %s" % \
-                (len( supply.decks["silver"] ),
-                 supply.shortcut["silver"].displayName )
-
-            print "%2d %s" % \
-                (len( supply.decks["gold"] ),
-                 supply.shortcut["gold"].displayName )
-            
-            for( deckName, deck ) in supply.decks.items():
-                if deckName in ["copper", "silver", "gold",
-                                "estate", "duchy", "province"]:
-                    continue
-                print "%2d %s" % \
-                      (len( deck ),
-                       supply.shortcut[deckName].displayName)
-                
-            print "%2d %s" % \
-                (len( supply.decks["estate"] ),
-                 supply.shortcut["estate"].displayName )
-
-            print "%2d %s" % \
-                (len( supply.decks["duchy"] ),
-                 supply.shortcut["duchy"].displayName )
-
-            print "%2d %s" % \
-                (len( supply.decks["province"] ),
-                 supply.shortcut["province"].displayName )
-            
-
-
-
-        # clean up
-        if isNextPlayer:
-            player.discard.extend( player.hand )
-            player.hand = Deck()
+    print "\n"
+    game = Game( players, cardSet, cardFactory, seed )
+    game.listeners.append( ConsoleView( game ) )
 
-            # deal me another
-            player.drawCards( 5, silent = True )
+    log = None
+    if args.log:
+        import eventlog
+        import replay
+        log = eventlog.openLog( args.log, args.log_format )
+        game.listeners.append( log )
+        replay.recordDecisions( game )
 
-            # next players turn now
-            currentPlayerNumber += 1
+    try:
+        game.play()
+    finally:
+        if log:
+            log.close()
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["simulate"]:
+        import simulate
+        simulate.main( sys.argv[2:] )
+    elif sys.argv[1:2] == ["replay"]:
+        import replay
+        replay.main( sys.argv[2:] )
+    elif sys.argv[1:2] == ["tournament"]:
+        import tournament
+        tournament.main( sys.argv[2:] )
+    elif sys.argv[1:2] == ["evolve"]:
+        import evolve
+        evolve.main( sys.argv[2:] )
+    elif sys.argv[1:2] == ["serve"]:
+        import server
+        server.main( sys.argv[2:] )
+    elif sys.argv[1:2] == ["selfplay"]:
+        import selfplay
+        selfplay.main( sys.argv[2:] )
+    else:
+        # run the game in the dom module rather than __main__, so the
+        # cards and classes are the ones bots.py and replay.py know
+        import dom
+        dom.main( sys.argv[1:] )
@@ -0,0 +1,399 @@
+#!/usr/bin/python
+
+"""
+env.py: A dom.py game as a reinforcement learning environment.
+
+Env is one game at a time in the style of a Gym environment: reset()
+deals a new game against bots and plays on to the agent's first
+decision, step( action ) makes it and plays on to the next, returning
+( observation, reward, done, info ).  Every decision the rules leave
+to the agent's seat is a step, whatever the method asking (see
+dom.Decisions), so the agent plays the whole game.
+
+An action is an integer, NUM_ACTIONS of them:
+
+    0 .. NUM_CARDS - 1    the card of that dom.CARD_IDS id
+    PASS                  None, or no for a yes or no question
+    YES                   yes
+
+the bits of dom.Game.legalMask, and only some are legal at any one
+decision: legalMask() (also info["mask"]) says which.  A card to buy,
+gain, play, discard or trash is the card's id, a yes or no question
+(chancellor, spy, thief's gain, library) is YES or PASS.
+
+An observation is a float32 array of OBSERVATION_SIZE: the agent's
+cards by id in hand, deck, discard and in play, the supply piles by id
+(0 for piles not in the game), then actions, buys, spend bonus, coin
+and hands played, and last a one hot of the decision being asked
+(replay.DECISIONS order).
+
+The reward is 0 until the game ends, then 1 for a win, -1 for a loss
+and 0 for a tie for first.  Games that drag on are ended after
+maxTurns turns and scored as they stand.
+
+The engine asks for decisions in the middle of a turn rather than
+waiting to be told, so the turn is played again from a copy taken at
+its start with the answers so far whenever the agent answers, the way
+server.py plays for its clients.
+
+VectorEnv steps numEnvs games at once on vectorsim.py's arrays, with no
+dom.Game behind them: step( actions ) takes an array of actions, one
+per game, and returns the observations, rewards and dones stacked, the
+legal masks in info["mask"].  Observations and actions are the same as
+Env's, but the agent only chooses its buys.  It can buy the treasures
+and victory cards and one draw card (see vectorsim.DRAW_CARDS), which
+it plays whenever it has it, and the opponent is one bot vectorsim.py
+can play.  A game that ends is dealt again in the same step, so the
+observation for it is the new game's.
+
+Needs numpy, available() says whether it's there.
+
+"""
+
+import random
+
+import bots
+import dom
+import replay
+import vectorsim
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+NUM_CARDS = len( dom.CARD_NAMES )
+
+# the actions that aren't cards
+PASS = dom.PASS
+YES = dom.YES
+NUM_ACTIONS = YES + 1
+
+# the observation: a block of NUM_CARDS counts for each zone, the
+# counters, then the decision
+ZONES = ["hand", "deck", "discard", "inPlay", "supply"]
+COUNTERS = ["actions", "buys", "spendBonus", "coin", "hands"]
+SUPPLY = ZONES.index( "supply" ) * NUM_CARDS
+COUNTER = len( ZONES ) * NUM_CARDS
+DECISION = COUNTER + len( COUNTERS )
+OBSERVATION_SIZE = DECISION + len( replay.DECISIONS )
+
+# turns (all players') before a game is stopped and scored
+MAX_TURNS = 200
+
+cardFactory = dom.CardFactory()
+
+
+def available():
+
+    return numpy is not None
+
+
+class Pending( Exception ):
+    # The game got to a choice the agent hasn't made yet.  Not a
+    # dom.Error, which the engine catches itself.
+    pass
+
+
+# what player sees of game, asked method (None once the game is over)
+def observe( game, player, method ):
+    observation = numpy.zeros( OBSERVATION_SIZE, numpy.float32 )
+
+    zones = [ player.hand, player.deck, player.discard, player.inPlay ]
+    for zone in range( len( zones )):
+        for (cardName, n) in zones[zone].getCounts().iteritems():
+            observation[zone * NUM_CARDS + dom.CARD_IDS[cardName]] = n
+
+    for (cardName, pile) in game.supply.decks.iteritems():
+        observation[SUPPLY + dom.CARD_IDS[cardName]] = len( pile )
+
+    observation[COUNTER:DECISION] = [ player.numActions, player.numBuys,
+                                      player.spendBonus, player.getCoin(),
+                                      player.numHands ]
+    if method is not None:
+        observation[DECISION + replay.DECISIONS.index( method )] = 1
+
+    return observation
+
+
+# 1 if seat has the best score on its own, 0 if it shares it, else -1
+def outcome( scores, seat ):
+    best = max( scores )
+    if scores[seat] < best:
+        return -1.0
+    if list( scores ).count( best ) > 1:
+        return 0.0
+
+    return 1.0
+
+
+class EnvDecisions( dom.Decisions ):
+    # Every player's decisions in one attempt at a turn: answers the
+    # environment has already, then asks bots, or the agent by raising
+    # Pending.
+    def __init__( self, env ):
+        self.env = env
+        self.position = 0
+
+    def decide( self, method, game, player, args ):
+        env = self.env
+        position = self.position
+        self.position += 1
+
+        if position < len( env.answers ):
+            return env.answers[position]
+
+        seat = game.players.index( player )
+        if seat == env.seat:
+            env.asking = ( game, player, method, args )
+            raise Pending()
+
+        choice = getattr( env.bots[seat], method )( game, player, *args )
+        env.answers.append( choice )
+
+        return choice
+
+
+def makeDecider( method ):
+    def decider( self, game, player, *args ):
+
+        return self.decide( method, game, player, args )
+
+    return decider
+
+
+for method in replay.DECISIONS:
+    setattr( EnvDecisions, method, makeDecider( method ))
+
+
+class Env:
+    # Games on cardSet against opponents (bot names), the agent's seat
+    # going round from game to game.
+    def __init__( self, cardSet, opponents = ["bmu"], seed = None,
+                  maxTurns = MAX_TURNS ):
+        self.cardSet = cardSet
+        self.opponents = opponents
+        self.rng = random.Random( seed )
+        self.maxTurns = maxTurns
+        self.numGames = 0
+
+        self.game = None         # the game as the agent sees it now
+        self.snapshot = None     # the game at the start of this turn
+        self.answers = []        # the choices made this turn
+        self.asking = None       # ( game, player, method, args )
+        self.mask = None
+
+    def reset( self ):
+        numPlayers = len( self.opponents ) + 1
+        seed = self.rng.getrandbits( 31 )
+        self.seat = self.numGames % numPlayers
+        self.numGames += 1
+
+        names = list( self.opponents )
+        names.insert( self.seat, None )
+        self.bots = [ name and bots.create( name, seed + i )
+                      for (i, name) in enumerate( names ) ]
+
+        players = [ dom.Player( "%d" % i ) for i in range( numPlayers ) ]
+        game = dom.Game( players, self.cardSet, cardFactory, seed )
+        game.start()
+        self.snapshot = game
+        self.answers = []
+
+        return self.advance()[0]
+
+    # Play on until the agent has to answer or the game ends.  Returns
+    # what step() does.
+    def advance( self ):
+        while True:
+            game = self.snapshot.clone()
+            decisions = EnvDecisions( self )
+            for player in game.players:
+                player.decisions = decisions
+
+            try:
+                game.playTurn()
+            except Pending:
+                ( self.game, player, method, args ) = self.asking
+                self.mask = numpy.zeros( NUM_ACTIONS, numpy.bool_ )
+                self.mask[ self.game.legalChoices( player, method, args ) ] = 1
+
+                return ( observe( self.game, player, method ), 0.0, False,
+                         {"mask": self.mask} )
+
+            self.snapshot = game
+            self.answers = []
+            if game.isOver() or game.numTurns >= self.maxTurns:
+                return self.finish()
+
+    def finish( self ):
+        self.game = self.snapshot
+        self.asking = None
+        self.mask = numpy.zeros( NUM_ACTIONS, numpy.bool_ )
+        scores = self.game.finish()
+
+        return ( observe( self.game, self.game.players[self.seat], None ),
+                 outcome( scores, self.seat ), True,
+                 {"mask": self.mask, "scores": scores} )
+
+    def legalMask( self ):
+
+        return self.mask
+
+    def step( self, action ):
+        if self.asking is None:
+            raise dom.Error( "the game is over, reset() for another" )
+        if not 0 <= action < NUM_ACTIONS or not self.mask[action]:
+            raise dom.IllegalAction( "action %d isn't legal here" % action )
+
+        ( game, player, method, args ) = self.asking
+        self.asking = None
+        self.answers.append( game.decodeChoice( method, action ))
+
+        return self.advance()
+
+
+class AgentStrategy:
+    # The agent's side of a vectorsim.Batch: no buy rules, and the draw
+    # card it plays whenever it has one.
+    def __init__( self, drawCard, columns ):
+        self.rules = []
+        self.drawColumn = None
+        self.numDraws = 0
+        if drawCard is not None:
+            self.drawColumn = columns.index( drawCard )
+            self.numDraws = vectorsim.DRAW_CARDS[drawCard]
+
+
+class VectorEnv:
+    # numEnvs games on cardSet, the agent against the bot opponent,
+    # moving first in the even numbered games and second in the odd.
+    def __init__( self, cardSet, opponent = "bmu", numEnvs = 256,
+                  seed = None, maxRounds = MAX_TURNS / 2 ):
+        reason = vectorsim.unsupported( opponent )
+        if reason:
+            raise dom.Error( reason )
+
+        # the draw card drawing most, if the layout has one
+        drawCards = sorted( [ cardName for cardName in vectorsim.DRAW_CARDS
+                              if cardName in cardSet ],
+                            key = lambda cardName:
+                            vectorsim.DRAW_CARDS[cardName] )
+        self.drawCard = drawCards and drawCards[-1] or None
+
+        self.numEnvs = numEnvs
+        self.batch = vectorsim.Batch( [ opponent, opponent ], cardSet,
+                                      numEnvs, maxRounds,
+                                      numpy.random.RandomState( seed ),
+                                      drawCards[-1:] )
+        batch = self.batch
+        batch.strategies[0] = AgentStrategy( self.drawCard, batch.columns )
+
+        # column -> card id, and what the agent may buy by column
+        self.cardIds = numpy.array( [ dom.CARD_IDS[cardName]
+                                      for cardName in batch.columns ] )
+        self.buyable = numpy.array( [ cardName in vectorsim.BASIC_CARDS or
+                                      cardName == self.drawCard
+                                      for cardName in batch.columns ] )
+
+        # action -> column, -1 for PASS and the cards not in a column
+        self.actionColumns = numpy.empty( NUM_ACTIONS, numpy.int16 )
+        self.actionColumns.fill( -1 )
+        self.actionColumns[self.cardIds] = numpy.arange(
+            len( batch.columns ))
+
+        # the piles no one here buys stay as they were set up
+        game = dom.Game( [ dom.Player( "1" ), dom.Player( "2" ) ], cardSet,
+                         cardFactory, 0 )
+        self.supply = numpy.zeros( NUM_CARDS, numpy.float32 )
+        for (cardName, pile) in game.supply.decks.iteritems():
+            self.supply[dom.CARD_IDS[cardName]] = len( pile )
+
+        self.rounds = numpy.zeros( numEnvs, numpy.int32 )
+        self.playing = None
+        self.mask = None
+
+    # deal the games in rows again, and play the opponent's first turn
+    # in those the agent moves second in
+    def restart( self, rows ):
+        self.batch.start( rows )
+        self.rounds[rows] = 0
+
+        second = rows[rows % 2 == 1]
+        self.batch.playTurn( 1, second, 1 )
+
+    # start the agent's turn in every game, returns the observations
+    def startTurns( self ):
+        batch = self.batch
+        rows = numpy.arange( self.numEnvs )
+        self.playing = batch.startTurn( 0, rows )
+
+        hand = batch.hand[0]
+        coin = hand.dot( batch.values )
+        inPlay = numpy.zeros( hand.shape, numpy.int16 )
+        if batch.strategies[0].drawColumn is not None:
+            inPlay[self.playing, batch.strategies[0].drawColumn] = 1
+        deck = batch.owned[0] - hand - batch.discard[0] - inPlay
+
+        observations = numpy.zeros( ( self.numEnvs, OBSERVATION_SIZE ),
+                                    numpy.float32 )
+        zones = [ hand, deck, batch.discard[0], inPlay ]
+        for zone in range( len( zones )):
+            observations[:, zone * NUM_CARDS + self.cardIds] = zones[zone]
+        observations[:, SUPPLY:SUPPLY + NUM_CARDS] = self.supply
+        observations[:, SUPPLY + self.cardIds] = batch.supply
+
+        observations[:, COUNTER + COUNTERS.index( "buys" )] = 1
+        observations[:, COUNTER + COUNTERS.index( "coin" )] = coin
+        observations[:, COUNTER + COUNTERS.index( "hands" )] = \
+            self.rounds + 1
+        observations[:, DECISION + replay.DECISIONS.index( "chooseBuy" )] = 1
+
+        # what chooseBuys lets a rule buy
+        columnMask = ( self.buyable & ( coin[:, None] > 0 ) &
+                       ( coin[:, None] >= batch.costs ) &
+                       ( batch.supply > 0 ))
+        self.mask = numpy.zeros( ( self.numEnvs, NUM_ACTIONS ), numpy.bool_ )
+        self.mask[:, self.cardIds] = columnMask
+        self.mask[:, PASS] = True
+
+        return observations
+
+    def reset( self ):
+        self.restart( numpy.arange( self.numEnvs ))
+
+        return self.startTurns()
+
+    def legalMask( self ):
+
+        return self.mask
+
+    def step( self, actions ):
+        batch = self.batch
+        actions = numpy.asarray( actions )
+        rows = numpy.arange( self.numEnvs )
+        if not self.mask[rows, actions].all():
+            raise dom.IllegalAction( "illegal actions in games %s" % \
+                                     rows[~self.mask[rows, actions]] )
+
+        batch.finishTurn( 0, rows, self.playing, self.actionColumns[actions] )
+        self.rounds += 1
+
+        # the opponent's turn where the game goes on
+        province = batch.supply[:, batch.province]
+        over = ( province == 0 ) | ( self.rounds >= batch.maxRounds )
+        rows = rows[~over]
+        batch.playTurn( 1, rows, self.rounds[rows] + rows % 2 )
+        over[rows] = province[rows] == 0
+
+        scores = batch.owned.dot( batch.vps )
+        rewards = numpy.sign( scores[0] - scores[1] ).astype( numpy.float32 )
+        rewards[~over] = 0.0
+
+        done = numpy.flatnonzero( over )
+        if len( done ):
+            self.restart( done )
+
+        return ( self.startTurns(), rewards, over,
+                 {"mask": self.mask, "scores": scores.T} )
@@ -0,0 +1,306 @@
+#!/usr/bin/python
+
+"""
+eventlog.py: Game log files.
+
+A log is the stream of dom.Event records from one or more games, each
+game starting with its "game start" event.  Logs come in two formats:
+
+jsonl   One JSON object per line: {"kind": ..., "player": ...} plus the
+        event's data.  Easy to read, grep and load anywhere.
+
+binary  A compact length-prefixed encoding for bulk simulation output.
+        The file starts with MAGIC, then every event is a varint byte
+        count followed by that many bytes: the kind, the player and the
+        data fields.  Kinds, field names, card names and player names
+        are written as small table indexes rather than strings.
+
+A writer is a game listener, game.listeners.append( writer ).  Writers
+buffer what they write and only hand it to the file in large chunks, so
+logging doesn't cost a write (or a flush) per event.  Call close() when
+done.  readEvents() reads either format back.
+
+"""
+
+import json
+
+import dom
+
+
+MAGIC = "DOMLOG1\n"
+
+# write to the file once this much is buffered
+BUFFER_SIZE = 1 << 20
+
+FORMATS = ["jsonl", "binary"]
+
+# Everything the binary format writes as a table index.  Only ever add
+# to the end of these lists, old logs depend on the order.
+KINDS = ["game start", "turn", "shuffle", "no cards", "draw", "play",
+         "replay", "cancel", "buy", "gain", "discard", "discard deck",
+         "trash", "topdeck", "reveal", "attack", "moat", "pile empty",
+         "game over", "decision"]
+
+FIELDS = ["card", "cards", "silent", "reason", "to", "hand", "players",
+          "kingdom", "seed", "scores", "method", "choice"]
+
+# card names, and other strings that turn up a lot
+NAMES = ["adventurer", "bureaucrat", "cellar", "chancellor", "chapel",
+         "copper", "council room", "curse", "duchy", "estate", "feast",
+         "festival", "gardens", "gold", "laboratory", "library",
+         "market", "militia", "mine", "moat", "moneylender", "province",
+         "remodel", "silver", "smithy", "spy", "thief", "throne room",
+         "village", "witch", "woodcutter", "workshop",
+         "hand", "discard", "deck",
+         "chooseAction", "chooseBuy", "chooseCellarDiscard",
+         "chooseDiscard", "chooseDiscardDeck", "chooseGain",
+         "chooseLibraryKeep", "chooseSpyDiscard", "chooseThiefGain",
+         "chooseThiefTrash", "chooseTrash"]
+
+KINDS_INDEX = dict( zip( KINDS, range( len( KINDS ))))
+FIELDS_INDEX = dict( zip( FIELDS, range( len( FIELDS ))))
+NAMES_INDEX = dict( zip( NAMES, range( len( NAMES ))))
+
+# value tags for the binary format
+( NONE, FALSE, TRUE, INT, NAME, STRING, LIST ) = range( 7 )
+
+
+class LogWriter:
+    # Buffers encoded events and writes them to f in big chunks.
+    def __init__( self, f ):
+        self.file = f
+        self.__buffer = []
+        self.__size = 0
+
+    def __call__( self, event ):
+        self.append( self.encode( event ))
+
+    # add already encoded events to the log
+    def append( self, data ):
+        self.__buffer.append( data )
+        self.__size += len( data )
+        if self.__size >= BUFFER_SIZE:
+            self.flush()
+
+    def flush( self ):
+        if self.__buffer:
+            self.file.write( "".join( self.__buffer ))
+            self.__buffer = []
+            self.__size = 0
+
+    def close( self ):
+        self.flush()
+        self.file.close()
+
+
+class JsonLogWriter( LogWriter ):
+    def encode( self, event ):
+        record = { "kind": event.kind, "player": event.playerName }
+        record.update( event.data )
+
+        return json.dumps( record, separators = (",", ":") ) + "\n"
+
+
+class BinaryLogWriter( LogWriter ):
+    # The players of the game being written, name -> table index, as
+    # given by its "game start" event.
+    def __init__( self, f, header = True ):
+        LogWriter.__init__( self, f )
+        self.__players = {}
+        if header:
+            self.append( MAGIC )
+
+    def encode( self, event ):
+        if event.kind == "game start":
+            self.__players = dict( zip( event.data["players"],
+                                        range( len( event.data["players"] ))))
+
+        out = []
+        encodeName( out, event.kind, KINDS_INDEX )
+        encodeName( out, event.playerName, self.__players )
+
+        encodeVarint( out, len( event.data ))
+        for (field, value) in event.data.iteritems():
+            encodeName( out, field, FIELDS_INDEX )
+            encodeValue( out, value )
+
+        record = "".join( out )
+        out = []
+        encodeVarint( out, len( record ))
+        out.append( record )
+
+        return "".join( out )
+
+
+def encodeVarint( out, n ):
+    while n > 0x7f:
+        out.append( chr( 0x80 | ( n & 0x7f )))
+        n >>= 7
+    out.append( chr( n ))
+
+
+def decodeVarint( data, pos ):
+    n = 0
+    shift = 0
+    while True:
+        byte = ord( data[pos] )
+        pos += 1
+        n |= ( byte & 0x7f ) << shift
+        if byte < 0x80:
+            return ( n, pos )
+        shift += 7
+
+
+def encodeString( out, s ):
+    if isinstance( s, unicode ):
+        s = s.encode( "utf-8" )
+    encodeVarint( out, len( s ))
+    out.append( s )
+
+
+def decodeString( data, pos ):
+    ( length, pos ) = decodeVarint( data, pos )
+
+    return ( data[pos:pos + length], pos + length )
+
+
+# a name from table is written as its index + 1, anything else (None
+# included) as 0 and then the name itself, or 0, 0 for None
+def encodeName( out, name, table ):
+    index = table.get( name )
+    if index is not None:
+        encodeVarint( out, index + 1 )
+    elif name is None:
+        out.append( "\0\0" )
+    else:
+        out.append( "\0\1" )
+        encodeString( out, name )
+
+
+def decodeName( data, pos, table ):
+    ( index, pos ) = decodeVarint( data, pos )
+    if index:
+        return ( table[index - 1], pos )
+
+    pos += 1
+    if data[pos - 1] == "\0":
+        return ( None, pos )
+
+    return decodeString( data, pos )
+
+
+def encodeValue( out, value ):
+    if value is None:
+        out.append( chr( NONE ))
+    elif value is True:
+        out.append( chr( TRUE ))
+    elif value is False:
+        out.append( chr( FALSE ))
+    elif isinstance( value, ( int, long )):
+        out.append( chr( INT ))
+        # zigzag, so small negative numbers stay small
+        if value >= 0:
+            encodeVarint( out, value * 2 )
+        else:
+            encodeVarint( out, -value * 2 - 1 )
+    elif isinstance( value, ( list, tuple )):
+        out.append( chr( LIST ))
+        encodeVarint( out, len( value ))
+        for item in value:
+            encodeValue( out, item )
+    elif value in NAMES_INDEX:
+        out.append( chr( NAME ))
+        encodeVarint( out, NAMES_INDEX[value] )
+    else:
+        out.append( chr( STRING ))
+        encodeString( out, value )
+
+
+def decodeValue( data, pos ):
+    tag = ord( data[pos] )
+    pos += 1
+
+    if tag == NONE:
+        return ( None, pos )
+    if tag == TRUE:
+        return ( True, pos )
+    if tag == FALSE:
+        return ( False, pos )
+    if tag == INT:
+        ( n, pos ) = decodeVarint( data, pos )
+        if n & 1:
+            return ( -( n + 1 ) / 2, pos )
+        return ( n / 2, pos )
+    if tag == NAME:
+        ( index, pos ) = decodeVarint( data, pos )
+        return ( NAMES[index], pos )
+    if tag == STRING:
+        return decodeString( data, pos )
+    if tag == LIST:
+        ( length, pos ) = decodeVarint( data, pos )
+        items = []
+        for i in range( length ):
+            ( item, pos ) = decodeValue( data, pos )
+            items.append( item )
+        return ( items, pos )
+
+    raise ValueError( "bad value tag %d in event log" % tag )
+
+
+def decodeBinary( data, pos = 0 ):
+    players = []
+    while pos < len( data ):
+        ( length, pos ) = decodeVarint( data, pos )
+        end = pos + length
+
+        ( kind, pos ) = decodeName( data, pos, KINDS )
+        ( playerName, pos ) = decodeName( data, pos, players )
+
+        ( numFields, pos ) = decodeVarint( data, pos )
+        fields = {}
+        for i in range( numFields ):
+            ( field, pos ) = decodeName( data, pos, FIELDS )
+            ( fields[field], pos ) = decodeValue( data, pos )
+
+        if kind == "game start":
+            players = fields["players"]
+
+        yield dom.Event( kind, playerName, fields )
+        pos = end
+
+
+def decodeJson( lines ):
+    for line in lines:
+        if not line.strip():
+            continue
+
+        record = json.loads( line )
+        fields = {}
+        for (field, value) in record.iteritems():
+            fields[str( field )] = value
+
+        kind = fields.pop( "kind" )
+        playerName = fields.pop( "player" )
+        yield dom.Event( kind, playerName, fields )
+
+
+# Open fileName for writing a log in format, returns the writer
+def openLog( fileName, format = "jsonl" ):
+    if format == "binary":
+        return BinaryLogWriter( open( fileName, "wb" ))
+
+    return JsonLogWriter( open( fileName, "wb" ))
+
+
+# Every event in a log file, in order, whichever format it's in
+def readEvents( fileName ):
+    with open( fileName, "rb" ) as f:
+        if f.read( len( MAGIC )) == MAGIC:
+            data = f.read()
+            for event in decodeBinary( data ):
+                yield event
+            return
+
+        f.seek( 0 )
+        for event in decodeJson( f ):
+            yield event
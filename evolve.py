@@ -0,0 +1,343 @@
+#!/usr/bin/python
+
+"""
+evolve.py: Breeds buy rules for a layout.
+
+usage: dom.py evolve [-l LAYOUT] [-p POPULATION] [-g GENERATIONS]
+                     [-n GAMES] [--hours HOURS] [-s SEED] [-w WORKERS]
+                     [-o FILE] [--name NAME]
+
+A genetic search over PriorityBot buy rules (see bots.py), the kind a
+strategies file holds:
+
+    province if money > 15, gold, smithy if count < 2, silver
+
+Every generation each candidate plays GAMES games against each of the
+opponents: bmu, the built in big money bot, and the champion of the
+generation before, so the population is always playing its own best.
+A candidate's fitness is the share of those games it wins.
+
+All the candidates of a generation play the same games: game i against
+an opponent has the same seed, so the same kingdom shuffles and the
+same opening hands, for every candidate (common random numbers).  The
+differences in fitness are then down to the rules rather than the luck
+of the deal, and far fewer games are needed to tell candidates apart.
+The seeds are new every generation, so nothing gets tuned to one set of
+deals.  Games are shared out over a pool of worker processes.
+
+The fittest candidates go through to the next generation unchanged,
+the rest are bred from tournament selected parents: the first rules of
+one, the rest of the other, then mutated (a rule added, dropped, moved,
+its card changed or a condition added, dropped or nudged).
+
+The search stops after GENERATIONS generations, or HOURS hours, and
+prints the best rules.  With -o they're added to a strategies file as
+a bot called NAME, ready for "dom.py simulate".
+
+"""
+
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+
+import bots
+import dom
+import simulate
+
+
+# cards every layout offers that are worth a rule, curses and coppers
+# aside
+BASIC_CARDS = ["province", "duchy", "estate", "gold", "silver"]
+
+# the conditions a rule may have: variable, comparison, the range of
+# numbers compared with
+CONDITIONS = [ ( "count", "<", 1, 4 ),
+               ( "provinces", "<=", 1, 8 ),
+               ( "money", ">", 8, 25 ),
+               ( "cards", ">=", 10, 30 ) ]
+
+# rules and conditions per rule a candidate may have
+MAX_RULES = 10
+MAX_CONDITIONS = 2
+
+# candidates kept unchanged each generation
+ELITE = 2
+
+# candidates drawn for each tournament selection
+TOURNAMENT = 3
+
+# the benchmark every candidate plays, along with the champion
+BASELINE = "bmu"
+
+# comparison text for the operator functions in a parsed rule
+OPERATOR_NAMES = dict( ( op, name ) for (name, op) in
+                       bots.OPERATORS.iteritems() )
+
+
+class Candidate:
+    # A list of buy rules, each ( cardName, [ ( variable, operator,
+    # number ) ] ), with the operators as text.
+    def __init__( self, rules ):
+        self.rules = rules
+        self.fitness = 0.0
+
+    def text( self ):
+        rules = []
+        for (cardName, conditions) in self.rules:
+            if conditions:
+                rules.append( "%s if %s" % (cardName, " and ".join(
+                    [ "%s %s %d" % condition for condition in conditions ] )))
+            else:
+                rules.append( cardName )
+
+        return ", ".join( rules )
+
+
+# a Candidate with the buy rules of the bot called strategyName
+def fromBot( strategyName ):
+    rules = []
+    for rule in bots.create( strategyName, 0 ).buyRules:
+        rules.append( ( rule.cardName,
+                        [ ( variable, OPERATOR_NAMES[compare], number )
+                          for (variable, compare, number) in
+                          rule.conditions ] ))
+
+    return Candidate( rules )
+
+
+def randomCondition( rng ):
+    ( variable, op, low, high ) = rng.choice( CONDITIONS )
+
+    return ( variable, op, rng.randint( low, high ))
+
+
+def randomRule( rng, cardNames ):
+    conditions = []
+    if rng.random() < 0.5:
+        conditions.append( randomCondition( rng ))
+
+    return ( rng.choice( cardNames ), conditions )
+
+
+def randomCandidate( rng, cardNames ):
+
+    return Candidate( [ randomRule( rng, cardNames )
+                        for i in range( rng.randint( 3, 8 )) ] )
+
+
+# a condition moved a step or two within its range
+def nudge( rng, condition ):
+    ( variable, op, number ) = condition
+    for (name, compare, low, high) in CONDITIONS:
+        if name == variable:
+            number = min( max( number + rng.choice( [ -2, -1, 1, 2 ] ),
+                               low ), high )
+
+    return ( variable, op, number )
+
+
+def mutate( rng, candidate, cardNames ):
+    rules = [ ( cardName, list( conditions ))
+              for (cardName, conditions) in candidate.rules ]
+    kind = rng.randrange( 6 )
+
+    if kind == 0 and len( rules ) < MAX_RULES:
+        rules.insert( rng.randint( 0, len( rules )),
+                      randomRule( rng, cardNames ))
+    elif kind == 1 and len( rules ) > 1:
+        del rules[ rng.randrange( len( rules )) ]
+    elif kind == 2 and len( rules ) > 1:
+        rule = rules.pop( rng.randrange( len( rules )))
+        rules.insert( rng.randint( 0, len( rules )), rule )
+    elif kind == 3 and rules:
+        i = rng.randrange( len( rules ))
+        rules[i] = ( rng.choice( cardNames ), rules[i][1] )
+    elif kind == 4 and rules:
+        conditions = rng.choice( rules )[1]
+        if conditions and rng.random() < 0.5:
+            del conditions[ rng.randrange( len( conditions )) ]
+        elif len( conditions ) < MAX_CONDITIONS:
+            conditions.append( randomCondition( rng ))
+    elif rules:
+        conditions = rng.choice( rules )[1]
+        if conditions:
+            i = rng.randrange( len( conditions ))
+            conditions[i] = nudge( rng, conditions[i] )
+
+    return Candidate( rules )
+
+
+# the first rules of one parent and the rest of the other's
+def crossover( rng, first, second ):
+    rules = ( first.rules[:rng.randint( 0, len( first.rules ))] +
+              second.rules[rng.randint( 0, len( second.rules )):] )
+
+    return Candidate( [ ( cardName, list( conditions ))
+                        for (cardName, conditions) in
+                        rules[:MAX_RULES] ] or first.rules )
+
+
+def select( rng, population ):
+
+    return max( rng.sample( population, min( TOURNAMENT, len( population ))),
+                key = lambda candidate: candidate.fitness )
+
+
+# Play games between a candidate and an opponent.  task is ( index,
+# candidate's rules, opponent's rules or bot name, cardSet,
+# gameNumbers, seed ), returns ( index, the candidate's wins ).
+def playGames( task ):
+    ( index, rules, opponent, cardSet, gameNumbers, seed ) = task
+
+    # the candidates are registered in whichever process plays them
+    bots.register( "candidate", bots.makeFactory( bots.parseRules( rules ),
+                                                  None ))
+    if opponent not in bots.STRATEGIES:
+        bots.register( "champion", bots.makeFactory(
+            bots.parseRules( opponent ), None ))
+        opponent = "champion"
+
+    wins = 0.0
+    for i in gameNumbers:
+        result = simulate.playGame( ( i, dom.gameSeed( seed, i ),
+                                      [ "candidate", opponent ],
+                                      cardSet, None ))
+        best = max( result.scores )
+        if result.scores[0] == best:
+            wins += 1.0 / result.scores.count( best )
+
+    return ( index, wins )
+
+
+# Set the fitness of every candidate, all of them playing numGames
+# games against each opponent on the same seeds.
+def evaluate( pool, population, opponents, cardSet, numGames, seed,
+              numWorkers ):
+    # enough chunks to keep every worker busy to the end
+    numChunks = max( 1, numWorkers * 4 /
+                     max( len( population ) * len( opponents ), 1 ))
+    chunkSize = max( 1, ( numGames + numChunks - 1 ) / numChunks )
+
+    tasks = []
+    for i in range( len( population )):
+        for opponent in opponents:
+            for start in xrange( 0, numGames, chunkSize ):
+                tasks.append( ( i, population[i].text(), opponent, cardSet,
+                                range( start, min( start + chunkSize,
+                                                   numGames )), seed ))
+
+    if pool is None:
+        results = [ playGames( task ) for task in tasks ]
+    else:
+        results = pool.imap_unordered( playGames, tasks )
+
+    wins = [ 0.0 ] * len( population )
+    for (index, candidateWins) in results:
+        wins[index] += candidateWins
+
+    for i in range( len( population )):
+        population[i].fitness = wins[i] / ( numGames * len( opponents ))
+
+
+def main( argv ):
+    parser = argparse.ArgumentParser(
+        prog = "dom.py evolve",
+        description = "Breed buy rules for a layout." )
+    parser.add_argument( "-l", "--layout", default = "b",
+                         help = "layout shortcut from %s" % \
+                         dom.DECK_LAYOUTS_FILE )
+    parser.add_argument( "-p", "--population", type = int, default = 24,
+                         help = "candidates per generation (default: 24)" )
+    parser.add_argument( "-g", "--generations", type = int, default = 30,
+                         help = "generations to breed (default: 30)" )
+    parser.add_argument( "-n", "--games", type = int, default = 200,
+                         help = "games per candidate and opponent " \
+                         "(default: 200)" )
+    parser.add_argument( "--hours", type = float, default = None,
+                         help = "stop after this long" )
+    parser.add_argument( "-s", "--seed", type = int, default = 1,
+                         help = "seed for the search and the games" )
+    parser.add_argument( "-w", "--workers", type = int, default = None,
+                         help = "worker processes (default: one per core)" )
+    parser.add_argument( "-o", "--output", metavar = "FILE",
+                         help = "add the best rules to this strategies file" )
+    parser.add_argument( "--name", default = None,
+                         help = "name of the bot written with -o " \
+                         "(default: evolved-LAYOUT)" )
+    args = parser.parse_args( argv )
+
+    ( layoutNames, deckLayouts ) = dom.loadLayouts()
+    cardSet = deckLayouts.get( args.layout )
+    if cardSet is None:
+        parser.error( "%s isn't a fixed layout" % args.layout )
+    if args.population < ELITE + 1:
+        parser.error( "the population needs at least %d candidates" % \
+                      ( ELITE + 1 ))
+
+    rng = random.Random( args.seed )
+    cardNames = BASIC_CARDS + cardSet
+
+    # start from big money and a spread of random rules
+    population = [ fromBot( BASELINE ), fromBot( "bmu-smithy" ) ]
+    while len( population ) < args.population:
+        population.append( randomCandidate( rng, cardNames ))
+
+    print "Breeding %d candidates on %s (%s), %d games per opponent" % \
+          (args.population, layoutNames[args.layout], args.layout,
+           args.games)
+
+    workers = args.workers or multiprocessing.cpu_count()
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool( workers )
+
+    start = time.time()
+    champion = population[0]
+    try:
+        for generation in range( args.generations ):
+            opponents = [ BASELINE ]
+            if generation > 0:
+                opponents.append( champion.text() )
+
+            seed = rng.getrandbits( 31 )
+            evaluate( pool, population, opponents, cardSet, args.games,
+                      seed, workers )
+            population.sort( key = lambda candidate: candidate.fitness,
+                             reverse = True )
+            champion = population[0]
+
+            mean = sum( candidate.fitness for candidate in population ) / \
+                   len( population )
+            print "generation %d: best %.1f%%, mean %.1f%%, %.0f s: %s" % \
+                  (generation + 1, 100 * champion.fitness, 100 * mean,
+                   time.time() - start, champion.text())
+
+            if (args.hours is not None and
+                time.time() - start > args.hours * 3600):
+                break
+
+            offspring = population[:ELITE]
+            while len( offspring ) < args.population:
+                child = crossover( rng, select( rng, population ),
+                                   select( rng, population ))
+                offspring.append( mutate( rng, child, cardNames ))
+            population = offspring
+    finally:
+        if pool:
+            pool.terminate()
+
+    print "\nbuy: %s" % champion.text()
+
+    if args.output:
+        name = args.name or "evolved-%s" % args.layout
+        with open( args.output, "a" ) as f:
+            f.write( "\n%s: bred for %s by evolve.py, seed %d\n" % \
+                     (name, layoutNames[args.layout], args.seed) )
+            f.write( "buy: %s\n" % champion.text() )
+        print "written to %s as %s" % (args.output, name)
+
+
+if __name__ == "__main__":
+    main( sys.argv[1:] )
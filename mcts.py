@@ -0,0 +1,365 @@
+#!/usr/bin/python
+
+"""
+mcts.py: A Monte Carlo tree search bot.
+
+At every choice that matters (which action to play, what to buy or
+gain, what to discard to a militia, what to trash, what to take with a
+thief) the bot plays the rest of the game out many times and picks the
+option it tried most.  Choices that don't matter much (cellar,
+library, spy, chancellor) are left to the rollout policy.
+
+The playouts grow a tree of the bot's own decisions, UCT style: each
+one picks its way down the tree by UCB1, taking the options that have
+done well so far but still trying the others now and then, and leaves
+the rest of the game to the rollout policy once it gets below the
+tree.  An answer that has been played out EXPAND_AFTER times gets the
+next decision after it searched too, so the tree only grows where
+there are playouts enough to say something.  The other players are
+part of what happens between the bot's decisions, not nodes of their
+own.
+
+The search only sees what the bot's player could see.  Every playout
+starts from a determinization: their own deck order and the other
+players' hands and decks are shuffled (see dom.Game.clone), so the bot
+can't peek and is averaging over what it doesn't know.  Which options
+are legal further down the tree depends on the deal, so a node's
+children are tried and scored only in the playouts where they could be
+chosen (information set MCTS): UCB1 counts how often a child was
+available rather than how often its parent was visited.
+
+The engine can't be stopped halfway through a card, so playouts don't
+start from the moment of the decision.  The bot copies the game at its
+first decision of each turn and remembers its answers since; a playout
+plays the turn again from that copy with the same answers (the game's
+own rng is copied too, so it goes exactly the same way), reshuffles the
+hidden cards once it gets to the decision being made, gives the option
+being tried and hands over to the rollout policy.
+
+With more than one worker the search is root parallel: every worker
+process runs its own search of the same decision from a different
+seed, and their visit counts and wins are added up.  A bot's
+playoutsPerSecond() says how fast it has been searching.
+
+"""
+
+import math
+import multiprocessing
+import random
+import time
+
+import bots
+import dom
+import replay
+
+
+# playouts per decision
+PLAYOUTS = 200
+
+# playouts stop after this many turns per player, like simulate.py
+MAX_ROUNDS = 100
+
+# how hard UCB1 tries the options that haven't done well so far,
+# rewards being about 0 to 1
+EXPLORATION = 0.7
+
+# playouts through a node before the decision after it is searched too
+EXPAND_AFTER = 8
+
+# reward per VP of lead (or deficit) over the best other player, on
+# top of the win, so a bot that can't win still plays for the most VP
+MARGIN_WEIGHT = 0.01
+
+# the decisions searched, the rest are left to the rollout policy
+SEARCHED = ["chooseAction", "chooseBuy", "chooseGain", "chooseDiscard",
+            "chooseTrash", "chooseThiefTrash", "chooseThiefGain"]
+
+
+# The policy every player follows in a playout: big money that plays
+# whatever actions it draws.  Quick and not too silly.
+def rolloutPolicy( seed ):
+
+    return bots.PriorityBot( seed, bots.BigMoneyUltimate.buyRules, None )
+
+
+class Node:
+    # One of the searching player's answers in the tree: choiceId to a
+    # method's question, the playouts that went through it and their
+    # total reward, and the playouts it could have been picked in.
+    # children are the answers to the player's next searched decision,
+    # by ( method, choiceId ).
+    def __init__( self, choiceId = None ):
+        self.choiceId = choiceId
+        self.visits = 0
+        self.total = 0.0
+        self.available = 0
+        self.children = {}
+
+    def child( self, method, choiceId ):
+        key = ( method, choiceId )
+        if key not in self.children:
+            self.children[key] = Node( choiceId )
+
+        return self.children[key]
+
+
+# Pick one of nodes, the answers that can be given this time: one
+# that hasn't been tried yet if there is one, else the best by UCB1.
+def select( nodes, rng ):
+    for node in nodes:
+        node.available += 1
+
+    untried = [ node for node in nodes if node.visits == 0 ]
+    if untried:
+        return rng.choice( untried )
+
+    def bound( node ):
+        return node.total / node.visits + EXPLORATION * \
+               ( math.log( node.available ) / node.visits ) ** 0.5
+
+    return max( nodes, key = bound )
+
+
+class PlayoutDecisions( dom.Decisions ):
+    # The searching player's decisions in a playout: the turn's earlier
+    # answers from prefix, then choice (after reshuffling what observer
+    # can't see), then down the tree from node, choice's node, for as
+    # long as it goes, then whatever policy says.  path is the nodes
+    # the playout went through.
+    def __init__( self, prefix, choice, node, policy, observer, rng ):
+        self.prefix = prefix
+        self.choice = choice
+        self.node = node
+        self.policy = policy
+        self.observer = observer
+        self.rng = rng
+        self.position = 0
+        self.path = [ node ]
+
+    # the next node down the tree for this decision, or None if it's
+    # left to the policy
+    def descend( self, method, game, player, args ):
+        if self.node is None or self.node.visits < EXPAND_AFTER:
+            self.node = None
+            return None
+        if method not in SEARCHED:
+            return None
+
+        choiceIds = game.legalChoices( player, method, args )
+        if len( choiceIds ) < 2:
+            return None
+
+        self.node = select( [ self.node.child( method, choiceId )
+                              for choiceId in choiceIds ], self.rng )
+        self.path.append( self.node )
+
+        return self.node
+
+    def decide( self, method, game, player, args ):
+        position = self.position
+        self.position += 1
+
+        if position < len( self.prefix ):
+            return self.prefix[position]
+
+        if position == len( self.prefix ):
+            game.resample( self.observer, self.rng )
+            game.rng.seed( self.rng.getrandbits( 64 ))
+            return self.choice
+
+        node = self.descend( method, game, player, args )
+        if node is not None:
+            return game.decodeChoice( method, node.choiceId )
+
+        return getattr( self.policy, method )( game, player, *args )
+
+
+# Play one game out from snapshot, the searching player at playerIndex
+# answering with prefix and then choice, whose node is node, and add
+# the reward to every node the playout went through.  The reward is
+# the player's share of the win (ties split it) plus a little for
+# their VP margin.
+def playout( snapshot, playerIndex, prefix, choice, node, policy, rng ):
+    game = snapshot.clone()
+    for player in game.players:
+        player.decisions = policy
+    player = game.players[playerIndex]
+    decisions = PlayoutDecisions( prefix, choice, node, policy,
+                                  playerIndex, rng )
+    player.decisions = decisions
+
+    game.finishTurn( player )
+    maxTurns = snapshot.numTurns + MAX_ROUNDS * len( game.players )
+    while not game.isOver() and game.numTurns < maxTurns:
+        game.playTurn()
+
+    scores = game.finish()
+    score = scores[playerIndex]
+    others = scores[:playerIndex] + scores[playerIndex + 1:]
+    reward = MARGIN_WEIGHT * ( score - max( others or [ 0 ] ))
+
+    best = max( scores )
+    if score == best:
+        reward += 1.0 / scores.count( best )
+
+    for node in decisions.path:
+        node.visits += 1
+        node.total += reward
+
+    return reward
+
+
+# Run numPlayouts playouts, each from a determinization of its own,
+# choosing which of options to try by UCB1 and growing the tree below
+# them.  Stops early if the deadline (a time.time()) passes.  Returns
+# the visits and total reward of each option.
+def search( snapshot, playerIndex, prefix, options, numPlayouts, seed,
+            deadline = None ):
+    rng = random.Random( seed )
+    policy = rolloutPolicy( rng.getrandbits( 64 ))
+    roots = [ Node() for option in options ]
+
+    for i in xrange( numPlayouts ):
+        if deadline is not None and time.time() > deadline:
+            break
+
+        node = select( roots, rng )
+        playout( snapshot, playerIndex, prefix, options[roots.index( node )],
+                 node, policy, random.Random( rng.getrandbits( 64 )))
+
+    return ( [ node.visits for node in roots ],
+             [ node.total for node in roots ] )
+
+
+# search() for a worker process, task is its arguments
+def searchTask( task ):
+
+    return search( *task )
+
+
+class MCTSBot( bots.Bot ):
+    # playouts is the budget for each decision, timeLimit (seconds) an
+    # optional cap on top.  workers is the number of processes to
+    # search with, None for one per core.  Inside a worker process of
+    # its own (simulate.py's, say) the bot searches with just the one,
+    # since daemonic processes can't start any more.
+    def __init__( self, seed = None, playouts = PLAYOUTS, timeLimit = None,
+                  workers = 1 ):
+        bots.Bot.__init__( self, seed )
+        self.playouts = playouts
+        self.timeLimit = timeLimit
+        self.workers = workers or multiprocessing.cpu_count()
+        if multiprocessing.current_process().daemon:
+            self.workers = 1
+        self.policy = rolloutPolicy( self.rng.getrandbits( 64 ))
+        self.pool = None
+
+        # the turn under way: ( numTurns, the game at the first
+        # decision, the answers given since )
+        self.turnNumber = None
+        self.snapshot = None
+        self.prefix = []
+
+        self.numPlayouts = 0
+        self.searchTime = 0.0
+
+    def playoutsPerSecond( self ):
+
+        return self.numPlayouts / max( self.searchTime, 1e-9 )
+
+    def close( self ):
+        if self.pool:
+            self.pool.terminate()
+            self.pool = None
+
+    # listens to the game the pool was started for, and lets the worker
+    # processes go once it's over
+    def gameOver( self, event ):
+        if event.kind == "game over":
+            self.close()
+
+    # the choices worth searching for method, or None to leave it to
+    # the rollout policy
+    def options( self, method, game, player, args ):
+        if method not in SEARCHED:
+            return None
+
+        return [ game.decodeChoice( method, choiceId ) for choiceId in
+                 game.legalChoices( player, method, args ) ]
+
+    def decide( self, method, game, player, args ):
+        if game.numTurns != self.turnNumber:
+            self.turnNumber = game.numTurns
+            self.snapshot = game.clone()
+            self.prefix = []
+
+        options = self.options( method, game, player, args )
+        if not options:
+            choice = getattr( self.policy, method )( game, player, *args )
+        elif len( options ) == 1:
+            choice = options[0]
+        else:
+            choice = self.choose( game, game.players.index( player ),
+                                  options )
+
+        self.prefix.append( choice )
+
+        return choice
+
+    # the option that got the most playouts, the best of those if
+    # several got as many
+    def choose( self, game, playerIndex, options ):
+        start = time.time()
+        deadline = None
+        if self.timeLimit is not None:
+            deadline = start + self.timeLimit
+
+        if self.workers == 1:
+            results = [ search( self.snapshot, playerIndex, self.prefix,
+                                options, self.playouts,
+                                self.rng.getrandbits( 64 ), deadline ) ]
+        else:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool( self.workers )
+                game.listeners.append( self.gameOver )
+
+            # the workers get a copy without this process's decisions
+            # and listeners
+            snapshot = self.snapshot.clone()
+            snapshot.supply.emptyListeners = []
+            for player in snapshot.players:
+                player.decisions = None
+
+            share = max( 1, self.playouts / self.workers )
+            tasks = [ ( snapshot, playerIndex, self.prefix, options, share,
+                        self.rng.getrandbits( 64 ), deadline )
+                      for i in range( self.workers ) ]
+            results = self.pool.map( searchTask, tasks )
+
+        visits = [ 0 ] * len( options )
+        totals = [ 0.0 ] * len( options )
+        for (workerVisits, workerTotals) in results:
+            for i in range( len( options )):
+                visits[i] += workerVisits[i]
+                totals[i] += workerTotals[i]
+
+        self.numPlayouts += sum( visits )
+        self.searchTime += time.time() - start
+
+        best = max( range( len( options )),
+                    key = lambda i: ( visits[i], totals[i] ))
+
+        return options[best]
+
+
+def makeDecider( method ):
+    def decider( self, game, player, *args ):
+
+        return self.decide( method, game, player, args )
+
+    return decider
+
+
+for method in replay.DECISIONS:
+    setattr( PlayoutDecisions, method, makeDecider( method ))
+    setattr( MCTSBot, method, makeDecider( method ))
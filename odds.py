@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+"""
+odds.py: Exact odds for a player's next hand.
+
+The next hand is the top five cards of the deck, and if the deck runs
+short, all of it and the rest from the shuffled discards (which by then
+hold this turn's hand and cards in play too).  Cards only matter here
+for their coin and whether they are terminal actions, so a deck comes
+down to a few counts, and the chance of every coin total and of drawing
+two terminals together (one of them a dead card) is a sum of
+hypergeometric terms over those counts rather than a guess from
+sampled shuffles.
+
+Decks look the same from one turn to the next far more often than not,
+so results are kept by composition in a cache of the CACHE_SIZE most
+recently used.
+
+"""
+
+import collections
+
+import bots
+import dom
+
+
+HAND_SIZE = 5
+
+# the coin totals worth knowing the chances of: a duchy (or a smithy),
+# a gold and a province
+TARGETS = [5, 6, 8]
+
+# compositions remembered
+CACHE_SIZE = 4096
+
+cardFactory = dom.CardFactory()
+
+# card name -> ( coin, is it a terminal action )
+CATEGORIES = {}
+for cardName in dom.CARD_NAMES:
+    card = cardFactory.create( cardName )
+    CATEGORIES[cardName] = ( card.value, card.action and
+                             cardName not in bots.NON_TERMINALS )
+
+cache = collections.OrderedDict()
+
+
+class HandOdds:
+    # coin[c] is the chance of exactly c coin of treasure in the hand,
+    # collision the chance of two or more terminal actions
+    def __init__( self, coin, collision ):
+        self.coin = coin
+        self.collision = collision
+
+    # chance of coin or more
+    def atLeast( self, coin ):
+
+        return sum( self.coin[coin:] )
+
+    def __str__( self ):
+        s = ", ".join( [ "$%d+ %.0f%%" % (target, 100 * self.atLeast( target ))
+                         for target in TARGETS ] )
+
+        return s + ", terminal collision %.0f%%" % ( 100 * self.collision )
+
+
+# n choose k
+def choose( n, k ):
+    ways = 1
+    for i in range( k ):
+        ways = ways * ( n - i ) / ( i + 1 )
+
+    return ways
+
+
+# card name -> count (see Deck.getCounts) to a sorted tuple of
+# ( category, count )
+def composition( counts ):
+    categories = {}
+    for (cardName, n) in counts.iteritems():
+        category = CATEGORIES[cardName]
+        categories[category] = categories.get( category, 0 ) + n
+
+    return tuple( sorted( categories.items() ))
+
+
+# The number of ways to draw numCards from a composition, by ( coin,
+# terminals ), terminals counted up to 2
+def draws( categories, numCards ):
+    ways = {( 0, 0, 0 ): 1}
+    for ((coin, terminal), n) in categories:
+        drawn = {}
+        for ((cards, total, terminals), w) in ways.iteritems():
+            for k in range( min( n, numCards - cards ) + 1 ):
+                key = ( cards + k, total + k * coin,
+                        min( terminals + k * terminal, 2 ))
+                drawn[key] = drawn.get( key, 0 ) + w * choose( n, k )
+        ways = drawn
+
+    result = {}
+    for ((cards, total, terminals), w) in ways.iteritems():
+        if cards == numCards:
+            result[( total, terminals )] = w
+
+    return result
+
+
+def compute( deck, pool, handSize ):
+    deckSize = sum( [ n for (category, n) in deck ] )
+    poolSize = sum( [ n for (category, n) in pool ] )
+
+    if deckSize >= handSize:
+        ( fixedCoin, fixedTerminals ) = ( 0, 0 )
+        ways = draws( deck, handSize )
+        total = choose( deckSize, handSize )
+    else:
+        # all of the deck, the rest from the reshuffled pool
+        fixedCoin = sum( [ coin * n for ((coin, terminal), n) in deck ] )
+        fixedTerminals = sum( [ n for ((coin, terminal), n) in deck
+                                if terminal ] )
+        numCards = min( handSize - deckSize, poolSize )
+        ways = draws( pool, numCards )
+        total = choose( poolSize, numCards )
+
+    coin = []
+    collision = 0.0
+    for ((hand, terminals), w) in ways.iteritems():
+        hand += fixedCoin
+        if hand >= len( coin ):
+            coin.extend( [ 0.0 ] * ( hand + 1 - len( coin )))
+        coin[hand] += float( w ) / total
+
+        if terminals + fixedTerminals >= 2:
+            collision += float( w ) / total
+
+    return HandOdds( coin, collision )
+
+
+# The odds for a hand of handSize from a deck and, should it run out, a
+# pool of discards, both card name -> count
+def handOdds( deckCounts, poolCounts, handSize = HAND_SIZE ):
+    deck = composition( deckCounts )
+    if sum( deckCounts.itervalues() ) >= handSize:
+        pool = ()
+    else:
+        pool = composition( poolCounts )
+
+    key = ( deck, pool, handSize )
+    odds = cache.pop( key, None )
+    if odds is None:
+        odds = compute( deck, pool, handSize )
+        if len( cache ) >= CACHE_SIZE:
+            cache.popitem( last = False )
+    cache[key] = odds
+
+    return odds
+
+
+# the odds for the hand player will draw at the end of this turn
+def nextHand( player ):
+    pool = player.discard.getCounts()
+    for deck in [ player.hand, player.inPlay ]:
+        for (cardName, n) in deck.getCounts().iteritems():
+            pool[cardName] = pool.get( cardName, 0 ) + n
+
+    return handOdds( player.deck.getCounts(), pool )
@@ -0,0 +1,253 @@
+#!/usr/bin/python
+
+"""
+replay.py: Rebuilds logged games from their seed and decisions.
+
+usage: dom.py replay [-g GAME | --seed SEED] [-t TURN] [--play] LOGFILE
+
+A game is completely determined by its kingdom, its seed and the
+choices its players made.  recordDecisions() makes a game report every
+choice as a "decision" event, so a log (see eventlog.py) holds all
+three.  A Replay plays the game again from the log, at engine speed
+with nothing listening, asking no one anything.
+
+Replay.seek() jumps to the start of any turn.  The replay keeps a
+snapshot of the game every few turns as it goes, so a seek only plays
+forward from the nearest snapshot rather than from the first turn.
+
+"""
+
+import argparse
+import sys
+
+import dom
+import eventlog
+
+
+# turns between snapshots
+SNAPSHOT_EVERY = 10
+
+# every choice a Decisions object makes
+DECISIONS = [ name for name in dir( dom.Decisions )
+              if name.startswith( "choose" ) ]
+
+
+class ReplayError( Exception ):
+    pass
+
+
+# cards are logged by name, everything else as it is
+def encodeChoice( choice ):
+    if isinstance( choice, dom.Card ):
+        return choice.name
+
+    return choice
+
+
+def decodeChoice( game, choice ):
+    if isinstance( choice, basestring ):
+        return game.supply.shortcut[choice]
+
+    return choice
+
+
+class RecordingDecisions( dom.Decisions ):
+    # Passes every choice on to decisions and reports the answer as a
+    # "decision" event.
+    def __init__( self, decisions ):
+        self.decisions = decisions
+
+
+class ReplayDecisions( dom.Decisions ):
+    # Answers every choice from choices, a list of ( method, choice )
+    # recorded for one player, starting at position.
+    def __init__( self, choices, position = 0 ):
+        self.choices = choices
+        self.position = position
+
+
+def makeRecorder( method ):
+    def record( self, game, player, *args ):
+        choice = getattr( self.decisions, method )( game, player, *args )
+        game.emit( "decision", player, method = method,
+                   choice = encodeChoice( choice ))
+
+        return choice
+
+    return record
+
+
+def makeReplayer( method ):
+    def replay( self, game, player, *args ):
+        if self.position >= len( self.choices ):
+            raise ReplayError( "the log has no more decisions for %s" % \
+                               player.name )
+
+        ( recorded, choice ) = self.choices[self.position]
+        if recorded != method:
+            raise ReplayError( "%s was asked %s but the log has %s" % \
+                               (player.name, method, recorded) )
+
+        self.position += 1
+
+        return decodeChoice( game, choice )
+
+    return replay
+
+
+for method in DECISIONS:
+    setattr( RecordingDecisions, method, makeRecorder( method ))
+    setattr( ReplayDecisions, method, makeReplayer( method ))
+
+
+# log every choice made in game, call before the game starts
+def recordDecisions( game ):
+    for player in game.players:
+        player.decisions = RecordingDecisions( player.decisions )
+
+
+# split a stream of events into games, lists of events each starting
+# with "game start"
+def splitGames( events ):
+    game = None
+    for event in events:
+        if event.kind == "game start":
+            if game:
+                yield game
+            game = []
+
+        if game is not None:
+            game.append( event )
+
+    if game:
+        yield game
+
+
+class Replay:
+    # A logged game, events are the events of that one game.
+    def __init__( self, events, cardFactory = None,
+                  snapshotEvery = SNAPSHOT_EVERY ):
+        start = events[0]
+        if start.kind != "game start":
+            raise ReplayError( "the log doesn't start with a new game" )
+
+        self.playerNames = start.data["players"]
+        self.kingdom = start.data["kingdom"]
+        self.seed = start.data["seed"]
+        self.cardFactory = cardFactory or dom.CardFactory()
+        self.snapshotEvery = snapshotEvery
+
+        self.choices = {}
+        for name in self.playerNames:
+            self.choices[name] = []
+
+        self.scores = None
+        for event in events:
+            if event.kind == "decision":
+                self.choices[event.playerName].append(
+                    ( event.data["method"], event.data["choice"] ))
+            elif event.kind == "game over":
+                self.scores = [ score for (name, score) in
+                                event.data["scores"] ]
+
+        players = [ dom.Player( name ) for name in self.playerNames ]
+        game = dom.Game( players, self.kingdom, self.cardFactory, self.seed )
+        game.start()
+
+        # turn number -> ( game, each player's position in their choices )
+        self.snapshots = {}
+        self.__snapshot( game, [ 0 ] * len( players ))
+
+    def __snapshot( self, game, positions ):
+        self.snapshots[game.numTurns] = ( game.clone(), positions )
+
+    # A new copy of the game at the start of turn (counting every
+    # player's turns from 0), or at the end of the game if it finished
+    # before then.  The players answer the rest of their choices from
+    # the log, so the game can be played on from there.
+    def seek( self, turn ):
+        start = max( [ t for t in self.snapshots if t <= turn ] )
+        ( snapshot, positions ) = self.snapshots[start]
+
+        game = snapshot.clone()
+        decisions = []
+        for i in range( len( game.players )):
+            player = game.players[i]
+            decisions.append( ReplayDecisions( self.choices[player.name],
+                                               positions[i] ))
+            player.decisions = decisions[i]
+
+        while game.numTurns < turn and not game.isOver():
+            game.playTurn()
+
+            if (game.numTurns % self.snapshotEvery == 0 and
+                game.numTurns not in self.snapshots):
+                self.__snapshot( game, [ d.position for d in decisions ] )
+
+        return game
+
+    # play to the end, returns the final game
+    def finish( self ):
+        game = self.seek( sys.maxint )
+        game.finish()
+
+        return game
+
+
+def main( argv ):
+    parser = argparse.ArgumentParser(
+        prog = "dom.py replay",
+        description = "Replay a logged game." )
+    parser.add_argument( "log", metavar = "LOGFILE",
+                         help = "game log written with --log" )
+    parser.add_argument( "-g", "--game", type = int, default = 0,
+                         help = "which game in the log (default: the first)" )
+    parser.add_argument( "--seed", type = int, default = None,
+                         help = "replay the game with this seed" )
+    parser.add_argument( "-t", "--turn", type = int, default = None,
+                         help = "show the game at the start of this turn, " \
+                         "counting every player's turns from 0 " \
+                         "(default: the end of the game)" )
+    parser.add_argument( "--play", action = "store_true",
+                         help = "show the rest of the game from there" )
+    args = parser.parse_args( argv )
+
+    events = None
+    number = 0
+    for gameEvents in splitGames( eventlog.readEvents( args.log )):
+        if args.seed is None and number == args.game:
+            events = gameEvents
+            break
+        if gameEvents[0].data["seed"] == args.seed:
+            events = gameEvents
+            break
+        number += 1
+
+    if events is None:
+        print "That game isn't in %s." % args.log
+        raise SystemExit( 1 )
+
+    replay = Replay( events )
+    print "Kingdom: %s" % ", ".join( replay.kingdom )
+    print "Seed: %d" % replay.seed
+
+    turn = args.turn
+    if turn is None:
+        turn = sys.maxint
+    game = replay.seek( turn )
+
+    print "\nTurn %d" % game.numTurns
+    for player in game.players:
+        dom.dumpDecks( player )
+    dom.showSupplyCounts( game.supply )
+
+    if args.play:
+        game.listeners.append( dom.ConsoleView( game ))
+        game.play()
+    elif game.isOver():
+        game.listeners.append( dom.ConsoleView( game ))
+        game.finish()
+
+
+if __name__ == "__main__":
+    main( sys.argv[1:] )
@@ -0,0 +1,359 @@
+#!/usr/bin/python
+
+"""
+selfplay.py: Training data from bots playing each other.
+
+usage: dom.py selfplay [-n GAMES] [-l LAYOUT] [-s SEED] [-w WORKERS]
+                       [--shard-rows ROWS] -o DIR strategy [strategy ...]
+
+Plays GAMES games between the strategies (one strategy plays itself),
+numbered, seeded and seated as simulate.py does it, and writes a row
+for every decision of every player:
+
+    observation   what the player could see, as env.py observes it
+    mask          the legal answers, dom.Game.legalMask's bits
+    action        the answer given, as an env.py action (an answer
+                  the engine would have turned down is recorded as
+                  what it did instead, PASS or the card it took)
+    outcome       1, 0 or -1 as the player went on to win, tie or lose
+    game          the game's number
+    strategy      which of the strategies was deciding
+    turn          the player's turn number
+
+Rows are fixed width (ROW), and go straight into numpy files in DIR
+that are memory-mapped while they're written: every worker process
+writes its own shards, shard-WORKER-PART.npy, starting a new one every
+ROWS rows, and only the rows of the game it's playing are in memory.
+Once every worker is done, manifest.json lists the shards and their
+rows along with the layout, strategies, seed and the observation's
+layout.  load() memory-maps them all read-only, so a trainer can slice
+rows out of millions without reading any more than it uses.
+
+Needs numpy, like env.py.
+
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import bots
+import dom
+import env
+import replay
+import simulate
+
+try:
+    import numpy
+    import numpy.lib.format
+except ImportError:
+    numpy = None
+
+
+MANIFEST = "manifest.json"
+
+# goes up whenever ROW or the manifest changes
+FORMAT = 1
+
+# rows per shard, about 48MB of them
+SHARD_ROWS = 1 << 16
+
+if numpy:
+    ROW = numpy.dtype( [ ( "observation", numpy.float32,
+                           ( env.OBSERVATION_SIZE, )),
+                         ( "mask", numpy.uint64 ),
+                         ( "action", numpy.int16 ),
+                         ( "outcome", numpy.float32 ),
+                         ( "game", numpy.int32 ),
+                         ( "strategy", numpy.int8 ),
+                         ( "turn", numpy.int16 ) ] )
+
+cardFactory = dom.CardFactory()
+
+
+# the action recorded for the answer choice to method: what the engine
+# made of it, as one of the bits of mask
+def encodeAnswer( method, player, choice, mask ):
+    if method in dom.QUESTIONS:
+        return dom.YES if choice else dom.PASS
+
+    if choice is None:
+        return dom.PASS
+    if mask & dom.BITS[choice.id]:
+        return choice.id
+
+    # a militia discard that isn't in hand is the top card of the hand,
+    # any other answer that can't be done stops what was being done
+    if method == "chooseDiscard":
+        return player.hand.peek().id
+
+    return dom.PASS
+
+
+class SampleDecisions( dom.Decisions ):
+    # Passes every choice on to decisions and adds a row for it to
+    # rows: ( observation, mask, action, strategy, turn ).
+    def __init__( self, decisions, rows, strategy ):
+        self.decisions = decisions
+        self.rows = rows
+        self.strategy = strategy
+
+
+def makeSampler( method ):
+    def sample( self, game, player, *args ):
+        observation = env.observe( game, player, method )
+        mask = game.legalMask( player, method, args )
+        choice = getattr( self.decisions, method )( game, player, *args )
+        self.rows.append( ( observation, mask,
+                            encodeAnswer( method, player, choice, mask ),
+                            self.strategy, player.numHands ))
+
+        return choice
+
+    return sample
+
+
+for method in replay.DECISIONS:
+    setattr( SampleDecisions, method, makeSampler( method ))
+
+
+class ShardWriter:
+    # Writes rows to shards prefix-PART.npy in directory, shardRows at
+    # most to a shard.
+    def __init__( self, directory, prefix, shardRows ):
+        self.directory = directory
+        self.prefix = prefix
+        self.shardRows = shardRows
+        self.shards = []      # { "file", "rows" } of each shard written
+        self.shard = None     # the memory-mapped shard being written
+        self.numRows = 0      # rows in it so far
+
+    def newShard( self ):
+        self.closeShard()
+
+        fileName = "%s-%03d.npy" % (self.prefix, len( self.shards ))
+        self.shards.append( {"file": fileName, "rows": 0} )
+        self.shard = numpy.lib.format.open_memmap(
+            os.path.join( self.directory, fileName ), mode = "w+",
+            dtype = ROW, shape = ( self.shardRows, ))
+        self.numRows = 0
+
+    # Finish the shard being written.  One that isn't full is copied to
+    # a file of just its rows, so every shard is a plain .npy file.
+    def closeShard( self ):
+        if self.shard is None:
+            return
+
+        path = os.path.join( self.directory, self.shards[-1]["file"] )
+        if self.numRows < len( self.shard ):
+            rows = numpy.lib.format.open_memmap(
+                path + ".part", mode = "w+", dtype = ROW,
+                shape = ( self.numRows, ))
+            rows[:] = self.shard[:self.numRows]
+            rows.flush()
+            del rows
+            os.rename( path + ".part", path )
+        else:
+            self.shard.flush()
+
+        self.shards[-1]["rows"] = self.numRows
+        self.shard = None
+
+    # the rows of one game, from SampleDecisions, and its outcome for
+    # each strategy
+    def add( self, gameNumber, rows, outcomes ):
+        for (observation, mask, action, strategy, turn) in rows:
+            if self.shard is None or self.numRows == self.shardRows:
+                self.newShard()
+
+            self.shard[self.numRows] = ( observation, mask, action,
+                                         outcomes[strategy], gameNumber,
+                                         strategy, turn )
+            self.numRows += 1
+
+    # close the last shard, returns the shards written
+    def close( self ):
+        self.closeShard()
+
+        return self.shards
+
+
+# Play some games and write their rows.  task is ( worker, directory,
+# strategyNames, cardSet, gameNumbers, seed, shardRows ), returns
+# ( the shards written, games, rows ).
+def playGames( task ):
+    ( worker, directory, strategyNames, cardSet,
+      gameNumbers, seed, shardRows ) = task
+
+    writer = ShardWriter( directory, "shard-%04d" % worker, shardRows )
+    numPlayers = len( strategyNames )
+    numRows = 0
+
+    for gameNumber in gameNumbers:
+        gameSeed = dom.gameSeed( seed, gameNumber )
+        kingdom = cardSet or dom.randomKingdomCards(
+            random.Random( gameSeed ))
+
+        # rotate the seating the way simulate.playGame does
+        first = gameNumber % numPlayers
+        seats = range( first, numPlayers ) + range( first )
+
+        rows = []
+        players = []
+        for i in seats:
+            bot = bots.create( strategyNames[i], gameSeed * 4 + i )
+            players.append( dom.Player( "%d %s" % (i + 1, strategyNames[i]),
+                                        SampleDecisions( bot, rows, i )))
+
+        game = dom.Game( players, kingdom, cardFactory, gameSeed )
+        game.start()
+        while (not game.isOver() and
+               game.numTurns < simulate.MAX_ROUNDS * numPlayers):
+            game.playTurn()
+
+        seatScores = game.finish()
+        outcomes = [ 0.0 ] * numPlayers
+        for seat in range( numPlayers ):
+            outcomes[ seats[seat] ] = env.outcome( seatScores, seat )
+
+        writer.add( gameNumber, rows, outcomes )
+        numRows += len( rows )
+
+    return ( writer.close(), len( gameNumbers ), numRows )
+
+
+# The manifest of the run in directory and its shards, each memory-
+# mapped read-only: nothing is read until it's used.
+def load( directory ):
+    with open( os.path.join( directory, MANIFEST )) as f:
+        manifest = json.load( f )
+
+    if manifest["format"] != FORMAT:
+        raise dom.Error( "%s is format %s, not %d" % \
+                         (directory, manifest["format"], FORMAT) )
+
+    shards = [ numpy.load( os.path.join( directory, shard["file"] ),
+                           mmap_mode = "r" )
+               for shard in manifest["shards"] ]
+
+    return ( manifest, shards )
+
+
+# masks from rows' "mask" as booleans, ( rows, env.NUM_ACTIONS ), like
+# env.py's legal masks
+def unpackMasks( masks ):
+    bits = numpy.arange( env.NUM_ACTIONS, dtype = numpy.uint64 )
+
+    return ( ( masks[:, None] >> bits ) & 1 ).astype( numpy.bool_ )
+
+
+def writeManifest( directory, manifest ):
+    path = os.path.join( directory, MANIFEST )
+    with open( path + ".part", "w" ) as f:
+        json.dump( manifest, f, indent = 1, sort_keys = True )
+        f.write( "\n" )
+
+    # only a finished run has a manifest
+    os.rename( path + ".part", path )
+
+
+def main( argv ):
+    parser = argparse.ArgumentParser(
+        prog = "dom.py selfplay",
+        description = "Write training data from bots playing each other." )
+    parser.add_argument( "strategies", nargs = "+", metavar = "strategy",
+                         help = "bots to play, one plays itself" )
+    parser.add_argument( "-n", "--games", type = int, default = 1000,
+                         help = "number of games to play (default: 1000)" )
+    parser.add_argument( "-l", "--layout", default = "b",
+                         help = "layout shortcut from %s" % \
+                         dom.DECK_LAYOUTS_FILE )
+    parser.add_argument( "-s", "--seed", type = int, default = 1,
+                         help = "seed every game's own is worked out from" )
+    parser.add_argument( "-w", "--workers", type = int, default = None,
+                         help = "worker processes (default: one per core)" )
+    parser.add_argument( "--shard-rows", type = int, default = SHARD_ROWS,
+                         metavar = "ROWS",
+                         help = "rows per shard (default: %d)" % SHARD_ROWS )
+    parser.add_argument( "-o", "--output", metavar = "DIR", required = True,
+                         help = "directory to write the shards to" )
+    args = parser.parse_args( argv )
+
+    if not env.available():
+        parser.error( "selfplay needs numpy" )
+
+    strategyNames = args.strategies
+    for name in strategyNames:
+        if name not in bots.STRATEGIES:
+            parser.error( "unknown strategy %s" % name )
+    if len( strategyNames ) == 1:
+        strategyNames = strategyNames * 2
+    if len( strategyNames ) > 4:
+        parser.error( "at most 4 strategies can play" )
+
+    ( layoutNames, deckLayouts ) = dom.loadLayouts()
+    if args.layout not in deckLayouts:
+        parser.error( "no such layout: %s" % args.layout )
+    cardSet = deckLayouts[args.layout]
+
+    if not os.path.isdir( args.output ):
+        os.makedirs( args.output )
+    if os.path.exists( os.path.join( args.output, MANIFEST )):
+        parser.error( "%s already holds a run" % args.output )
+
+    # a contiguous share of the games for each worker
+    workers = args.workers or multiprocessing.cpu_count()
+    share = ( args.games + workers - 1 ) / workers
+    tasks = [ ( i, args.output, strategyNames, cardSet,
+                range( i * share, min( ( i + 1 ) * share, args.games )),
+                args.seed, args.shard_rows )
+              for i in range( workers ) if i * share < args.games ]
+
+    print "%d games of %s on %s, %d workers" % \
+          (args.games, " vs ".join( strategyNames ),
+           layoutNames[args.layout], len( tasks ))
+
+    start = time.time()
+    if len( tasks ) == 1:
+        results = [ playGames( tasks[0] ) ]
+    else:
+        pool = multiprocessing.Pool( len( tasks ))
+        try:
+            results = pool.map( playGames, tasks )
+        finally:
+            pool.terminate()
+
+    shards = []
+    numRows = 0
+    for (workerShards, numGames, workerRows) in results:
+        shards.extend( workerShards )
+        numRows += workerRows
+    elapsed = time.time() - start
+
+    writeManifest( args.output,
+                   {"format": FORMAT,
+                    "layout": args.layout,
+                    "cards": cardSet,
+                    "strategies": strategyNames,
+                    "seed": args.seed,
+                    "games": args.games,
+                    "rows": numRows,
+                    "row": numpy.lib.format.dtype_to_descr( ROW ),
+                    "observation": {"cards": dom.CARD_NAMES,
+                                    "zones": env.ZONES,
+                                    "counters": env.COUNTERS,
+                                    "decisions": replay.DECISIONS},
+                    "actions": {"pass": dom.PASS, "yes": dom.YES},
+                    "shards": shards} )
+
+    print "%d rows in %d shards, %.1f MB, %.1f seconds, %.0f rows/second" % \
+          (numRows, len( shards ), numRows * ROW.itemsize / 1e6, elapsed,
+           numRows / max( elapsed, 1e-9 ))
+
+
+if __name__ == "__main__":
+    main( sys.argv[1:] )
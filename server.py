@@ -0,0 +1,647 @@
+#!/usr/bin/python
+
+"""
+server.py: A game server, any number of tables on one event loop.
+
+usage: dom.py serve [--host HOST] [-p PORT]
+
+Clients connect over TCP and talk in lines of JSON, one object a line.
+What a client sends:
+
+    {"cmd": "new", "layout": "b", "players": 2, "bots": ["bmu"]}
+                                    open a table for 2 players and a
+                                    bmu bot ("seed" is optional)
+    {"cmd": "join", "table": 1, "name": "ann", "feed": "state"}
+                                    take a seat, the game starts once
+                                    every seat is taken
+    {"cmd": "watch", "table": 1}    follow a table as a spectator
+    {"cmd": "resync"}               send the whole state again
+    {"cmd": "answer", "choice": "silver"}
+                                    answer the last "decide", a card
+                                    name, true, false or null
+    {"cmd": "tables"}               the open tables
+    {"cmd": "stats", "table": 1}    a table's decision latencies, kept
+                                    for a while after its game ends
+
+and what it gets back, each with a "type": "hello" (on connecting,
+with the protocol version), "table" (the table it opened or joined),
+"event" (a dom.Event, other players' draws without the card),
+"keyframe" and "delta" (the state feed, see wire.py), "decide" (a
+choice to make: the decision method, its arguments, the hand and the
+coin to spend), "tables", "stats", "over" (the final scores) and
+"error".
+
+A "feed" when joining or watching says what the client follows the
+game by: "events" (the default), "state" or "both".
+
+Everything runs on one asyncore loop (Python 2 has no asyncio; asyncore
+is its event loop), polled rather than selected so thousands of
+connections are fine, and there's no thread per game.  The engine
+can't be stopped in the middle of a turn to wait for a player, though,
+and that's where the tables work like the search bot (see mcts.py): a
+table copies its game at the start of every turn and plays the turn on
+a copy of that, answering the choices already made this turn from its
+list.  When it gets to a choice a client hasn't made yet it sends the
+question, throws that copy away and goes back to the loop.  The answer
+goes on the list and the turn is played again, up to the next question
+or the end of the turn, the events already sent skipped.  Replaying a
+turn costs a clone and a few milliseconds at most.
+
+A table holds its game, the copy at the start of the turn and the
+answers of the turn, nothing that grows with the length of the game.
+A client that doesn't read what it's sent falls behind: once
+MAX_OUTPUT bytes are waiting for it, a client on the state feed has
+them thrown away and catches up from a fresh keyframe (any events in
+there are lost), any other client is dropped.
+
+Every decision's latency, from the answer arriving to the table
+waiting on the next one, is kept for the table's stats, and a summary
+is printed when the table's game ends.
+
+"""
+
+import argparse
+import asyncore
+import collections
+import json
+import random
+import socket
+import sys
+import time
+
+import bots
+import dom
+import replay
+import simulate
+import wire
+
+
+PORT = 8765
+
+# bytes waiting to go to a client before it's dropped
+MAX_OUTPUT = 1 << 18
+
+# longest line a client may send
+MAX_LINE = 4096
+
+# latencies kept per table for its stats
+LATENCY_SAMPLES = 1000
+
+# finished tables whose stats are kept
+FINISHED_TABLES = 1000
+
+FEEDS = ["events", "state", "both"]
+
+cardFactory = dom.CardFactory()
+
+
+class Pending( Exception ):
+    # The game got to a choice a client hasn't made yet.  Not a
+    # dom.Error, which the engine catches itself.
+    pass
+
+
+# a decision's arguments in JSON: cards and players by name
+def encodeArgument( arg ):
+    if isinstance( arg, ( list, tuple )):
+        return [ encodeArgument( item ) for item in arg ]
+    if isinstance( arg, dom.Card ):
+        return arg.name
+    if isinstance( arg, dom.Player ):
+        return arg.name
+
+    return arg
+
+
+class TableDecisions( dom.Decisions ):
+    # Every player's decisions in one attempt at a turn: answers the
+    # table has already, then asks bots, or clients by raising Pending.
+    def __init__( self, table ):
+        self.table = table
+        self.position = 0
+
+    def decide( self, method, game, player, args ):
+        table = self.table
+        position = self.position
+        self.position += 1
+
+        if position < len( table.answers ):
+            return replay.decodeChoice( game, table.answers[position] )
+
+        seat = game.players.index( player )
+        bot = table.bots[seat]
+        if bot is None:
+            table.ask( seat, method, game, player, args )
+            raise Pending()
+
+        choice = getattr( bot, method )( game, player, *args )
+        table.answers.append( replay.encodeChoice( choice ))
+
+        return choice
+
+
+def makeDecider( method ):
+    def decider( self, game, player, *args ):
+
+        return self.decide( method, game, player, args )
+
+    return decider
+
+
+for method in replay.DECISIONS:
+    setattr( TableDecisions, method, makeDecider( method ))
+
+
+class Table:
+    def __init__( self, server, number, layout, cardSet, numPlayers,
+                  botNames, seed ):
+        self.server = server
+        self.number = number
+        self.layout = layout
+        self.cardSet = cardSet
+        self.seed = seed
+
+        # one per seat: the connection, or the bot, playing it
+        self.connections = [ None ] * numPlayers + [ None ] * len( botNames )
+        self.bots = [ None ] * numPlayers + [ bots.create( name, seed + i )
+                                              for (i, name) in
+                                              enumerate( botNames ) ]
+        self.names = [ None ] * numPlayers + [ "%s (bot)" % name
+                                               for name in botNames ]
+        self.spectators = []
+
+        self.game = None
+        self.current = None      # the game the events are coming from
+        self.changes = wire.Changes()
+        self.snapshot = None     # the game at the start of this turn
+        self.answers = []        # the choices made this turn, encoded
+        self.numSent = 0         # events of this turn already sent
+        self.asking = None       # ( seat, method, game, player, args )
+                                 # waiting on a client
+
+        self.numDecisions = 0
+        self.latencies = collections.deque( maxlen = LATENCY_SAMPLES )
+
+    def isFull( self ):
+
+        return None not in self.names
+
+    def summary( self ):
+
+        return {"table": self.number,
+                "layout": self.layout,
+                "players": self.names,
+                "started": self.game is not None}
+
+    def seat( self, connection, name ):
+        if self.isFull() or self.game is not None:
+            raise dom.Error( "table %d is full" % self.number )
+        if name in self.names:
+            raise dom.Error( "%s is already at table %d" % (name,
+                                                             self.number) )
+
+        seat = self.names.index( None )
+        self.names[seat] = name
+        self.connections[seat] = connection
+        connection.table = self
+        connection.seat = seat
+        connection.sendMessage( "table", table = self.number, seat = seat )
+        if connection.feed:
+            connection.feed.seat = seat
+
+        if self.isFull():
+            self.start()
+
+    def watch( self, connection ):
+        self.spectators.append( connection )
+        connection.table = self
+        connection.sendMessage( "table", table = self.number, seat = None )
+        self.resync( connection )
+
+    # send connection's state feed a keyframe of the game as it stands
+    def resync( self, connection ):
+        if connection.feed is None:
+            raise dom.Error( "not following the state" )
+
+        connection.feed.reset()
+        if self.current is not None:
+            connection.queueMessage( connection.feed.update(
+                wire.view( self.current, connection.feed.seat )))
+
+    # a client at the table has gone, a bot takes over their seat
+    def leave( self, connection ):
+        if connection in self.spectators:
+            self.spectators.remove( connection )
+            return
+
+        seat = connection.seat
+        self.connections[seat] = None
+        if self.game is None:
+            self.names[seat] = None
+            return
+
+        self.bots[seat] = bots.create( "bmu", self.seed + seat )
+        if self.asking and self.asking[0] == seat:
+            self.asking = None
+            self.advance()
+
+    # Send event to everyone who should hear about it, unless an
+    # earlier go at this turn has sent it already.  The cards drawn
+    # only go to the player drawing them.  Those on the state feed get
+    # what has changed instead, or as well.
+    def forward( self, event ):
+        if self.eventNumber < self.numSent:
+            self.eventNumber += 1
+            return
+        self.eventNumber += 1
+        self.numSent += 1
+
+        message = {"type": "event", "kind": event.kind,
+                   "player": event.playerName}
+        message.update( event.data )
+        line = json.dumps( message, separators = (",", ":") ) + "\n"
+
+        public = line
+        if event.kind == "draw":
+            del message["card"]
+            public = json.dumps( message, separators = (",", ":") ) + "\n"
+
+        for seat in range( len( self.connections )):
+            connection = self.connections[seat]
+            if connection is None or not connection.events:
+                continue
+            if self.names[seat] == event.playerName:
+                connection.queue( line )
+            else:
+                connection.queue( public )
+
+        for connection in self.spectators:
+            if connection.events:
+                connection.queue( public )
+
+        # the views are built once for each seat, of only what the
+        # event can have changed unless a keyframe is due
+        changed = self.changes.update( self.current, event )
+        views = {}
+        for connection in self.connections + self.spectators:
+            if connection is None or connection.feed is None:
+                continue
+
+            feed = connection.feed
+            key = ( feed.seat, changed is None or feed.keyframeDue() )
+            if key not in views:
+                views[key] = wire.view( self.current, feed.seat,
+                                        None if key[1] else changed )
+            message = feed.update( views[key] )
+            if message:
+                connection.queueMessage( message )
+
+    def ask( self, seat, method, game, player, args ):
+        self.asking = ( seat, method, game, player, args )
+        self.connections[seat].sendMessage(
+            "decide", method = method,
+            args = [ encodeArgument( arg ) for arg in args ],
+            hand = [ card.name for card in player.hand ],
+            coin = player.getCoin() )
+
+    def start( self ):
+        players = [ dom.Player( name ) for name in self.names ]
+        self.game = dom.Game( players, self.cardSet, cardFactory, self.seed )
+        self.game.listeners.append( self.forward )
+        self.current = self.game
+        self.eventNumber = 0
+        self.game.start()
+
+        self.newTurn()
+        self.advance()
+
+    def newTurn( self ):
+        self.snapshot = self.game.clone()
+        self.answers = []
+        self.numSent = 0
+
+    # Play on until a client has to answer or the game ends.
+    def advance( self ):
+        while True:
+            game = self.snapshot.clone()
+            game.listeners.append( self.forward )
+            self.current = game
+            self.eventNumber = 0
+            decisions = TableDecisions( self )
+            for player in game.players:
+                player.decisions = decisions
+
+            try:
+                game.playTurn()
+            except Pending:
+                return
+
+            # a game that goes on and on (a table of bots that never
+            # buy out a pile) is scored as it stands, like simulate.py
+            self.game = game
+            if (game.isOver() or
+                game.numTurns >= simulate.MAX_ROUNDS * len( game.players )):
+                self.finish()
+                return
+            self.newTurn()
+
+    def answer( self, connection, choice ):
+        if self.asking is None or self.asking[0] != connection.seat:
+            raise dom.Error( "nothing to answer" )
+
+        start = time.time()
+        self.check( choice )
+
+        # an answer that breaks the game is taken back, rather than
+        # left to break every go at the turn from now on
+        asking = self.asking
+        numAnswers = len( self.answers )
+        self.asking = None
+        self.answers.append( choice )
+        try:
+            self.advance()
+        except Exception as e:
+            del self.answers[numAnswers:]
+            self.asking = asking
+            raise dom.Error( "can't answer %s: %s" % (choice, e) )
+
+        self.numDecisions += 1
+        self.latencies.append( time.time() - start )
+
+    # raise a dom.Error unless choice (encoded) is a legal answer to
+    # the decision being asked
+    def check( self, choice ):
+        ( seat, method, game, player, args ) = self.asking
+
+        if method in dom.QUESTIONS:
+            if not isinstance( choice, bool ):
+                raise dom.Error( "%s wants true or false" % method )
+            return
+
+        if choice is None:
+            choiceId = dom.PASS
+        elif isinstance( choice, basestring ):
+            try:
+                choiceId = replay.decodeChoice( game, choice ).id
+            except KeyError:
+                raise dom.Error( "no such card: %s" % choice )
+        else:
+            raise dom.Error( "%s wants a card name or null" % method )
+
+        if not game.legalMask( player, method, args ) & dom.BITS[choiceId]:
+            raise dom.Error( "%s isn't an answer to %s now" % (choice,
+                                                               method) )
+
+    def stats( self ):
+        latencies = sorted( self.latencies )
+        if not latencies:
+            latencies = [ 0.0 ]
+
+        return {"table": self.number,
+                "over": self.number not in self.server.tables,
+                "decisions": self.numDecisions,
+                "mean ms": 1000 * sum( latencies ) / len( latencies ),
+                "median ms": 1000 * latencies[ len( latencies ) / 2 ],
+                "99% ms": 1000 * latencies[ len( latencies ) * 99 / 100 ],
+                "max ms": 1000 * latencies[-1]}
+
+    def finish( self ):
+        scores = self.game.finish()
+        for connection in self.connections + self.spectators:
+            if connection is not None:
+                connection.sendMessage( "over", scores = zip( self.names,
+                                                              scores ))
+                connection.table = None
+
+        stats = self.stats()
+        print "table %d over: %d decisions, mean %.2f ms, max %.2f ms" % \
+              (self.number, stats["decisions"], stats["mean ms"],
+               stats["max ms"])
+        # only the stats are kept once the game is over
+        del self.server.tables[self.number]
+        self.server.finished[self.number] = self.stats()
+        if len( self.server.finished ) > FINISHED_TABLES:
+            self.server.finished.popitem( last = False )
+
+
+class Connection( asyncore.dispatcher ):
+    # One client: reads lines, writes whatever the tables send it.
+    def __init__( self, sock, server ):
+        asyncore.dispatcher.__init__( self, sock, map = server.map )
+        self.server = server
+        self.table = None
+        self.seat = None
+        self.input = ""
+        self.output = []
+        self.outputSize = 0
+
+        # what the client follows the game by, see FEEDS
+        self.events = True
+        self.feed = None
+
+        # too far behind, closed as soon as the loop gets back to it
+        # rather than in the middle of a table's turn
+        self.dropped = False
+
+        self.sendMessage( "hello", protocol = wire.PROTOCOL )
+
+    def queue( self, data ):
+        if self.dropped:
+            return
+
+        self.output.append( data )
+        self.outputSize += len( data )
+        if self.outputSize <= MAX_OUTPUT:
+            return
+
+        self.output = []
+        self.outputSize = 0
+        if self.feed:
+            # the next update will be a keyframe
+            self.feed.reset()
+        else:
+            self.dropped = True
+
+    def sendMessage( self, messageType, **fields ):
+        fields["type"] = messageType
+        self.queueMessage( fields )
+
+    # queue a message, a dict with its "type"
+    def queueMessage( self, message ):
+        self.queue( json.dumps( message, separators = (",", ":") ) + "\n" )
+
+    def writable( self ):
+
+        return bool( self.output ) or self.dropped
+
+    def handle_write( self ):
+        if self.dropped:
+            self.handle_close()
+            return
+
+        data = "".join( self.output )
+        sent = self.send( data )
+        data = data[sent:]
+        self.output = [ data ] if data else []
+        self.outputSize = len( data )
+
+    def handle_read( self ):
+        self.input += self.recv( MAX_LINE )
+        while "\n" in self.input:
+            ( line, self.input ) = self.input.split( "\n", 1 )
+            if line.strip():
+                self.handleLine( line )
+
+        if len( self.input ) > MAX_LINE:
+            self.handle_close()
+
+    def handleLine( self, line ):
+        try:
+            message = json.loads( line )
+            if not isinstance( message, dict ):
+                raise ValueError( "not an object" )
+            self.server.handle( self, message )
+        except ValueError as e:
+            self.sendMessage( "error", message = "bad message: %s" % e )
+        except dom.Error as e:
+            self.sendMessage( "error", message = str( e ))
+
+    def handle_close( self ):
+        if self.table:
+            table = self.table
+            self.table = None
+            table.leave( self )
+        self.close()
+
+
+class Server( asyncore.dispatcher ):
+    def __init__( self, host, port ):
+        self.map = {}
+        asyncore.dispatcher.__init__( self, map = self.map )
+        self.create_socket( socket.AF_INET, socket.SOCK_STREAM )
+        self.set_reuse_addr()
+        self.bind( ( host, port ))
+        self.listen( 128 )
+
+        self.layouts = dom.loadLayouts()
+        self.tables = {}
+        self.finished = collections.OrderedDict()   # number -> stats
+        self.nextTable = 1
+
+    def handle_accept( self ):
+        pair = self.accept()
+        if pair is not None:
+            Connection( pair[0], self )
+
+    def getTable( self, message ):
+        table = self.tables.get( message.get( "table" ))
+        if table is None:
+            raise dom.Error( "no table %s" % message.get( "table" ))
+
+        return table
+
+    def handle( self, connection, message ):
+        command = message.get( "cmd" )
+
+        if command in ["new", "join", "watch"] and connection.table:
+            raise dom.Error( "already at table %d" % connection.table.number )
+
+        if command in ["join", "watch"]:
+            feed = message.get( "feed", "events" )
+            if feed not in FEEDS:
+                raise dom.Error( "feed must be one of %s" % \
+                                 ", ".join( FEEDS ))
+            table = self.getTable( message )
+            connection.events = feed != "state"
+            connection.feed = None
+            if feed != "events":
+                connection.feed = wire.Feed( None )
+
+        if command == "new":
+            self.newTable( connection, message )
+        elif command == "join":
+            name = message.get( "name" )
+            if not isinstance( name, basestring ) or not name:
+                raise dom.Error( "join needs a name" )
+            table.seat( connection, name )
+        elif command == "watch":
+            table.watch( connection )
+        elif command == "resync":
+            if connection.table is None:
+                raise dom.Error( "not at a table" )
+            connection.table.resync( connection )
+        elif command == "answer":
+            if connection.table is None:
+                raise dom.Error( "not at a table" )
+            connection.table.answer( connection, message.get( "choice" ))
+        elif command == "tables":
+            connection.sendMessage( "tables", tables = [
+                self.tables[number].summary()
+                for number in sorted( self.tables ) ] )
+        elif command == "stats":
+            number = message.get( "table" )
+            if isinstance( number, int ) and number in self.finished:
+                stats = self.finished[number]
+            else:
+                stats = self.getTable( message ).stats()
+            connection.sendMessage( "stats", **stats )
+        else:
+            raise dom.Error( "unknown command %s" % command )
+
+    def newTable( self, connection, message ):
+        ( layoutNames, deckLayouts ) = self.layouts
+        layout = message.get( "layout", "b" )
+        numPlayers = message.get( "players", 1 )
+        botNames = message.get( "bots", [] )
+        seed = message.get( "seed", dom.newSeed() )
+
+        if layout not in layoutNames:
+            raise dom.Error( "unknown layout %s" % layout )
+        if not isinstance( botNames, list ):
+            raise dom.Error( "bots must be a list" )
+        for name in botNames:
+            if name not in bots.STRATEGIES or name.startswith( "mcts" ):
+                raise dom.Error( "no bot %s" % name )
+        if (not isinstance( numPlayers, int ) or
+            not 1 <= numPlayers + len( botNames ) <= 4 or numPlayers < 0):
+            raise dom.Error( "a table seats 1 to 4 players" )
+        if not isinstance( seed, int ):
+            raise dom.Error( "the seed must be a number" )
+
+        cardSet = deckLayouts[layout]
+        if cardSet is None:
+            cardSet = dom.randomKingdomCards( random.Random( seed ))
+
+        table = Table( self, self.nextTable, layout, cardSet, numPlayers,
+                       botNames, seed )
+        self.tables[table.number] = table
+        self.nextTable += 1
+        connection.sendMessage( "table", table = table.number, seat = None )
+
+        if numPlayers == 0:
+            table.start()
+
+    def serve( self ):
+        asyncore.loop( timeout = 1.0, use_poll = True, map = self.map )
+
+
+def main( argv ):
+    parser = argparse.ArgumentParser(
+        prog = "dom.py serve",
+        description = "Host games for clients over TCP." )
+    parser.add_argument( "--host", default = "127.0.0.1",
+                         help = "address to listen on (default: 127.0.0.1)" )
+    parser.add_argument( "-p", "--port", type = int, default = PORT,
+                         help = "port to listen on (default: %d)" % PORT )
+    args = parser.parse_args( argv )
+
+    server = Server( args.host, args.port )
+    print "Serving on %s:%d" % (args.host, args.port)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main( sys.argv[1:] )
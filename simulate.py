@@ -0,0 +1,528 @@
+#!/usr/bin/python
+
+"""
+simulate.py: Plays bots against each other, lots of games at a time.
+
+usage: dom.py simulate [-n GAMES] [-l LAYOUT] [-s SEED] [-w WORKERS]
+                       [--log FILE [--log-format FORMAT]]
+                       [--engine ENGINE] [--sprt [--margin PERCENT]]
+                       strategy strategy [strategy ...]
+
+The strategies are bot names from bots.py or its strategies.txt file
+(priority list bots anyone can write), the layout is a shortcut
+from layouts.txt ("r" deals a random kingdom for every game).  Games
+are shared out over a pool of worker processes.  Every game gets its
+own seed, worked out from the base seed and the game's number, so a
+run gives the same results however many workers play it.
+
+With --log every event and decision of every game is written to FILE
+(see eventlog.py), ready to be replayed with "dom.py replay".  Workers
+encode the events of each game they play and the main process writes
+them out, a game at a time.
+
+With --sprt, for two strategies, GAMES is only the most games to play:
+the run stops as soon as a sequential test (Wald's SPRT) has decided
+which of the two wins more often, by at least --margin percent either
+side of 50%, or that neither does, with at most ALPHA and BETA chances
+of getting it wrong.  Lopsided matchups are settled in a few hundred
+games.  The report says how many games it took and how sure the result
+is.
+
+--engine vector plays the games with vectorsim.py instead, many times
+faster but only for money bots (treasure, victory cards and a smithy or
+moat) and without logs.  --engine check plays them with both engines
+and checks that the win rates agree, within 3 standard errors.
+
+"""
+
+import argparse
+import cStringIO
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+import bots
+import dom
+import eventlog
+import replay
+import vectorsim
+
+
+# a game that hasn't ended after this many turns per player is
+# scored as it stands
+MAX_ROUNDS = 100
+
+ENGINES = ["object", "vector", "check"]
+
+# engines disagree if a win rate differs by more than this many
+# standard errors
+AGREEMENT = 3.0
+
+# the sequential test's chances of calling the weaker strategy the
+# stronger (ALPHA) or the other way round (BETA)
+ALPHA = 0.05
+BETA = 0.05
+
+# percent either side of a 50% win rate the sequential test is for
+MARGIN = 5.0
+
+# games before the sequential test can stop, its normal approximation
+# needs a fair sample
+MIN_GAMES = 50
+
+# the card instances are shared by every game a worker plays
+cardFactory = dom.CardFactory()
+
+
+class GameResult:
+    # what happened in one game, scores are in strategy order and log
+    # is its encoded events, if they were asked for
+    def __init__( self, gameNumber, scores, numTurns, log = None ):
+        self.gameNumber = gameNumber
+        self.scores = scores
+        self.numTurns = numTurns
+        self.log = log
+
+
+class Simulation:
+    # running totals for a batch of games between strategies
+    def __init__( self, strategyNames ):
+        self.strategyNames = strategyNames
+        self.numGames = 0
+        self.numTurns = 0
+        self.wins = [ 0.0 ] * len( strategyNames )
+        self.totalVP = [ 0 ] * len( strategyNames )
+        self.totalMargin = [ 0 ] * len( strategyNames )
+
+    def add( self, result ):
+        scores = result.scores
+        best = max( scores )
+        winners = scores.count( best )
+
+        for i in range( len( scores )):
+
+            # ties share the win
+            if scores[i] == best:
+                self.wins[i] += 1.0 / winners
+
+            self.totalVP[i] += scores[i]
+            others = scores[:i] + scores[i + 1:]
+            if others:
+                self.totalMargin[i] += scores[i] - max( others )
+
+        self.numGames += 1
+        self.numTurns += result.numTurns
+
+    def winRate( self, i ):
+
+        return self.wins[i] / max( self.numGames, 1 )
+
+    def report( self ):
+        numGames = max( self.numGames, 1 )
+
+        print "Average game length: %.1f turns per player\n" % \
+              ( float( self.numTurns ) / numGames /
+                len( self.strategyNames ))
+
+        print "%-16s %9s %7s %8s %8s" % \
+              ("strategy", "wins", "win %", "avg VP", "margin")
+        for i in range( len( self.strategyNames )):
+            print "%-16s %9.1f %6.1f%% %8.1f %+8.1f" % \
+                  (self.strategyNames[i],
+                   self.wins[i],
+                   100.0 * self.winRate( i ),
+                   float( self.totalVP[i] ) / numGames,
+                   float( self.totalMargin[i] ) / numGames)
+
+
+class SequentialTest:
+    # Wald's sequential probability ratio test of the first of two
+    # strategies' win rate, as two one sided tests (Sobel and Wald):
+    # 50% against 50% + margin, and 50% against 50% - margin.  Either
+    # strategy is the stronger once its side's test says so, and
+    # they're even (within the margin) once both sides say 50%.  A game
+    # scores 1, 0.5 for a tie or 0, and the log likelihood ratios are
+    # the normal approximation using the variance of the scores so far.
+    def __init__( self, margin, alpha = ALPHA, beta = BETA ):
+        self.margin = margin
+        self.lower = math.log( beta / ( 1 - alpha ))
+        self.upper = math.log( ( 1 - beta ) / alpha )
+
+        # what each side's test has settled on: None while it's still
+        # undecided, True for the strategy being the stronger, False
+        # for 50%
+        self.sides = [ None, None ]
+
+        # each side's log likelihood ratio when it was settled
+        self.ratios = [ None, None ]
+
+        self.numGames = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.wins = 0
+        self.losses = 0
+
+    def add( self, result ):
+        scores = result.scores
+        best = max( scores )
+
+        score = 0.0
+        if scores[0] == best:
+            score = 1.0 / scores.count( best )
+
+        if score == 1.0:
+            self.wins += 1
+        elif score == 0.0:
+            self.losses += 1
+
+        self.numGames += 1
+        self.total += score
+        self.squares += score * score
+
+        if self.numGames < MIN_GAMES:
+            return
+
+        for side in range( 2 ):
+            if self.sides[side] is not None:
+                continue
+
+            llr = self.llr( side )
+            if llr >= self.upper or llr <= self.lower:
+                self.sides[side] = llr >= self.upper
+                self.ratios[side] = llr
+
+    # the log likelihood ratio of side's test, side 0 for the first
+    # strategy being the stronger, 1 for the second
+    def llr( self, side ):
+        n = self.numGames
+        if n < 2:
+            return 0.0
+
+        mean = self.total / n
+        # a run of nothing but wins would have no variance at all
+        variance = max( self.squares / n - mean * mean, 0.01 )
+
+        p0 = 0.5
+        p1 = 0.5 + self.margin if side == 0 else 0.5 - self.margin
+
+        return ( p1 - p0 ) * ( self.total - n * ( p0 + p1 ) / 2 ) / variance
+
+    # side's log likelihood ratio as it was when the side was settled,
+    # or as it is now if it hasn't been
+    def ratio( self, side ):
+        if self.sides[side] is None:
+            return self.llr( side )
+
+        return self.ratios[side]
+
+    # None while undecided, then 0 if the first strategy is the
+    # stronger, 1 if the second is, or "even"
+    def decision( self ):
+        for side in range( 2 ):
+            if self.sides[side]:
+                return side
+
+        if self.sides == [ False, False ]:
+            return "even"
+
+        return None
+
+    # how likely it is that the first strategy is the stronger, from
+    # its wins and losses so far (ties say nothing)
+    def confidence( self ):
+        decisive = self.wins + self.losses
+        if not decisive:
+            return 0.5
+
+        return 0.5 * ( 1 + math.erf( ( self.wins - self.losses ) /
+                                     math.sqrt( 2.0 * decisive )))
+
+    def report( self, strategyNames, maxGames ):
+        decision = self.decision()
+        ratios = "log likelihood ratios %.2f and %.2f, bounds %.2f and " \
+                 "%.2f" % (self.ratio( 0 ), self.ratio( 1 ), self.lower,
+                           self.upper)
+
+        if decision is None:
+            print "Not decided after %d games (%s)" % (self.numGames, ratios)
+        elif decision == "even":
+            print "Decided after %d of at most %d games: neither is " \
+                  "stronger by %g%% or more (%s)" % \
+                  (self.numGames, maxGames, 100 * self.margin, ratios)
+        else:
+            print "Decided after %d of at most %d games: %s is the " \
+                  "stronger (%s)" % (self.numGames, maxGames,
+                                     strategyNames[decision], ratios)
+
+        confidence = self.confidence()
+        print "%.2f%% sure %s is the stronger\n" % \
+              (100 * max( confidence, 1 - confidence ),
+               strategyNames[ 0 if confidence >= 0.5 else 1 ])
+
+
+# Play one complete game.  task is ( gameNumber, seed, strategyNames,
+# cardSet, logFormat ), a cardSet of None means deal a random kingdom
+# and a logFormat of None means don't log the game.
+def playGame( task ):
+    ( gameNumber, seed, strategyNames, cardSet, logFormat ) = task
+
+    if cardSet is None:
+        cardSet = dom.randomKingdomCards( random.Random( seed ))
+
+    # rotate the seating so no strategy always goes first
+    numPlayers = len( strategyNames )
+    first = gameNumber % numPlayers
+    seats = range( first, numPlayers ) + range( first )
+
+    players = []
+    for i in seats:
+        players.append( dom.Player( "%d %s" % (i + 1, strategyNames[i]),
+                                    bots.create( strategyNames[i],
+                                                 seed * 4 + i )))
+
+    game = dom.Game( players, cardSet, cardFactory, seed )
+
+    log = None
+    if logFormat == "binary":
+        log = eventlog.BinaryLogWriter( cStringIO.StringIO(), header = False )
+    elif logFormat:
+        log = eventlog.JsonLogWriter( cStringIO.StringIO() )
+    if log:
+        game.listeners.append( log )
+        replay.recordDecisions( game )
+
+    game.start()
+    while (not game.isOver() and
+           game.numTurns < MAX_ROUNDS * numPlayers):
+        game.playTurn()
+
+    seatScores = game.finish()
+    scores = [ 0 ] * numPlayers
+    for seat in range( numPlayers ):
+        scores[ seats[seat] ] = seatScores[seat]
+
+    result = GameResult( gameNumber, scores, game.numTurns )
+    if log:
+        log.flush()
+        result.log = log.file.getvalue()
+
+    return result
+
+
+# GameResults in game number order, from results coming in any order
+# (from a pool or the vector engine's batches), holding back those
+# that come early.  A run that stops early then stops at the same game
+# with the same results however many workers played it.
+def inOrder( results ):
+    waiting = {}
+    nextNumber = 0
+    for result in results:
+        waiting[result.gameNumber] = result
+        while nextNumber in waiting:
+            yield waiting.pop( nextNumber )
+            nextNumber += 1
+
+
+# Play numGames games between the strategies, returns a Simulation
+# holding the totals.  If log is an eventlog writer every game's events
+# are added to it.  engine "vector" plays them with vectorsim.py, in
+# this process and without a log.  If stop is given it's called with
+# every GameResult in game number order, and the run ends early once
+# it returns True.
+def run( strategyNames, cardSet, numGames, seed, workers = None,
+         log = None, engine = "object", stop = None ):
+    if engine == "vector":
+        simulation = Simulation( strategyNames )
+        results = ( GameResult( gameNumber, scores, numTurns )
+                    for (gameNumber, scores, numTurns) in
+                    vectorsim.playGames( strategyNames, cardSet, numGames,
+                                         seed, MAX_ROUNDS ))
+        for result in inOrder( results ):
+            simulation.add( result )
+            if stop and stop( result ):
+                break
+        return simulation
+
+    logFormat = None
+    if isinstance( log, eventlog.BinaryLogWriter ):
+        logFormat = "binary"
+    elif log:
+        logFormat = "jsonl"
+
+    tasks = ( ( i, dom.gameSeed( seed, i ), strategyNames, cardSet,
+                logFormat )
+              for i in xrange( numGames ) )
+    simulation = Simulation( strategyNames )
+
+    if workers == 1:
+        for task in tasks:
+            result = playGame( task )
+            simulation.add( result )
+            if log:
+                log.append( result.log )
+            if stop and stop( result ):
+                break
+        return simulation
+
+    pool = multiprocessing.Pool( workers )
+    try:
+        # big enough chunks to keep the workers busy without going back
+        # to the pool for every game, small enough to share out evenly
+        chunkSize = max( 1, numGames / ( len( pool._pool ) * 16 ))
+        for result in inOrder( pool.imap_unordered( playGame, tasks,
+                                                    chunkSize )):
+            simulation.add( result )
+            if log:
+                log.append( result.log )
+            if stop and stop( result ):
+                break
+    finally:
+        pool.terminate()
+
+    return simulation
+
+
+# Print how far apart two simulations of the same strategies are, in
+# standard errors of the difference in win rate.  Returns whether they
+# agree.
+def compare( simulation, other ):
+    print "%-16s %8s %8s %8s %8s" % \
+          ("strategy", "win %", "win %", "diff", "std errs")
+
+    agree = True
+    for i in range( len( simulation.strategyNames )):
+        rate = simulation.winRate( i )
+        otherRate = other.winRate( i )
+        variance = ( rate * ( 1 - rate ) / max( simulation.numGames, 1 ) +
+                     otherRate * ( 1 - otherRate ) / max( other.numGames, 1 ))
+        errors = abs( rate - otherRate ) / max( variance ** 0.5, 1e-9 )
+        if errors > AGREEMENT:
+            agree = False
+
+        print "%-16s %7.1f%% %7.1f%% %+7.1f%% %8.1f" % \
+              (simulation.strategyNames[i], 100.0 * rate, 100.0 * otherRate,
+               100.0 * ( rate - otherRate ), errors)
+
+    return agree
+
+
+def main( argv ):
+    parser = argparse.ArgumentParser(
+        prog = "dom.py simulate",
+        description = "Play bots against each other." )
+    parser.add_argument( "strategies", nargs = "+",
+                         choices = sorted( bots.STRATEGIES ),
+                         metavar = "strategy",
+                         help = "bots to play: %s" % \
+                         ", ".join( sorted( bots.STRATEGIES )))
+    parser.add_argument( "-n", "--games", type = int, default = 1000,
+                         help = "number of games to play" )
+    parser.add_argument( "-l", "--layout", default = "b",
+                         help = "layout shortcut from %s" % \
+                         dom.DECK_LAYOUTS_FILE )
+    parser.add_argument( "-s", "--seed", type = int, default = 1,
+                         help = "seed every game's own is worked out from" )
+    parser.add_argument( "-w", "--workers", type = int, default = None,
+                         help = "worker processes (default: one per core)" )
+    parser.add_argument( "--log", metavar = "FILE",
+                         help = "write every game's events to FILE" )
+    parser.add_argument( "--log-format", choices = eventlog.FORMATS,
+                         default = "jsonl",
+                         help = "log file format (default: jsonl)" )
+    parser.add_argument( "--engine", choices = ENGINES, default = "object",
+                         help = "object (dom.py itself), vector " \
+                         "(vectorsim.py) or check (both, compared)" )
+    parser.add_argument( "--sprt", action = "store_true",
+                         help = "stop as soon as it's clear which of two " \
+                         "strategies is the stronger, GAMES at most" )
+    parser.add_argument( "--margin", type = float, default = MARGIN,
+                         metavar = "PERCENT",
+                         help = "win rate difference from 50%% the " \
+                         "--sprt test is for (default: %(default)g%%)" )
+    args = parser.parse_args( argv )
+
+    if len( args.strategies ) > 4:
+        parser.error( "at most 4 strategies can play" )
+
+    test = None
+    if args.sprt:
+        if len( args.strategies ) != 2:
+            parser.error( "--sprt compares exactly 2 strategies" )
+        if args.engine == "check":
+            parser.error( "--sprt doesn't go with --engine check" )
+        if not 0 < args.margin < 50:
+            parser.error( "--margin must be between 0 and 50" )
+        test = SequentialTest( args.margin / 100.0 )
+
+    ( layoutNames, deckLayouts ) = dom.loadLayouts()
+    if args.layout not in layoutNames:
+        parser.error( "unknown layout %s" % args.layout )
+
+    if args.engine != "object":
+        if not vectorsim.available():
+            parser.error( "the vector engine needs numpy" )
+        if args.log:
+            parser.error( "the vector engine doesn't write logs" )
+        if deckLayouts[args.layout] is None:
+            parser.error( "the vector engine needs a fixed layout" )
+        for strategyName in args.strategies:
+            reason = vectorsim.unsupported( strategyName )
+            if reason:
+                parser.error( "the vector engine can't play %s: %s" % \
+                              (strategyName, reason) )
+
+    if args.engine == "check":
+        simulations = []
+        for engine in ["object", "vector"]:
+            print "%s engine:" % engine
+            start = time.time()
+            simulations.append( run( args.strategies,
+                                     deckLayouts[args.layout], args.games,
+                                     args.seed, args.workers,
+                                     engine = engine ))
+            elapsed = time.time() - start
+            print "%.1f seconds, %.0f games/second\n" % \
+                  (elapsed, args.games / max( elapsed, 1e-9 ))
+            simulations[-1].report()
+            print
+
+        if not compare( simulations[0], simulations[1] ):
+            print "\nThe engines disagree."
+            raise SystemExit( 1 )
+        return
+
+    print "%d games of %s on %s (%s), seed %d" % \
+          (args.games, " vs ".join( args.strategies ),
+           layoutNames[args.layout], args.layout, args.seed)
+
+    log = None
+    if args.log:
+        log = eventlog.openLog( args.log, args.log_format )
+
+    # end the run once the sequential test is decided
+    def stop( result ):
+        test.add( result )
+
+        return test.decision() is not None
+
+    start = time.time()
+    try:
+        simulation = run( args.strategies, deckLayouts[args.layout],
+                          args.games, args.seed, args.workers, log,
+                          args.engine, stop if test else None )
+    finally:
+        if log:
+            log.close()
+    elapsed = time.time() - start
+
+    print "%.1f seconds, %.0f games/second\n" % \
+          (elapsed, simulation.numGames / max( elapsed, 1e-9 ))
+    if test:
+        test.report( args.strategies, args.games )
+    simulation.report()
+
+
+if __name__ == "__main__":
+    main( sys.argv[1:] )
@@ -0,0 +1,257 @@
+#!/usr/bin/python
+
+"""
+tournament.py: Every bot against every other on every layout.
+
+usage: dom.py tournament [-n GAMES] [-l LAYOUT] [-s SEED] [-w WORKERS]
+                         [strategy ...]
+
+Plays a round robin of two player games between the strategies (by
+default every registered bot but the slow search ones) on each layout
+in layouts.txt, GAMES games a pairing, and prints a table per layout:
+each strategy's win rate against each opponent and overall, with a 95%
+confidence interval on the overall rate (Wilson's, which stays inside
+0-100% and is lopsided near either end, as it should be), then the
+overall rates across every layout.
+
+Games are numbered and seeded as simulate.py does it, so a pairing's
+games are the ones "dom.py simulate -s SEED" would play, whatever the
+number of workers.
+
+Some layouts take far longer than others (gardens and workshop games
+go on and on, big money ones are over in 15 turns), so the games are
+not simply shared out evenly.  The first PILOT games of every pairing
+are played first, and their average length in turns is taken as what
+a game of that pairing costs: unlike their time it doesn't jump about
+with whatever else the machine is doing.  The rest are cut into chunks
+of about the same expected number of turns and handed to the workers
+longest first, so no worker is left with a long chunk at the end while
+the others sit idle.
+
+"""
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+import bots
+import dom
+import simulate
+
+
+# bots too slow to play thousands of games
+SLOW_STRATEGIES = ["mcts", "mcts-parallel"]
+
+# games of every pairing played first, to see how long its games go on
+PILOT = 10
+
+# chunks handed out per worker, more balances better but costs more
+# trips to the pool
+CHUNKS_PER_WORKER = 16
+
+# 95% confidence
+Z = 1.96
+
+
+# Play some games of one pairing.  task is ( layout, cardSet,
+# strategyNames, gameNumbers, seed ), returns ( layout, strategyNames,
+# GameResults ).
+def playGames( task ):
+    ( layout, cardSet, strategyNames, gameNumbers, seed ) = task
+
+    results = [ simulate.playGame( ( i, dom.gameSeed( seed, i ),
+                                     strategyNames, cardSet, None ))
+                for i in gameNumbers ]
+
+    return ( layout, strategyNames, results )
+
+
+# run tasks on pool (or here if it's None), yielding the results
+def runTasks( pool, tasks ):
+    if pool is None:
+        return ( playGames( task ) for task in tasks )
+
+    return pool.imap_unordered( playGames, tasks )
+
+
+# Cut the games after the pilot into chunks of about the same expected
+# number of turns, longest first.  cost is ( layout, pairing ) -> turns
+# a game.
+def schedule( deckLayouts, numGames, seed, cost, numWorkers ):
+    total = 0.0
+    for key in cost:
+        total += cost[key] * max( numGames - PILOT, 0 )
+    chunkTurns = total / ( numWorkers * CHUNKS_PER_WORKER ) or 1.0
+
+    chunks = []
+    for (layout, pairing) in cost:
+        perChunk = max( 1, int( chunkTurns / max( cost[( layout, pairing )],
+                                                 1.0 )))
+        for start in xrange( PILOT, numGames, perChunk ):
+            gameNumbers = range( start, min( start + perChunk, numGames ))
+            chunks.append( ( cost[( layout, pairing )] * len( gameNumbers ),
+                             ( layout, deckLayouts[layout], pairing,
+                               gameNumbers, seed )))
+
+    chunks.sort( key = lambda chunk: chunk[0], reverse = True )
+
+    return [ task for (expected, task) in chunks ]
+
+
+class Table:
+    # The results on one layout: wins[a][b] and games[a][b] are a's
+    # wins and games against b.
+    def __init__( self, strategyNames ):
+        self.strategyNames = strategyNames
+        self.wins = {}
+        self.games = {}
+        for name in strategyNames:
+            self.wins[name] = dict( ( other, 0.0 ) for other in strategyNames )
+            self.games[name] = dict( ( other, 0 ) for other in strategyNames )
+
+    def add( self, pairing, result ):
+        scores = result.scores
+        best = max( scores )
+        for i in range( 2 ):
+            ( name, other ) = ( pairing[i], pairing[1 - i] )
+            self.games[name][other] += 1
+            if scores[i] == best:
+                self.wins[name][other] += 1.0 / scores.count( best )
+
+    # name's win rate against every opponent, and the Wilson score 95%
+    # confidence interval around it, ( rate, low, high )
+    def overall( self, name ):
+        wins = sum( self.wins[name].values() )
+        games = sum( self.games[name].values() )
+        if games == 0:
+            return ( 0.0, 0.0, 1.0 )
+        rate = wins / games
+
+        centre = ( rate + Z * Z / ( 2 * games )) / ( 1 + Z * Z / games )
+        spread = Z / ( 1 + Z * Z / games ) * \
+                 ( rate * ( 1 - rate ) / games +
+                   Z * Z / ( 4 * games * games )) ** 0.5
+
+        return ( rate, max( centre - spread, 0.0 ),
+                 min( centre + spread, 1.0 ))
+
+    def report( self ):
+        names = sorted( self.strategyNames,
+                        key = lambda name: self.overall( name )[0],
+                        reverse = True )
+
+        print "%-16s %19s  " % ("strategy", "overall") + \
+              " ".join( [ "%6s" % name[:6] for name in names ] )
+        for name in names:
+            ( rate, low, high ) = self.overall( name )
+            row = []
+            for other in names:
+                if other == name:
+                    row.append( "%6s" % "-" )
+                else:
+                    row.append( "%5.0f%%" % \
+                                ( 100.0 * self.wins[name][other] /
+                                  max( self.games[name][other], 1 )))
+            print "%-16s %5.1f%% (%4.1f-%5.1f)  " % \
+                  (name, 100 * rate, 100 * low, 100 * high) + " ".join( row )
+
+
+def main( argv ):
+    pool = sorted( name for name in bots.STRATEGIES
+                   if name not in SLOW_STRATEGIES )
+
+    parser = argparse.ArgumentParser(
+        prog = "dom.py tournament",
+        description = "Play every bot against every other on every " \
+        "layout." )
+    parser.add_argument( "strategies", nargs = "*", metavar = "strategy",
+                         help = "bots to play (default: %s)" % \
+                         ", ".join( pool ))
+    parser.add_argument( "-n", "--games", type = int, default = 100,
+                         help = "games per pairing and layout " \
+                         "(default: 100)" )
+    parser.add_argument( "-l", "--layout", action = "append",
+                         dest = "layouts", metavar = "LAYOUT",
+                         help = "layout shortcut, once for each layout " \
+                         "(default: every layout in %s)" % \
+                         dom.DECK_LAYOUTS_FILE )
+    parser.add_argument( "-s", "--seed", type = int, default = 1,
+                         help = "seed every pairing's games are seeded " \
+                         "from" )
+    parser.add_argument( "-w", "--workers", type = int, default = None,
+                         help = "worker processes (default: one per core)" )
+    args = parser.parse_args( argv )
+
+    strategyNames = args.strategies or pool
+    for name in strategyNames:
+        if name not in bots.STRATEGIES:
+            parser.error( "unknown strategy %s" % name )
+    if len( strategyNames ) < 2:
+        parser.error( "a tournament needs at least 2 strategies" )
+
+    ( layoutNames, deckLayouts ) = dom.loadLayouts()
+    layouts = args.layouts or sorted( layout for layout in deckLayouts
+                                      if deckLayouts[layout] is not None )
+    for layout in layouts:
+        if deckLayouts.get( layout ) is None:
+            parser.error( "%s isn't a fixed layout" % layout )
+
+    pairings = [ ( strategyNames[i], strategyNames[j] )
+                 for i in range( len( strategyNames ))
+                 for j in range( i + 1, len( strategyNames )) ]
+
+    print "%d games a pairing, %d pairings, %d layouts, seed %d" % \
+          (args.games, len( pairings ), len( layouts ), args.seed)
+
+    workers = args.workers or multiprocessing.cpu_count()
+    workerPool = None
+    if workers > 1:
+        workerPool = multiprocessing.Pool( workers )
+
+    tables = dict( ( layout, Table( strategyNames ))
+                   for layout in layouts )
+    cost = {}
+    start = time.time()
+    try:
+        pilot = [ ( layout, deckLayouts[layout], pairing,
+                    range( min( PILOT, args.games )), args.seed )
+                  for layout in layouts for pairing in pairings ]
+        for (layout, pairing, results) in runTasks( workerPool, pilot ):
+            cost[( layout, pairing )] = \
+                sum( result.numTurns for result in results ) / \
+                float( max( len( results ), 1 ))
+            for result in results:
+                tables[layout].add( pairing, result )
+
+        tasks = schedule( deckLayouts, args.games, args.seed,
+                          cost, workers )
+        for (layout, pairing, results) in runTasks( workerPool, tasks ):
+            for result in results:
+                tables[layout].add( pairing, result )
+    finally:
+        if workerPool:
+            workerPool.terminate()
+
+    elapsed = time.time() - start
+    numGames = args.games * len( pairings ) * len( layouts )
+    print "%.1f seconds, %.0f games/second" % \
+          (elapsed, numGames / max( elapsed, 1e-9 ))
+
+    for layout in layouts:
+        print "\n%s (%s)\n" % (layoutNames[layout], layout)
+        tables[layout].report()
+
+    # every layout together
+    print "\nall layouts\n"
+    total = Table( strategyNames )
+    for table in tables.values():
+        for name in strategyNames:
+            for other in strategyNames:
+                total.wins[name][other] += table.wins[name][other]
+                total.games[name][other] += table.games[name][other]
+    total.report()
+
+
+if __name__ == "__main__":
+    main( sys.argv[1:] )
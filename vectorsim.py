@@ -0,0 +1,340 @@
+#!/usr/bin/python
+
+"""
+vectorsim.py: Thousands of simple games at once, as numpy arrays.
+
+Most of what a money strategy does is shuffle, draw five cards, add up
+their coin and buy down a priority list.  For bots that do nothing else
+(treasure and victory cards plus at most one terminal draw card, like
+Big Money and Smithy Big Money) this engine plays a whole batch of games
+in step, one turn of every game at a time: each player's cards are
+counts per card in arrays of ( games, cards ), their draw piles rows of
+card codes, and shuffles, draws, coin totals and buy rules are array
+operations across all the games in the batch.
+
+The games are the same games dom.py plays, by the same rules and with
+the same bots' buy rules, but not the same deals: the numbers agree
+with the object engine's statistically, not game for game.
+"dom.py simulate --engine check" plays both and compares them.
+
+Needs numpy, available() says whether it's there.  unsupported() says
+why a bot can't play here.
+
+"""
+
+import bots
+import dom
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# the cards every game has that these bots may buy
+BASIC_CARDS = ["copper", "silver", "gold", "estate", "duchy", "province"]
+
+# terminal actions that do nothing but draw, and how many they draw
+DRAW_CARDS = {"smithy": 3, "moat": 2}
+
+# games played in step at once, in as many batches as it takes
+BATCH_SIZE = 4096
+
+cardFactory = dom.CardFactory()
+
+
+def available():
+
+    return numpy is not None
+
+
+# None if the bot called strategyName can play in this engine,
+# otherwise the reason why not
+def unsupported( strategyName ):
+    bot = bots.create( strategyName, 0 )
+    if not isinstance( bot, bots.PriorityBot ):
+        return "%s isn't a priority list bot" % strategyName
+
+    for method in ["chooseAction", "chooseBuy"]:
+        if (getattr( bot.__class__, method ).im_func is not
+            getattr( bots.PriorityBot, method ).im_func):
+            return "%s makes its own %s decisions" % (strategyName, method)
+
+    drawCards = set()
+    for rule in bot.buyRules:
+        if rule.cardName in DRAW_CARDS:
+            drawCards.add( rule.cardName )
+        elif rule.cardName not in BASIC_CARDS:
+            return "%s buys %s" % (strategyName, rule.cardName)
+
+    if len( drawCards ) > 1:
+        return "%s buys more than one kind of action" % strategyName
+
+    return None
+
+
+class Strategy:
+    # A bot's buy rules as ( column, conditions ), and the column of
+    # the draw card it plays, or None.
+    def __init__( self, strategyName, columns ):
+        bot = bots.create( strategyName, 0 )
+        self.rules = [ ( columns.index( rule.cardName ), rule.conditions )
+                       for rule in bot.buyRules ]
+
+        self.drawColumn = None
+        self.numDraws = 0
+        for rule in bot.buyRules:
+            if rule.cardName not in DRAW_CARDS:
+                continue
+
+            # what a PriorityBot does with an action in hand
+            if bot.playOrder is None or rule.cardName in bot.playOrder:
+                self.drawColumn = columns.index( rule.cardName )
+                self.numDraws = DRAW_CARDS[rule.cardName]
+
+
+class Batch:
+    # numGames games between strategyNames, in seat order.  Every
+    # player has their cards in hand, discards and all they own as
+    # counts per column, and their draw pile as a row of columns with
+    # the next card at pos and the end at size.  The columns are the
+    # cards the bots buy and any of cardNames.
+    def __init__( self, strategyNames, cardSet, numGames, maxRounds, rng,
+                  cardNames = () ):
+        numPlayers = len( strategyNames )
+
+        self.columns = list( BASIC_CARDS )
+        for strategyName in strategyNames:
+            for rule in bots.create( strategyName, 0 ).buyRules:
+                if rule.cardName not in self.columns:
+                    self.columns.append( rule.cardName )
+        for cardName in cardNames:
+            if cardName not in self.columns:
+                self.columns.append( cardName )
+
+        cards = [ cardFactory.create( cardName ) for cardName in self.columns ]
+        self.values = numpy.array( [ card.value for card in cards ],
+                                   numpy.int16 )
+        self.vps = numpy.array( [ card.vp for card in cards ], numpy.int16 )
+        self.costs = numpy.array( [ card.cost for card in cards ],
+                                  numpy.int16 )
+        self.province = self.columns.index( "province" )
+
+        self.strategies = [ Strategy( strategyName, self.columns )
+                            for strategyName in strategyNames ]
+        self.numPlayers = numPlayers
+        self.numGames = numGames
+        self.maxRounds = maxRounds
+        self.rng = rng
+
+        # the piles as CardSupply sets them up, starting coppers taken
+        supply = []
+        for cardName in self.columns:
+            if cardName in ["estate", "duchy", "province"]:
+                supply.append( 8 if numPlayers <= 2 else 12 )
+            elif cardName == "copper":
+                supply.append( 60 - 7 * numPlayers )
+            elif cardName == "silver":
+                supply.append( 40 )
+            elif cardName == "gold":
+                supply.append( 30 )
+            elif cardName in cardSet:
+                supply.append( 10 )
+            else:
+                supply.append( 0 )
+        self.initialSupply = numpy.array( supply, numpy.int16 )
+        self.supply = numpy.tile( self.initialSupply, ( numGames, 1 ))
+
+        # at most one card bought a turn
+        width = 10 + maxRounds
+        shape = ( numPlayers, numGames, len( self.columns ))
+        self.owned = numpy.zeros( shape, numpy.int16 )
+        self.hand = numpy.zeros( shape, numpy.int16 )
+        self.discard = numpy.zeros( shape, numpy.int16 )
+        self.deck = numpy.zeros( ( numPlayers, numGames, width ), numpy.int8 )
+        self.pos = numpy.zeros( ( numPlayers, numGames ), numpy.int16 )
+        self.size = numpy.zeros( ( numPlayers, numGames ), numpy.int16 )
+
+        self.numTurns = numpy.zeros( numGames, numpy.int32 )
+
+    # Shuffle player's discards into a new deck in the games in rows,
+    # which have run out of deck.  Each card is sorted by a random key
+    # and the empty slots after the last card by a key bigger than any.
+    def reshuffle( self, player, rows ):
+        counts = self.discard[player][rows]
+        totals = counts.sum( 1 )
+        width = totals.max()
+        if width == 0:
+            return
+
+        # slot i holds the first column whose running total is past i
+        ends = counts.cumsum( 1 )
+        slots = numpy.arange( width )
+        codes = ( slots[None, None, :] >= ends[:, :, None] ).sum( 1 )
+
+        keys = self.rng.random_sample( codes.shape )
+        keys[codes == len( self.columns )] = 2.0
+        order = keys.argsort( 1 )
+        codes = codes[numpy.arange( len( rows ))[:, None], order]
+
+        self.deck[player][rows, :width] = codes
+        self.pos[player][rows] = 0
+        self.size[player][rows] = totals
+        self.discard[player][rows] = 0
+
+    # player draws numCards in the games in rows, like Player.drawCards
+    def draw( self, player, rows, numCards ):
+        pos = self.pos[player]
+        size = self.size[player]
+        hand = self.hand[player]
+
+        for i in xrange( numCards ):
+            out = rows[pos[rows] >= size[rows]]
+            if len( out ):
+                self.reshuffle( player, out )
+
+            ready = rows[pos[rows] < size[rows]]
+            cards = self.deck[player][ready, pos[ready]]
+            hand[ready, cards] += 1
+            pos[ready] += 1
+
+    # deal the games in rows (default: all of them) from the start
+    def start( self, rows = None ):
+        if rows is None:
+            rows = numpy.arange( self.numGames )
+        copper = self.columns.index( "copper" )
+        estate = self.columns.index( "estate" )
+
+        self.supply[rows] = self.initialSupply
+        for array in [ self.owned, self.hand, self.discard, self.pos,
+                       self.size ]:
+            array[:, rows] = 0
+        self.numTurns[rows] = 0
+
+        for player in range( self.numPlayers ):
+            for (column, n) in [ ( copper, 7 ), ( estate, 3 ) ]:
+                self.owned[player][rows, column] = n
+                self.discard[player][rows, column] = n
+            self.draw( player, rows, 5 )
+
+    # the value of a buy rule variable for each game in rows
+    def variable( self, name, player, rows, column, coin, numHands ):
+        if name == "count":
+            return self.owned[player][rows, column]
+        if name == "provinces":
+            return self.supply[rows, self.province]
+        if name == "money":
+            return self.owned[player][rows].dot( self.values )
+        if name == "cards":
+            return self.owned[player][rows].sum( 1 )
+        if name == "coin":
+            return coin
+
+        return numHands
+
+    # The start of player's turn in the games in rows: play the draw
+    # card if they have one.  Returns the rows they played it in.
+    def startTurn( self, player, rows ):
+        strategy = self.strategies[player]
+        hand = self.hand[player]
+
+        playing = rows[:0]
+        if strategy.drawColumn is not None:
+            column = strategy.drawColumn
+            playing = rows[hand[rows, column] > 0]
+            hand[playing, column] -= 1
+            self.draw( player, playing, strategy.numDraws )
+
+        return playing
+
+    # the column player's buy rules pick in each of rows, -1 for none
+    def chooseBuys( self, player, rows, numHands ):
+        coin = self.hand[player][rows].dot( self.values )
+        choice = numpy.empty( len( rows ), numpy.int16 )
+        choice.fill( -1 )
+        for (column, conditions) in self.strategies[player].rules:
+            applies = ( ( choice < 0 ) & ( coin > 0 ) &
+                        ( coin >= self.costs[column] ) &
+                        ( self.supply[rows, column] > 0 ))
+            for (name, compare, number) in conditions:
+                value = self.variable( name, player, rows, column, coin,
+                                       numHands )
+                applies &= compare( value, number )
+            choice[applies] = column
+
+        return choice
+
+    # The rest of player's turn in rows: buy the column in choice (-1
+    # for nothing) and clean up.  playing is what startTurn returned.
+    def finishTurn( self, player, rows, playing, choice ):
+        hand = self.hand[player]
+        discard = self.discard[player]
+
+        bought = choice >= 0
+        buyers = rows[bought]
+        cards = choice[bought]
+        self.supply[buyers, cards] -= 1
+        discard[buyers, cards] += 1
+        self.owned[player][buyers, cards] += 1
+
+        discard[rows] += hand[rows]
+        if len( playing ):
+            discard[playing, self.strategies[player].drawColumn] += 1
+        hand[rows] = 0
+        self.draw( player, rows, 5 )
+
+        self.numTurns[rows] += 1
+
+    # player's turn in the games in rows: play the draw card if they
+    # have one, buy by the first rule that applies, clean up
+    def playTurn( self, player, rows, numHands ):
+        playing = self.startTurn( player, rows )
+        self.finishTurn( player, rows, playing,
+                         self.chooseBuys( player, rows, numHands ))
+
+    # Play every game to the end, returns the scores, ( players,
+    # games ).  Only the province pile can run out (there are never
+    # three kingdom piles in play), so that's the only ending.
+    def play( self ):
+        self.start()
+
+        rows = numpy.arange( self.numGames )
+        for turn in xrange( self.maxRounds * self.numPlayers ):
+            player = turn % self.numPlayers
+            self.playTurn( player, rows, turn / self.numPlayers + 1 )
+
+            rows = rows[self.supply[rows, self.province] > 0]
+            if not len( rows ):
+                break
+
+        return self.owned.dot( self.vps )
+
+
+# Play numGames games between the strategies, numbered and seated as
+# simulate.py does it (the first player moves round by game number).
+# Yields ( gameNumber, scores in strategy order, turns ) for every
+# game, not in game number order.
+def playGames( strategyNames, cardSet, numGames, seed, maxRounds ):
+    numPlayers = len( strategyNames )
+
+    for start in xrange( 0, numGames, BATCH_SIZE ):
+        end = min( start + BATCH_SIZE, numGames )
+        rng = numpy.random.RandomState( dom.gameSeed( seed, start ))
+
+        for first in range( numPlayers ):
+            gameNumbers = [ i for i in xrange( start, end )
+                            if i % numPlayers == first ]
+            if not gameNumbers:
+                continue
+
+            seats = range( first, numPlayers ) + range( first )
+            batch = Batch( [ strategyNames[i] for i in seats ], cardSet,
+                           len( gameNumbers ), maxRounds, rng )
+            seatScores = batch.play()
+
+            for g in range( len( gameNumbers )):
+                scores = [ 0 ] * numPlayers
+                for seat in range( numPlayers ):
+                    scores[ seats[seat] ] = int( seatScores[seat, g] )
+
+                yield ( gameNumbers[g], scores, int( batch.numTurns[g] ))
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+
+"""
+wire.py: The game state as server.py's clients see it, sent as deltas.
+
+A client following a table with the state feed doesn't get the whole
+table after every event (the way the console reprints the hand and the
+supply counts).  What one viewer may see of a game is a flat dict,
+view(), of a few dozen keys:
+
+    turn, current              turns played, whose turn it is
+    supply/NAME                cards left in each pile
+    pN/hand                    player N's hand, sorted (their own only)
+    pN/handSize, pN/deck,      how many cards player N has in hand, in
+    pN/discard                 their deck and in their discards
+    pN/inPlay                  the cards player N has in play
+    pN/actions, pN/buys,       player N's counters this turn (coin
+    pN/coin, pN/turns          only for the viewer's own)
+
+and after an event the viewer is sent only the keys that changed:
+
+    {"type": "delta", "v": 12, "set": {"supply/silver": 37, ...}}
+
+and nothing at all if none did.  "v" is the viewer's state version, one
+more with every message, so a client knows a delta follows on from what
+it has.  Every KEYFRAME_EVERY versions, to a new viewer and to one that
+asks for it (or falls behind, see server.py), the whole view goes out
+instead:
+
+    {"type": "keyframe", "v": 12, "protocol": 1, "state": {...}}
+
+A client that has missed anything drops what it has and starts again
+from the next keyframe, rather than needing every delta since the start
+of the game.  PROTOCOL goes up whenever the keys or messages change.
+
+Nor does the server build the whole view after every event.  What an
+event can have changed follows from its kind (Changes): a buy or gain
+the pile it came from, and the cards and counters of the player it
+happened to and of the player whose turn it is.  Only those keys are
+built and compared.  The engine changes some things just after the
+event that goes with them (a buy emits "buy" before the coin is spent),
+so each event's keys are looked at again with the next event's.  The
+start of a turn looks at the player before too, for their cleanup, and
+the events of dealing the starting decks rebuild everything.
+
+"""
+
+
+PROTOCOL = 1
+
+# a full state every this many versions
+KEYFRAME_EVERY = 64
+
+# events after which anything at all may have changed
+EVERYTHING = ["game start", "game over"]
+
+# events that take a card from a supply pile, or tell of one taken
+FROM_SUPPLY = ["buy", "gain", "pile empty"]
+
+
+# What an event may have changed: ( the supply piles, the players by
+# index ), or None for everything.  Anything may change while the
+# starting decks are dealt, before the first turn.
+def touched( game, event ):
+    if (event.kind in EVERYTHING or
+        game.players[game.currentPlayer].numHands == 0):
+        return None
+
+    piles = set()
+    if event.kind in FROM_SUPPLY:
+        piles.add( event.data["card"] )
+
+    # a turn follows the cleanup of the one before
+    players = set( [ game.currentPlayer ] )
+    if event.kind == "turn":
+        players.add( ( game.currentPlayer - 1 ) % len( game.players ))
+    for i in range( len( game.players )):
+        if game.players[i].name == event.playerName:
+            players.add( i )
+
+    return ( piles, players )
+
+
+class Changes:
+    # What each of a game's events may have changed, for view(), along
+    # with what the event before it may have changed since.
+    def __init__( self ):
+        self.last = None
+
+    def update( self, game, event ):
+        ( last, self.last ) = ( self.last, touched( game, event ))
+        if last is None or self.last is None:
+            return None
+
+        return ( last[0] | self.last[0], last[1] | self.last[1] )
+
+
+# What the player at seat (None for a spectator) can see of game, only
+# the keys that changed may have, from Changes, if it's given
+def view( game, seat, changed = None ):
+    state = {"turn": game.numTurns,
+             "current": game.currentPlayer}
+
+    if changed is None:
+        changed = ( game.supply.decks, range( len( game.players )))
+    ( piles, players ) = changed
+
+    for cardName in piles:
+        if cardName in game.supply.decks:
+            state["supply/" + cardName] = len( game.supply.decks[cardName] )
+
+    for i in players:
+        player = game.players[i]
+        prefix = "p%d/" % i
+
+        if i == seat:
+            state[prefix + "hand"] = sorted( card.name for card in player.hand )
+            state[prefix + "coin"] = player.getCoin()
+        state[prefix + "handSize"] = len( player.hand )
+        state[prefix + "deck"] = len( player.deck )
+        state[prefix + "discard"] = len( player.discard )
+        state[prefix + "inPlay"] = [ card.name for card in player.inPlay ]
+        state[prefix + "actions"] = player.numActions
+        state[prefix + "buys"] = player.numBuys
+        state[prefix + "turns"] = player.numHands
+
+    return state
+
+
+# the keys of new that aren't the same in old
+def diff( old, new ):
+    changes = {}
+    for (key, value) in new.iteritems():
+        if old.get( key ) != value:
+            changes[key] = value
+
+    return changes
+
+
+class Feed:
+    # One viewer's stream of a table's states, seat as for view().
+    # state is what the viewer has been sent.
+    def __init__( self, seat ):
+        self.seat = seat
+        self.state = None
+        self.version = 0
+
+    # start again from a keyframe
+    def reset( self ):
+        self.state = None
+
+    # whether the next message has to be a keyframe, the whole view
+    def keyframeDue( self ):
+
+        return ( self.state is None or
+                 ( self.version + 1 ) % KEYFRAME_EVERY == 0 )
+
+    # The message taking the viewer to state, from view() (it may be
+    # shared with other viewers in the same seat), or None if there's
+    # nothing new.  state is the whole view if keyframeDue(), else the
+    # keys that may have changed.
+    def update( self, state ):
+        if self.keyframeDue():
+            self.state = dict( state )
+            self.version += 1
+            return {"type": "keyframe", "v": self.version,
+                    "protocol": PROTOCOL, "state": state}
+
+        changes = diff( self.state, state )
+        if not changes:
+            return None
+
+        self.state.update( changes )
+        self.version += 1
+
+        return {"type": "delta", "v": self.version, "set": changes}